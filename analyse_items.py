@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Run the item analysis over all stored results and write the summary file.
+
+Usage:
+    python analyse_items.py [--output data/item_analysis.json] [--chunk-size 50000]
+                            [--data-dir data] [--backend json|sql] [--database-url URL]
+
+Streams practice and mock results from storage (see item_analysis.py for
+the statistics) and replaces the summary that /admin/analytics/items serves.
+Run it from cron or after a batch of tests; requires NumPy.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+from repositories import create_repositories, STORAGE_BACKENDS
+from item_analysis import ITEM_ANALYSIS_CHUNK, run_item_analysis
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute per-question statistics from the result history.')
+    parser.add_argument('--output', help='summary file (default: <data-dir>/item_analysis.json)')
+    parser.add_argument('--chunk-size', type=int, default=ITEM_ANALYSIS_CHUNK, help='results per NumPy batch')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=os.environ.get('STORAGE_BACKEND', 'json'))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(os.path.join(args.data_dir, 'oet.db'))
+    repos = create_repositories(args.backend, args.data_dir, database_url)
+    output = args.output or os.path.join(args.data_dir, 'item_analysis.json')
+    started = time.perf_counter()
+    report = run_item_analysis(repos, output, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    for test in report['tests']:
+        print(f"{test['kind']} test {test['test_id']} ({test['title']}): {test['responses']} responses, "
+              f"mean {test['mean_score']}%, KR-20 {test['reliability_kr20']}")
+    print(f"analysed {report['results_scanned']} results in {elapsed:.2f}s -> {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
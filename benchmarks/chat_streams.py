@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Hold many /chat/stream connections open and time message delivery.
+
+Starts the app on a threaded development server against a scratch copy of
+data/, registers --users users and opens --streams Server-Sent-Events
+connections spread over them. Support replies are then sent to every user
+--messages times; each stream records how long each reply took to arrive.
+With --other-worker the replies are appended through a separate ChatStore,
+as another worker process would, so delivery goes through the notifier's
+polling instead of the in-process wakeup.
+
+    python benchmarks/chat_streams.py --users 50 --streams 200 --messages 5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import http.client
+import statistics
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(work_dir):
+    os.chdir(work_dir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import main
+    return main, main.create_app({'WARM_UP': False, 'WTF_CSRF_ENABLED': False})
+
+
+def login(port, email):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urlencode({'email': email, 'password': 'password'})
+    conn.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError(f'{email} could not log in')
+    return cookie.split(';', 1)[0]
+
+
+def stream(port, cookie, expected, latencies, ready, errors):
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.request('GET', '/chat/stream', headers={'Cookie': cookie, 'Accept': 'text/event-stream'})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'stream answered {response.status}')
+        ready.release()
+        received = 0
+        data = None
+        while received < expected:
+            line = response.fp.readline()
+            if not line:
+                raise RuntimeError(f'stream closed after {received} of {expected} messages')
+            line = line.decode('utf-8').rstrip('\n')
+            if line.startswith('data: '):
+                data = json.loads(line[6:])
+            elif not line and data is not None:
+                latencies.append(time.perf_counter() - float(data['message']))
+                received += 1
+                data = None
+        conn.close()
+    except Exception as exc:
+        errors.append(exc)
+        ready.release()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=5, help='replies sent to every user')
+    parser.add_argument('--other-worker', action='store_true', help='append replies through a separate ChatStore')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='oet-chat-')
+    shutil.copytree(os.path.join(ROOT, 'data'), os.path.join(work_dir, 'data'))
+    try:
+        app_module, app = load_app(work_dir)
+        from werkzeug.serving import make_server
+        from chat_store import ChatStore
+
+        client = app.test_client()
+        user_ids = []
+        for i in range(args.users):
+            email = f'chat{i}@example.com'
+            client.post('/register', data={'username': f'chat{i}', 'email': email,
+                                           'password': 'password', 'password2': 'password'})
+            user_ids.append(app_module.get_user_by_email(email).id)
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        port = server.server_port
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        cookies = [login(port, f'chat{i}@example.com') for i in range(args.users)]
+        latencies, errors = [], []
+        ready = threading.Semaphore(0)
+        threads = []
+        for i in range(args.streams):
+            thread = threading.Thread(target=stream, args=(port, cookies[i % args.users], args.messages,
+                                                           latencies, ready, errors), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for _ in threads:
+            ready.acquire()
+        time.sleep(0.5)  # let every stream reach its wait
+
+        if args.other_worker:
+            store = ChatStore(os.path.join('data', 'chat'))
+            send = store.append
+        else:
+            send = app_module.add_chat_message
+        started = time.perf_counter()
+        for _ in range(args.messages):
+            for user_id in user_ids:
+                send(user_id, {'message': repr(time.perf_counter()), 'timestamp': '', 'is_admin_reply': True})
+        sent = time.perf_counter() - started
+        for thread in threads:
+            thread.join(60)
+        server.shutdown()
+
+        delivered = len(latencies)
+        expected = args.streams * args.messages
+        print(f'{args.streams} streams over {args.users} users, {args.messages * args.users} replies sent in {sent:.2f}s')
+        print(f'delivered {delivered}/{expected}, errors: {len(errors)}')
+        if latencies:
+            latencies.sort()
+            print(f'latency ms: median {statistics.median(latencies) * 1000:.1f}, '
+                  f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}, max {latencies[-1] * 1000:.1f}')
+        for error in errors[:5]:
+            print(f'  {error!r}')
+        return 0 if delivered == expected and not errors else 1
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
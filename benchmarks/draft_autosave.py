@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Simulate many students autosaving drafts and count the storage writes.
+
+--students attempts each autosave every --every seconds (with jitter) for
+--duration seconds through a DraftBuffer over the JSON draft journal, from
+--threads request threads. Reports the autosaves accepted, batches and
+records written, put() latency and the journal size, and checks that the
+stored drafts hold each student's last answers.
+
+    python benchmarks/draft_autosave.py --students 5000 --every 3 --duration 20
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from repositories import JsonDraftRepository  # noqa: E402
+from draft_store import DraftBuffer  # noqa: E402
+
+
+class CountingRepository:
+    def __init__(self, repository):
+        self.repository = repository
+        self.batches = 0
+
+    def get(self, key):
+        return self.repository.get(key)
+
+    def save_many(self, updates):
+        self.batches += 1
+        self.repository.save_many(updates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--every', type=float, default=3.0, help='seconds between one student\'s autosaves')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--flush-interval', type=float, default=2.0)
+    parser.add_argument('--questions', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='oet-drafts-')
+    try:
+        path = os.path.join(work_dir, 'drafts.jsonl')
+        repository = CountingRepository(JsonDraftRepository(path))
+        buffer = DraftBuffer(repository, interval=args.flush_interval)
+        now = time.time()
+        for student in range(args.students):
+            buffer.put({'key': f'user-{student}-test-1', 'attempt': f'a{student}', 'user_id': student, 'test_id': 1,
+                        'answers': {}, 'revision': 0, 'started_at': now})
+        buffer.flush()
+
+        last = {}
+        latencies = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + args.duration
+
+        def student_loop(index):
+            rng = random.Random(index)
+            students = range(index, args.students, args.threads)
+            # Spread each thread's students over one autosave period.
+            due = {s: time.monotonic() + rng.random() * args.every for s in students}
+            revisions = dict.fromkeys(students, 0)
+            answers = {s: {} for s in students}
+            samples = []
+            while time.monotonic() < deadline:
+                student = min(due, key=due.get)
+                wait = due[student] - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                answers[student][f'question_{rng.randint(1, args.questions)}'] = str(rng.randrange(4))
+                revisions[student] += 1
+                started = time.perf_counter()
+                buffer.put({'key': f'user-{student}-test-1', 'attempt': f'a{student}', 'revision': revisions[student],
+                            'answers': dict(answers[student])})
+                samples.append(time.perf_counter() - started)
+                due[student] += args.every * (0.8 + rng.random() * 0.4)
+            with lock:
+                latencies.extend(samples)
+                for student in students:
+                    last[student] = answers[student]
+
+        threads = [threading.Thread(target=student_loop, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer.flush()
+
+        latencies.sort()
+        writes = buffer.writes - args.students
+        print(f'{len(latencies)} autosaves from {args.students} students in {args.duration:.0f}s '
+              f'({len(latencies) / args.duration:.0f}/s)')
+        print(f'{repository.batches - 1} batches, {writes} draft records written '
+              f'({len(latencies) / max(writes, 1):.1f} autosaves per record)')
+        print(f'put() p50 {latencies[len(latencies) // 2] * 1e6:.0f} us, '
+              f'p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} us')
+        print(f'journal {os.path.getsize(path) / 1e6:.1f} MB, {repository.repository.journal.compactions} compaction(s)')
+
+        fresh = JsonDraftRepository(path)
+        wrong = sum(1 for s, a in last.items() if a and fresh.get(f'user-{s}-test-1')['answers'] != a)
+        print('stored drafts match the last autosave' if not wrong else f'MISMATCH: {wrong} drafts')
+        return 1 if wrong else 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""Latency and throughput of the main user flows at several data scales.
+
+For each --scale a synthetic data/ directory is generated (once, cached
+under --cache-dir, see synthetic_data.py) and copied to a scratch directory;
+a fresh process imports the app there and --threads virtual users each run
+--iterations sessions through the Flask test client:
+
+    login -> dashboard -> take a test -> submit it -> view the result
+          -> vocabulary -> vocabulary test -> chat -> send a message -> logout
+
+Every request is timed and grouped by method and endpoint. The first
+--warmup sessions of each thread are not recorded. Results are printed and
+appended to --history (one JSON line per scale and run, tagged with the git
+commit), and ``--report`` prints p50/p95 per endpoint by commit and scale, so
+a regression shows up as a curve that bends upward between commits.
+
+    python benchmarks/endpoints.py --scale 1k --scale 100k --iterations 50
+    python benchmarks/endpoints.py --report
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import threading
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from synthetic_data import PASSWORD, email_for, ensure_dataset, parse_scale  # noqa: E402
+
+DEFAULT_CACHE_DIR = os.path.join(HERE, '.datasets')
+DEFAULT_HISTORY = os.path.join(HERE, 'results', 'endpoints.jsonl')
+VOCABULARY_WORDS = ['tachycardia', 'hypertension', 'dyspnoea', 'not-a-word']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples):
+    """{endpoint: stats} from {endpoint: [(milliseconds, status)]}."""
+    summary = {}
+    for name, timings in sorted(samples.items()):
+        latencies = sorted(ms for ms, _ in timings)
+        total = sum(latencies)
+        summary[name] = {
+            'count': len(latencies),
+            'errors': sum(1 for _, status in timings if status >= 400),
+            'mean_ms': round(total / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(latencies[-1], 3),
+            # Requests per second one thread sustains on this endpoint alone
+            'rps': round(len(latencies) / total * 1000, 1) if total else None,
+        }
+    return summary
+
+
+class Session:
+    """One virtual user's test client; records (ms, status) per endpoint."""
+
+    def __init__(self, app, samples, lock):
+        self.client = app.test_client()
+        self.adapter = app.url_map.bind('localhost')
+        self.samples = samples
+        self.lock = lock
+        self.recording = True
+
+    def request(self, method, path, **kwargs):
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        response.close()
+        if self.recording:
+            try:
+                endpoint = self.adapter.match(path.split('?', 1)[0], method=method)[0]
+            except Exception:
+                endpoint = path
+            with self.lock:
+                self.samples.setdefault(f'{method} {endpoint}', []).append((elapsed, response.status_code))
+        return response
+
+
+def run_flow(session, rng, users, tests, words):
+    user_id = rng.randint(1, users)
+    response = session.request('POST', '/login', data={'email': email_for(user_id), 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'user {user_id} could not log in ({response.status_code})')
+    session.request('GET', '/dashboard')
+    test_id = rng.choice(tests)
+    session.request('GET', f'/test/{test_id}')
+    answers = {f'question_{i}': str(rng.randrange(4)) for i in range(1, 11)}
+    response = session.request('POST', '/submit-test', data=answers)
+    location = response.headers.get('Location')
+    if response.status_code == 302 and location:
+        session.request('GET', location.replace('http://localhost', ''))
+    session.request('GET', '/vocabulary')
+    session.request('POST', '/vocabulary-test', json={'word': rng.choice(words)})
+    session.request('GET', '/chat')
+    session.request('POST', '/send_message', data={'message': f'benchmark message {rng.random()}'})
+    session.request('GET', '/logout')
+
+
+def run_scale(work_dir, counts, threads, iterations, warmup, seed):
+    """Import the app in work_dir and drive the flows; runs in a fresh interpreter (see --run-in)."""
+    import logging
+
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    import main
+    # PROPAGATE_EXCEPTIONS off: a failing endpoint counts as an error
+    app = main.create_app({'WARM_UP': False, 'WTF_CSRF_ENABLED': False, 'PROPAGATE_EXCEPTIONS': False})
+    logging.getLogger().setLevel(logging.CRITICAL)  # expected 4xx/5xx are counted, not logged
+    app.logger.setLevel(logging.CRITICAL)
+
+    tests = [t['id'] for t in main.get_practice_tests()]
+    samples, lock, failures = {}, threading.Lock(), []
+
+    def virtual_user(index):
+        rng = random.Random(seed * 1000 + index)
+        session = Session(app, samples, lock)
+        try:
+            for i in range(warmup + iterations):
+                session.recording = i >= warmup
+                run_flow(session, rng, counts['users'], tests, VOCABULARY_WORDS)
+        except Exception as exc:
+            failures.append(f'thread {index}: {exc!r}')
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=virtual_user, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - started
+    recorded = sum(len(v) for v in samples.values())
+    return {'endpoints': summarize(samples), 'requests': recorded, 'wall_seconds': round(wall, 3),
+            'failures': failures}
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('+dirty' if dirty else '')
+
+
+def print_run(record):
+    print(f"\nscale {record['scale']}: {record['counts']['users']} users, {record['counts']['results']} results; "
+          f"{record['requests']} requests in {record['wall_seconds']}s with {record['threads']} thread(s)")
+    print(f"{'endpoint':<32} {'count':>6} {'err':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'req/s':>8}")
+    for name, stats in record['endpoints'].items():
+        print(f"{name:<32} {stats['count']:>6} {stats['errors']:>5} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f} {stats['rps'] or 0:>8.1f}")
+    for failure in record['failures']:
+        print(f'FAIL: {failure}')
+
+
+def report(history, metric):
+    """Per endpoint, metric by commit (rows, oldest first) and scale (columns)."""
+    if not os.path.exists(history):
+        print(f'no results in {history} yet')
+        return
+    with open(history, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    commits, scales, values = [], set(), {}
+    for record in records:
+        if record['commit'] not in commits:
+            commits.append(record['commit'])
+        scales.add(record['scale'])
+        for name, stats in record['endpoints'].items():
+            # The latest run of a commit at a scale wins.
+            values.setdefault(name, {})[(record['commit'], record['scale'])] = stats[metric]
+    scales = sorted(scales)
+    for name in sorted(values):
+        print(f'\n{name} ({metric}, ms)')
+        print(f"{'commit':<16}" + ''.join(f'{scale:>12,}' for scale in scales))
+        for commit in commits:
+            row = [values[name].get((commit, scale)) for scale in scales]
+            if any(v is not None for v in row):
+                print(f'{commit:<16}' + ''.join(f'{v:>12.2f}' if v is not None else f"{'-':>12}" for v in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', action='append', dest='scales', help='1k, 100k, 1m or a result count (repeatable)')
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=30, help='recorded sessions per thread')
+    parser.add_argument('--warmup', type=int, default=3, help='unrecorded sessions per thread first')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='where generated datasets are kept')
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to --history')
+    parser.add_argument('--report', action='store_true', help='print the stored results by commit and scale')
+    parser.add_argument('--metric', default='p95_ms', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'rps'])
+    parser.add_argument('--run-in', help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_in:
+        result = run_scale(args.run_in, **json.loads(args.options))
+        with open(os.path.join(args.run_in, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    if args.report:
+        report(args.history, args.metric)
+        return 0
+
+    commit = git_revision()
+    failed = False
+    for scale_name in args.scales or ['1k']:
+        scale = parse_scale(scale_name)
+        started = time.perf_counter()
+        dataset, counts = ensure_dataset(args.cache_dir, scale, args.seed)
+        print(f'dataset {scale_name}: ready in {time.perf_counter() - started:.1f}s')
+        work_dir = tempfile.mkdtemp(prefix='oet-bench-')
+        try:
+            shutil.copytree(dataset, os.path.join(work_dir, 'data'), ignore=shutil.ignore_patterns('manifest.json'))
+            # A separate interpreter per scale: the app is imported fresh in its own data
+            # directory, and exits normally so the worker pools it started are shut down.
+            options = json.dumps({'counts': counts, 'threads': args.threads, 'iterations': args.iterations,
+                                  'warmup': args.warmup, 'seed': args.seed})
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-in', work_dir, '--options', options],
+                           check=True)
+            with open(os.path.join(work_dir, 'result.json'), encoding='utf-8') as f:
+                result = json.load(f)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        record = dict(result, commit=commit, scale=scale, counts=counts, threads=args.threads,
+                      iterations=args.iterations, python=sys.version.split()[0],
+                      recorded_at=datetime.now().isoformat(timespec='seconds'))
+        print_run(record)
+        failed = failed or bool(record['failures'])
+        if not args.no_save:
+            os.makedirs(os.path.dirname(args.history), exist_ok=True)
+            with open(args.history, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
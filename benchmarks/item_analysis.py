@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Time the item analysis over a large synthetic results file and report peak memory.
+
+Writes --results submissions for --tests Reading tests of --questions
+questions to a scratch test_results.json (streamed to disk, never held in
+memory), then runs item_analysis.analyse over them streamed back with
+results_store.iter_records.
+
+    python benchmarks/item_analysis.py --results 1000000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scoring import AnswerKey  # noqa: E402
+from results_store import iter_records  # noqa: E402
+from item_analysis import ITEM_ANALYSIS_CHUNK, analyse  # noqa: E402
+
+
+def write_results(path, count, tests, fields, options, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i in range(count):
+            ability = rng.random()
+            answers = {field: str(j % options) if rng.random() < ability else str(rng.randrange(options))
+                       for j, field in enumerate(fields) if rng.random() > 0.03}
+            record = {'id': i + 1, 'user_id': rng.randrange(10_000), 'test_id': rng.randrange(tests) + 1,
+                      'score_percentage': 0.0, 'time_taken_minutes': 30, 'answers': answers,
+                      'completed_at': '2025-01-01 10:00'}
+            f.write((',' if i else '') + json.dumps(record))
+        f.write(']')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--results', type=int, default=1_000_000)
+    parser.add_argument('--tests', type=int, default=4)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=ITEM_ANALYSIS_CHUNK)
+    args = parser.parse_args(argv)
+
+    fields = [f'question_{i + 1}' for i in range(args.questions)]
+    key = AnswerKey('Reading', fields, [str(i % args.options) for i in range(args.questions)],
+                    options=[args.options] * args.questions)
+    work_dir = tempfile.mkdtemp(prefix='oet-items-')
+    try:
+        path = os.path.join(work_dir, 'test_results.json')
+        started = time.perf_counter()
+        write_results(path, args.results, args.tests, fields, args.options)
+        print(f'wrote {args.results} results ({os.path.getsize(path) / 1e6:.0f} MB) in {time.perf_counter() - started:.1f}s')
+
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        summaries, scanned = analyse([('practice', iter_records(path))], lambda test_id: key, args.chunk_size)
+        elapsed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'analysed {scanned} results for {len(summaries)} tests in {elapsed:.1f}s '
+              f'({scanned / elapsed:,.0f} results/s)')
+        print(f'peak RSS {peak / 1024:.0f} MB (before analysis {baseline / 1024:.0f} MB)')
+        first = summaries[min(summaries)]
+        print(f"test {min(summaries)[1]}: mean {first['mean_score']}%, KR-20 {first['reliability_kr20']}, "
+              f"question 1 difficulty {first['items'][0]['difficulty']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
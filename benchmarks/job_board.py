@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Time job-board index builds, searches and page walks over synthetic listings.
+
+Writes --jobs listings to a scratch jobs.json, builds the JobBoard index
+and times --queries random searches (free text, filters, both) plus a walk
+through every page of the unfiltered board with cursors.
+
+    python benchmarks/job_board.py --jobs 50000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from repositories import JsonJobRepository  # noqa: E402
+from job_board import JobBoard  # noqa: E402
+
+ROLES = ['Registered Nurse', 'Staff Nurse', 'Clinical Nurse Specialist', 'Nurse Practitioner', 'Physiotherapist',
+         'Pharmacist', 'Resident Medical Officer', 'General Practitioner', 'Dentist', 'Occupational Therapist',
+         'Radiographer', 'Dietitian', 'Speech Pathologist', 'Midwife', 'Veterinarian']
+SPECIALTIES = ['Cardiology', 'Emergency', 'Oncology', 'Paediatrics', 'Aged Care', 'Mental Health', 'Surgery',
+               'Intensive Care', 'Orthopaedics', 'Community Health']
+LOCATIONS = ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide', 'Auckland', 'London', 'Dublin',
+             'Singapore', 'Dubai', 'Hobart', 'Darwin']
+JOB_TYPES = ['Full-time', 'Part-time', 'Contract', 'Casual']
+WORDS = ('patient care ward team shift rotation hospital clinic registration experience support '
+         'assessment acute rehabilitation community training supervision handover documentation '
+         'medication triage theatre outpatient residential discharge planning').split()
+
+
+def write_jobs(path, count, seed=0):
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(count):
+        specialty = rng.choice(SPECIALTIES)
+        jobs.append({
+            'id': i + 1,
+            'title': f'{rng.choice(ROLES)} - {specialty}',
+            'company': f'Health Service {rng.randrange(500)}',
+            'location': rng.choice(LOCATIONS),
+            'specialty': specialty,
+            'job_type': rng.choice(JOB_TYPES),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 120))),
+            'posted_date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'is_active': rng.random() > 0.05,
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(jobs, f)
+
+
+def timed(samples, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+    print(f'{label:<22} n={len(samples):<6} median {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50_000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=24)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    work_dir = tempfile.mkdtemp(prefix='oet-jobs-')
+    try:
+        path = os.path.join(work_dir, 'jobs.json')
+        write_jobs(path, args.jobs)
+        board = JobBoard(JsonJobRepository(path))
+        started = time.perf_counter()
+        board.facets()
+        print(f'indexed {args.jobs} listings ({os.path.getsize(path) / 1e6:.0f} MB) in {time.perf_counter() - started:.2f}s')
+
+        text, filtered, combined, pages = [], [], [], []
+        for _ in range(args.queries):
+            query = ' '.join(rng.sample(ROLES, 1)[0].split()[:rng.randint(1, 2)])
+            timed(text, board.search, query, limit=args.limit)
+            timed(filtered, board.search, None, {'location': rng.choice(LOCATIONS), 'job_type': rng.choice(JOB_TYPES)},
+                  limit=args.limit)
+            query, filters = f'{query} {rng.choice(WORDS)}', {'specialty': rng.choice(SPECIALTIES)}
+            listings, total, cursor = timed(combined, board.search, query, filters, limit=args.limit)
+            if cursor:
+                timed(combined, board.search, query, filters, cursor, limit=args.limit)
+        report('free-text search', text)
+        report('filters only', filtered)
+        report('search + filter', combined)
+
+        cursor, seen = None, 0
+        while True:
+            listings, total, cursor = timed(pages, board.search, cursor=cursor, limit=args.limit)
+            seen += len(listings)
+            if cursor is None:
+                break
+        assert seen == total, (seen, total)
+        report(f'page walk ({seen} jobs)', pages)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
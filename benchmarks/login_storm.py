@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""Sign-in throughput, and latency of other pages, while everyone logs in at once.
+
+Models one gunicorn gthread worker: requests are queued to --server-threads
+threads that run them through the Flask test client, so a request's latency
+includes the time it waits for a free thread. After a quiet phase with only
+the probe running, --storm-users clients sign in back to back for
+--duration seconds. Meanwhile a signed-in probe client loads the dashboard,
+vocabulary and jobs pages. Each --mode runs in a fresh interpreter:
+
+    inline   hash in the request thread (PASSWORD_WORKERS=0)
+    pool     the bounded process pool (--password-workers, --queue-depth)
+
+Reported per mode: successful sign-ins per second, 503s per second, sign-in
+p50/p99, and the probe's p50/p99 before and during the storm.
+
+    python benchmarks/login_storm.py --mode inline --mode pool --storm-users 32 --duration 20
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from synthetic_data import PASSWORD, email_for, ensure_dataset, parse_scale  # noqa: E402
+from endpoints import DEFAULT_CACHE_DIR, percentile  # noqa: E402
+
+PROBE_PATHS = ('/dashboard', '/vocabulary', '/jobs')
+PROBE_INTERVAL = 0.02
+
+
+def latency_stats(samples):
+    samples = sorted(samples)
+    return {'count': len(samples),
+            'p50_ms': round(percentile(samples, 0.50) * 1000, 2) if samples else None,
+            'p99_ms': round(percentile(samples, 0.99) * 1000, 2) if samples else None}
+
+
+def run_storm(work_dir, users, server_threads, storm_users, duration, quiet, seed):
+    """Runs in a fresh interpreter (see --run-in) with PASSWORD_* set for the mode."""
+    import logging
+
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)
+    import main
+    app = main.create_app({'WTF_CSRF_ENABLED': False, 'PROPAGATE_EXCEPTIONS': False})
+    server = ThreadPoolExecutor(max_workers=server_threads)
+
+    def call(client, method, path, **kwargs):
+        """Queue a request for a server thread; (seconds including the wait, status)."""
+        started = time.perf_counter()
+        response = server.submit(client.open, path, method=method, **kwargs).result()
+        response.close()
+        return time.perf_counter() - started, response.status_code
+
+    probe_client = app.test_client()
+    # Also starts the password pool, so the first storm requests do not pay for that.
+    elapsed, status = call(probe_client, 'POST', '/login', data={'email': email_for(1), 'password': PASSWORD})
+    if status != 302:
+        raise RuntimeError(f'probe user could not sign in ({status})')
+
+    stop = threading.Event()
+    storming = threading.Event()
+    probe = {'quiet': [], 'storm': []}
+    logins, rejected, errors = [], [0], [0]
+    lock = threading.Lock()
+
+    def probe_loop():
+        i = 0
+        while not stop.is_set():
+            elapsed, status = call(probe_client, 'GET', PROBE_PATHS[i % len(PROBE_PATHS)])
+            i += 1
+            with lock:
+                probe['storm' if storming.is_set() else 'quiet'].append(elapsed)
+                if status >= 500:
+                    errors[0] += 1
+            time.sleep(PROBE_INTERVAL)
+
+    def storm_loop(index):
+        rng = random.Random(seed * 1000 + index)
+        client = app.test_client()
+        while not stop.is_set():
+            data = {'email': email_for(rng.randint(1, users)), 'password': PASSWORD}
+            elapsed, status = call(client, 'POST', '/login', data=data)
+            with lock:
+                if status == 302:
+                    logins.append(elapsed)
+                elif status == 503:
+                    rejected[0] += 1
+                else:
+                    errors[0] += 1
+            if status == 302:
+                call(client, 'GET', '/logout')
+            else:
+                time.sleep(0.05)  # a browser user would not retry instantly
+
+    prober = threading.Thread(target=probe_loop)
+    prober.start()
+    time.sleep(quiet)
+    storming.set()
+    started = time.perf_counter()
+    stormers = [threading.Thread(target=storm_loop, args=(i,)) for i in range(storm_users)]
+    for stormer in stormers:
+        stormer.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in stormers + [prober]:
+        thread.join()
+    wall = time.perf_counter() - started
+    server.shutdown()
+    return {'logins_per_second': round(len(logins) / wall, 2), 'rejected_per_second': round(rejected[0] / wall, 2),
+            'errors': errors[0], 'login': latency_stats(logins),
+            'probe_quiet': latency_stats(probe['quiet']), 'probe_storm': latency_stats(probe['storm'])}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', action='append', dest='modes', choices=['inline', 'pool'])
+    parser.add_argument('--scale', default='1k', help='synthetic dataset (see synthetic_data.py)')
+    parser.add_argument('--server-threads', type=int, default=8)
+    parser.add_argument('--storm-users', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of storm')
+    parser.add_argument('--quiet', type=float, default=3.0, help='seconds of probing before the storm')
+    parser.add_argument('--password-workers', type=int, default=2)
+    parser.add_argument('--queue-depth', type=int, default=None, help='default: PASSWORD_QUEUE_DEPTH default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--run-in', help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_in:
+        result = run_storm(args.run_in, **json.loads(args.options))
+        with open(os.path.join(args.run_in, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    dataset, counts = ensure_dataset(args.cache_dir, parse_scale(args.scale), args.seed)
+    print(f"{counts['users']} users, {args.server_threads} server threads, {args.storm_users} clients signing in "
+          f"for {args.duration:.0f}s")
+    print(f"{'mode':<8} {'logins/s':>9} {'503/s':>7} {'login p50':>10} {'login p99':>10} "
+          f"{'other p50':>10} {'other p99':>10} {'quiet p99':>10}")
+    for mode in args.modes or ['inline', 'pool']:
+        env = dict(os.environ, PASSWORD_WORKERS='0' if mode == 'inline' else str(args.password_workers))
+        if args.queue_depth is not None:
+            env['PASSWORD_QUEUE_DEPTH'] = str(args.queue_depth)
+        work_dir = tempfile.mkdtemp(prefix='oet-storm-')
+        try:
+            shutil.copytree(dataset, os.path.join(work_dir, 'data'), ignore=shutil.ignore_patterns('manifest.json'))
+            options = json.dumps({'users': counts['users'], 'server_threads': args.server_threads,
+                                  'storm_users': args.storm_users, 'duration': args.duration, 'quiet': args.quiet,
+                                  'seed': args.seed})
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-in', work_dir, '--options', options],
+                           env=env, check=True)
+            with open(os.path.join(work_dir, 'result.json'), encoding='utf-8') as f:
+                r = json.load(f)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        print(f"{mode:<8} {r['logins_per_second']:>9.2f} {r['rejected_per_second']:>7.2f} "
+              f"{r['login']['p50_ms'] or 0:>10.1f} {r['login']['p99_ms'] or 0:>10.1f} "
+              f"{r['probe_storm']['p50_ms'] or 0:>10.1f} {r['probe_storm']['p99_ms'] or 0:>10.1f} "
+              f"{r['probe_quiet']['p99_ms'] or 0:>10.1f}" + (f"   {r['errors']} errors" if r['errors'] else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
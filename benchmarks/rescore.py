@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Time bulk re-scoring of synthetic results against a compiled answer key.
+
+Generates --results random submissions for a --questions question
+multiple-choice key, then scores them with scoring.rescore (NumPy) and, with
+--compare, with the per-result AnswerKey.score loop as well.
+
+    python benchmarks/rescore.py --results 1000000 --compare
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scoring import AnswerKey, rescore  # noqa: E402
+
+
+def synthetic_results(count, fields, options, seed=0):
+    rng = random.Random(seed)
+    return [
+        {'id': i + 1, 'answers': {f: str(rng.randrange(options)) for f in fields if rng.random() > 0.05}}
+        for i in range(count)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--results', type=int, default=1_000_000)
+    parser.add_argument('--questions', type=int, default=10)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--compare', action='store_true', help='also time the per-result Python loop')
+    args = parser.parse_args(argv)
+
+    fields = [f'question_{i + 1}' for i in range(args.questions)]
+    key = AnswerKey('Reading', fields, [str(i % args.options) for i in range(args.questions)])
+    started = time.perf_counter()
+    results = synthetic_results(args.results, fields, args.options)
+    print(f'generated {len(results)} results in {time.perf_counter() - started:.2f}s')
+
+    started = time.perf_counter()
+    scores = rescore(results, key)
+    print(f'numpy rescore: {time.perf_counter() - started:.2f}s')
+
+    if args.compare:
+        started = time.perf_counter()
+        loop_scores = {r['id']: key.score(r['answers']) for r in results}
+        print(f'python loop:   {time.perf_counter() - started:.2f}s')
+        mismatches = sum(1 for k, v in loop_scores.items() if scores[k] != v)
+        print(f'mismatches: {mismatches}')
+        if mismatches:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Check app start-up time and per-worker memory against a budget.
+
+Each run starts a fresh interpreter in a scratch copy of data/ that times
+``import main`` and ``main.create_app(--profile)``, then forks --workers
+processes the way ``gunicorn --preload`` does. Each worker serves a few
+public pages and reports its resident set size (RSS) and the part of it not
+shared with the master (private memory). Exits 1 if the median import time,
+the median import + create_app time or the largest worker RSS goes over
+budget, or if a module that should load lazily (ReportLab, NumPy,
+SQLAlchemy) was imported during start-up.
+
+    python benchmarks/startup.py --runs 5 --max-import-seconds 1.0 --max-worker-rss-mb 120
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ('reportlab', 'numpy', 'sqlalchemy')
+WARM_PATHS = ('/', '/login', '/register', '/mock-tests', '/jobs', '/materials', '/consultation')
+
+
+def memory_mb():
+    """(rss, private) of this process in MB; private is None where /proc is unavailable."""
+    try:
+        fields = {}
+        with open('/proc/self/smaps_rollup', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(':')] = int(parts[1])  # kB
+        return fields['Rss'] / 1024, (fields['Private_Clean'] + fields['Private_Dirty']) / 1024
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return (peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024), None
+
+
+def run_once(work_dir, profile, workers):
+    """Runs in a fresh interpreter (see --run-in): time start-up, then fork workers."""
+    import logging
+
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    app = main.create_app(profile)
+    created = time.perf_counter()
+    master_rss, _ = memory_mb()
+    result = {'import_seconds': imported - started, 'create_app_seconds': created - imported,
+              'master_rss_mb': master_rss, 'lazy_modules_loaded': [m for m in LAZY_MODULES if m in sys.modules],
+              'workers': []}
+
+    children = []
+    for index in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 0
+            try:
+                client = app.test_client()
+                codes = [client.get(path).status_code for path in WARM_PATHS]
+                rss, private = memory_mb()
+                report = {'rss_mb': rss, 'private_mb': private, 'errors': sum(1 for c in codes if c >= 500)}
+                os.write(write_fd, json.dumps(report).encode())
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+    for pid, read_fd in children:
+        with os.fdopen(read_fd, 'rb') as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        result['workers'].append(json.loads(data) if data else {'rss_mb': None, 'private_mb': None, 'errors': 1})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to start (medians are reported)')
+    parser.add_argument('--workers', type=int, default=2, help='workers forked per run')
+    parser.add_argument('--profile', default='production')
+    parser.add_argument('--data', default=os.path.join(ROOT, 'data'), help='data/ directory to copy')
+    parser.add_argument('--max-import-seconds', type=float, default=1.0)
+    parser.add_argument('--max-startup-seconds', type=float, default=3.0, help='import plus create_app')
+    parser.add_argument('--max-worker-rss-mb', type=float, default=150.0)
+    parser.add_argument('--run-in', help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_in:
+        result = run_once(args.run_in, **json.loads(args.options))
+        with open(os.path.join(args.run_in, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    if not hasattr(os, 'fork'):
+        parser.error('forking workers needs a POSIX system')
+    runs = []
+    for _ in range(args.runs):
+        work_dir = tempfile.mkdtemp(prefix='oet-startup-')
+        try:
+            shutil.copytree(args.data, os.path.join(work_dir, 'data'))
+            options = json.dumps({'profile': args.profile, 'workers': args.workers})
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-in', work_dir, '--options', options],
+                           check=True)
+            with open(os.path.join(work_dir, 'result.json'), encoding='utf-8') as f:
+                runs.append(json.load(f))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    import_seconds = statistics.median(r['import_seconds'] for r in runs)
+    startup_seconds = statistics.median(r['import_seconds'] + r['create_app_seconds'] for r in runs)
+    workers = [w for r in runs for w in r['workers']]
+    worker_rss = max((w['rss_mb'] or 0) for w in workers)
+    private = [w['private_mb'] for w in workers if w['private_mb'] is not None]
+    lazy_loaded = sorted({m for r in runs for m in r['lazy_modules_loaded']})
+
+    print(f'profile {args.profile}, {args.runs} run(s), {args.workers} worker(s) each')
+    print(f'import main          {import_seconds * 1000:8.1f} ms   (budget {args.max_import_seconds * 1000:.0f} ms)')
+    print(f'import + create_app  {startup_seconds * 1000:8.1f} ms   (budget {args.max_startup_seconds * 1000:.0f} ms)')
+    print(f"master RSS           {statistics.median(r['master_rss_mb'] for r in runs):8.1f} MB")
+    print(f'worker RSS (max)     {worker_rss:8.1f} MB   (budget {args.max_worker_rss_mb:.0f} MB)')
+    if private:
+        print(f'worker private (max) {max(private):8.1f} MB   (not shared with the master)')
+
+    problems = []
+    if import_seconds > args.max_import_seconds:
+        problems.append(f'import took {import_seconds:.3f}s')
+    if startup_seconds > args.max_startup_seconds:
+        problems.append(f'start-up took {startup_seconds:.3f}s')
+    if worker_rss > args.max_worker_rss_mb:
+        problems.append(f'a worker used {worker_rss:.1f} MB')
+    if lazy_loaded:
+        problems.append(f'imported at start-up: {", ".join(lazy_loaded)}')
+    if any(w['errors'] for w in workers):
+        problems.append('a worker failed to serve the warm-up pages')
+    for problem in problems:
+        print(f'OVER BUDGET: {problem}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Hammer /submit-test and /send_message from many processes at once.
+
+Each process imports the app separately (like an un-preloaded gunicorn
+worker), registers its own user and then alternates test submissions and chat
+messages against a scratch copy of data/. Afterwards the stored data is
+checked: every submission and message must be present exactly once and all
+ids must be unique.
+
+    python benchmarks/stress_writes.py --processes 8 --iterations 50
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(work_dir):
+    os.chdir(work_dir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import main
+    return main, main.create_app({'WARM_UP': False, 'WTF_CSRF_ENABLED': False})
+
+
+def worker(work_dir, index, iterations, test_id):
+    main, app = load_app(work_dir)
+    client = app.test_client()
+    email = f'stress{index}@example.com'
+    client.post('/register', data={'username': f'stress{index}', 'email': email, 'password': 'password', 'password2': 'password'})
+    response = client.post('/login', data={'email': email, 'password': 'password'})
+    if response.status_code != 302:
+        raise RuntimeError(f'worker {index} could not log in')
+    for i in range(iterations):
+        client.get(f'/test/{test_id}')
+        response = client.post('/submit-test', data={'question_1': f'{index}:{i}'})
+        if response.status_code != 302:
+            raise RuntimeError(f'worker {index} submit {i} failed with {response.status_code}')
+        response = client.post('/send_message', data={'message': f'{index}:{i}'})
+        if response.status_code != 302:
+            raise RuntimeError(f'worker {index} message {i} failed with {response.status_code}')
+
+
+def verify(main, processes, iterations):
+    problems = []
+    expected = {f'{p}:{i}' for p in range(processes) for i in range(iterations)}
+
+    results = main.get_test_results()
+    ids = Counter(r['id'] for r in results)
+    duplicated = [i for i, n in ids.items() if n > 1]
+    if duplicated:
+        problems.append(f'duplicated result ids: {duplicated[:10]}')
+    submitted = Counter(r['answers'].get('question_1') for r in results)
+    missing = expected - set(submitted)
+    if missing:
+        problems.append(f'{len(missing)} lost submissions, e.g. {sorted(missing)[:5]}')
+    doubled = [k for k, n in submitted.items() if n > 1 and k in expected]
+    if doubled:
+        problems.append(f'{len(doubled)} submissions stored twice')
+
+    users = {u['email']: u for u in main.get_users()}
+    user_ids = Counter(u['id'] for u in users.values())
+    if any(n > 1 for n in user_ids.values()):
+        problems.append('duplicated user ids')
+    messages = set()
+    for p in range(processes):
+        user = users.get(f'stress{p}@example.com')
+        if user is None:
+            problems.append(f'user stress{p} missing')
+            continue
+        messages.update(m['message'] for m in main.get_chat_messages(user['id']))
+    missing = expected - messages
+    if missing:
+        problems.append(f'{len(missing)} lost chat messages, e.g. {sorted(missing)[:5]}')
+    return len(results), problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch data directory')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='oet-stress-')
+    shutil.copytree(os.path.join(ROOT, 'data'), os.path.join(work_dir, 'data'),
+                    ignore=shutil.ignore_patterns('.catalog', '*.journal*', '*.lock', '*.seq', '*.db'))
+    # Compact often so compaction races with appends during the run.
+    os.environ.setdefault('RESULTS_COMPACT_THRESHOLD', '25')
+    os.environ.setdefault('RESULTS_COMPACT_INTERVAL', '0.5')
+    # Hash inline: a password pool per writer process only slows the logins down.
+    os.environ.setdefault('PASSWORD_WORKERS', '0')
+    try:
+        app_module, _ = load_app(work_dir)
+        tests = app_module.get_practice_tests()
+        test_id = next((t['id'] for t in tests if t.get('section') == 'Writing'), tests[0]['id'])
+        ctx = multiprocessing.get_context('spawn')
+        procs = [ctx.Process(target=worker, args=(work_dir, p, args.iterations, test_id)) for p in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        failed = [p.exitcode for p in procs if p.exitcode != 0]
+
+        count, problems = verify(app_module, args.processes, args.iterations)
+        if failed:
+            problems.append(f'{len(failed)} worker processes exited with errors')
+        print(f'{args.processes} processes x {args.iterations} iterations: {count} results stored')
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        if not problems:
+            print('OK: no lost or duplicated records')
+        return 1 if problems else 0
+    finally:
+        if args.keep:
+            print(f'data kept in {work_dir}')
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
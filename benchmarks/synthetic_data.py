@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+"""Deterministic synthetic data/ directories for benchmarks.
+
+A scale is the number of stored test results; everything else is derived
+from it so that datasets of different sizes have the same shape:
+
+    scale        users   results   mock results   chat conversations
+    1k              50     1,000            100                   10
+    100k         5,000   100,000         10,000                1,000
+    1m          50,000 1,000,000        100,000               10,000
+
+Every user's password is ``password`` (all accounts share one real hash, so
+logins cost what they cost in production) and their email is
+``user<id>@example.com``. Test content, vocabulary and jobs are copied from
+the repository's data/ directory; results, vocabulary progress and chat are
+generated from a seeded RNG and streamed to disk, so the same scale and seed
+always produce the same files.
+
+    python benchmarks/synthetic_data.py --scale 100k --out /tmp/oet-100k
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DATA = os.path.join(ROOT, 'data')
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+RESULTS_PER_USER = 20
+PASSWORD = 'password'
+COPIED_FILES = ('oet_tests.json', 'vocabulary.json', 'jobs.json')
+START = datetime(2025, 1, 1)
+SPAN_DAYS = 180
+
+
+def parse_scale(value):
+    """A scale name (1k, 100k, 1m) or a plain result count."""
+    if value.lower() in SCALES:
+        return SCALES[value.lower()]
+    return int(value)
+
+
+def email_for(user_id):
+    return f'user{user_id}@example.com'
+
+
+def user_count(results):
+    return max(results // RESULTS_PER_USER, 10)
+
+
+def _write_array(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, record in enumerate(records):
+            f.write((',' if i else '') + json.dumps(record))
+        f.write(']')
+
+
+def _users(count, password_hash):
+    for user_id in range(1, count + 1):
+        yield {'id': user_id, 'username': f'user{user_id}', 'email': email_for(user_id),
+               'password_hash': password_hash, 'subscription_type': None, 'subscription_expires': None,
+               'created_at': (START - timedelta(days=user_id % 365)).isoformat()}
+
+
+def _results(rng, count, users, tests):
+    """count results in ascending id and time order, spread over SPAN_DAYS."""
+    step = SPAN_DAYS * 86400 / max(count, 1)
+    for i in range(count):
+        test = tests[rng.randrange(len(tests))]
+        answers = {field: str(rng.randrange(4)) for field in test['fields'] if rng.random() > 0.05}
+        yield {'id': i + 1, 'user_id': rng.randint(1, users), 'test_id': test['id'],
+               'score_percentage': round(rng.random() * 100, 1), 'time_taken_minutes': rng.randint(5, 60),
+               'answers': answers, 'completed_at': (START + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M')}
+
+
+def _test_fields(test):
+    """The answer fields a submission of test carries."""
+    from scoring import compile_answer_key
+
+    key = compile_answer_key(test)
+    if key is not None and key.fields:
+        return list(key.fields)
+    return [f'question_{i}' for i in range(1, 11)]
+
+
+def generate(out_dir, results, seed=0, source_dir=SOURCE_DATA):
+    """Write a data/ directory for results stored results into out_dir; returns its counts."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from werkzeug.security import generate_password_hash
+
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for name in COPIED_FILES:
+        shutil.copyfile(os.path.join(source_dir, name), os.path.join(out_dir, name))
+    with open(os.path.join(source_dir, 'oet_tests.json'), encoding='utf-8') as f:
+        catalog = json.load(f)
+    practice = [{'id': t['id'], 'fields': _test_fields(t)} for t in catalog if not t.get('is_mock_test')]
+    mock = [{'id': t['id'], 'fields': _test_fields(t)} for t in catalog if t.get('is_mock_test')] or practice
+    with open(os.path.join(source_dir, 'vocabulary.json'), encoding='utf-8') as f:
+        word_ids = [w['id'] for w in json.load(f) if 'id' in w]
+
+    users = user_count(results)
+    _write_array(os.path.join(out_dir, 'users.json'), _users(users, generate_password_hash(PASSWORD)))
+    _write_array(os.path.join(out_dir, 'test_results.json'), _results(rng, results, users, practice))
+    mock_results = results // 10
+    _write_array(os.path.join(out_dir, 'mocktests_results.json'), _results(rng, mock_results, users, mock))
+
+    with open(os.path.join(out_dir, 'vocabulary_progress.json'), 'w', encoding='utf-8') as f:
+        f.write('{')
+        for user_id in range(1, users + 1):
+            learned = sorted(rng.sample(word_ids, rng.randint(0, min(len(word_ids), 30))))
+            f.write((',' if user_id > 1 else '') + f'"{user_id}": ' + json.dumps({'learned_words': learned}))
+        f.write('}')
+
+    conversations = max(users // 5, 1)
+    chat_dir = os.path.join(out_dir, 'chat')
+    os.makedirs(chat_dir, exist_ok=True)
+    messages = 0
+    for user_id in range(1, conversations + 1):
+        with open(os.path.join(chat_dir, f'{user_id}.jsonl'), 'w', encoding='utf-8') as f:
+            for i in range(1, rng.randint(2, 20) + 1):
+                message = {'message': f'Synthetic message {i}', 'is_admin_reply': i % 2 == 0,
+                           'timestamp': (START + timedelta(minutes=user_id * 7 + i)).isoformat(sep=' '), 'id': i}
+                f.write(json.dumps(message) + '\n')
+                messages += 1
+    with open(os.path.join(out_dir, 'chat_messages.json'), 'w', encoding='utf-8') as f:
+        f.write('{}')
+
+    return {'users': users, 'results': results, 'mock_results': mock_results,
+            'chat_conversations': conversations, 'chat_messages': messages, 'seed': seed}
+
+
+def ensure_dataset(cache_dir, results, seed=0):
+    """The data/ directory for (results, seed) under cache_dir, generated on first use."""
+    path = os.path.join(cache_dir, f'{results}-{seed}')
+    manifest = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest):
+        shutil.rmtree(path, ignore_errors=True)
+        counts = generate(path, results, seed)
+        with open(manifest, 'w', encoding='utf-8') as f:
+            json.dump(counts, f)
+    with open(manifest, encoding='utf-8') as f:
+        return path, json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='1k', help='1k, 100k, 1m or a number of results')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True, help='directory to write (becomes a data/ directory)')
+    args = parser.parse_args(argv)
+    counts = generate(args.out, parse_scale(args.scale), args.seed)
+    print(', '.join(f'{value} {name}' for name, value in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""Per-worker memory with the read-mostly data parsed per worker vs. mapped from shared snapshots.
+
+Builds a scratch data/ directory with --tests tests (copies of the
+repository's tests), --words vocabulary entries and --jobs listings. For
+each --mode it then starts a fresh interpreter that creates the app (with
+warm-up, as ``gunicorn --preload`` does, unless --no-preload) and forks
+--workers workers:
+
+    parsed     DATA_SNAPSHOTS=0: every worker holds decoded records
+    snapshot   the records stay in mmap'ed data/.catalog/*.snap files
+
+Each worker signs in and reads every test, every vocabulary page of every
+specialty and the job board (plain, filtered and searched). Once all of
+them are done, each reports its resident set (RSS), proportional set (PSS:
+shared pages divided among the processes mapping them) and private memory.
+
+    python benchmarks/worker_memory.py --workers 4 --words 20000 --jobs 20000 --tests 600
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from synthetic_data import PASSWORD, email_for, ensure_dataset  # noqa: E402
+from endpoints import DEFAULT_CACHE_DIR  # noqa: E402
+
+SPECIALTIES = ['Cardiology', 'Emergency', 'Oncology', 'Paediatrics', 'Aged Care', 'Mental Health', 'Surgery',
+               'Respiratory', 'Renal', 'Neurology', 'Endocrinology', 'Pharmacology']
+LOCATIONS = ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide', 'Auckland', 'London', 'Dublin']
+JOB_TYPES = ['Full-time', 'Part-time', 'Contract', 'Casual']
+WORDS = ('patient care ward team shift rotation hospital clinic registration experience support assessment '
+         'acute rehabilitation community training supervision handover documentation medication triage theatre '
+         'outpatient residential discharge planning chronic symptom diagnosis dosage infection chest pain').split()
+SEARCHES = ['nurse', 'acute care', 'community rehabilitation', 'theatre']
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def write_content(data_dir, tests, words, jobs, seed=0):
+    """Replace the dataset's tests, vocabulary and jobs with ones of the requested sizes."""
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, 'data', 'oet_tests.json'), encoding='utf-8') as f:
+        templates = json.load(f)
+    with open(os.path.join(data_dir, 'oet_tests.json'), 'w', encoding='utf-8') as f:
+        json.dump([dict(templates[i % len(templates)], id=i + 1) for i in range(tests)], f)
+    vocabulary = [{'id': i + 1, 'word': f'{rng.choice(WORDS)}{i}', 'specialty': rng.choice(SPECIALTIES),
+                   'definition': sentence(rng, 8, 20), 'example': sentence(rng, 10, 25),
+                   'pronunciation': f'/{rng.choice(WORDS)}/'} for i in range(words)]
+    with open(os.path.join(data_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocabulary, f)
+    listings = [{'id': i + 1, 'title': f'{rng.choice(["Registered Nurse", "Physiotherapist", "Pharmacist"])} - '
+                                      f'{rng.choice(SPECIALTIES)}',
+                 'company': f'Health Service {rng.randrange(500)}', 'location': rng.choice(LOCATIONS),
+                 'specialty': rng.choice(SPECIALTIES), 'job_type': rng.choice(JOB_TYPES),
+                 'description': sentence(rng, 30, 120),
+                 'posted_date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                 'is_active': rng.random() > 0.05} for i in range(jobs)]
+    with open(os.path.join(data_dir, 'jobs.json'), 'w', encoding='utf-8') as f:
+        json.dump(listings, f)
+
+
+def memory_mb():
+    """{'rss', 'pss', 'private'} of this process in MB, from /proc/self/smaps_rollup."""
+    fields = {}
+    with open('/proc/self/smaps_rollup', encoding='ascii') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])  # kB
+    return {'rss': fields['Rss'] / 1024, 'pss': fields['Pss'] / 1024,
+            'private': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024}
+
+
+def exercise(app, main):
+    """Read every test, vocabulary page and a spread of job board pages; the number of 5xx responses."""
+    client = app.test_client()
+    errors = 0
+
+    def get(path, **kwargs):
+        nonlocal errors
+        response = client.get(path, **kwargs)
+        errors += response.status_code >= 500
+        return response
+
+    client.post('/login', data={'email': email_for(1), 'password': PASSWORD})
+    get('/practice-tests')
+    get('/mock-tests')
+    for test in list(main.repos.tests.all()):
+        get(f"/test/{test['id']}")
+    for specialty in [None] + [name for name, _ in main.vocabulary_index.facets()]:
+        after = None
+        while True:
+            query = {'limit': 100, 'specialty': specialty or '', 'after': after or ''}
+            page = get('/api/vocabulary', query_string=query).get_json() or {}
+            after = page.get('next_after')
+            if not after:
+                break
+    for prefix in ('pa', 'me', 'tr', 'ch'):
+        get('/vocabulary/autocomplete', query_string={'q': prefix})
+    for location in [None] + LOCATIONS:
+        cursor = None
+        for _ in range(20):
+            page = get('/api/jobs', query_string={'location': location or '', 'cursor': cursor or ''}).get_json() or {}
+            cursor = page.get('next_cursor')
+            if not cursor:
+                break
+    for query in SEARCHES:
+        get('/jobs', query_string={'q': query})
+    return errors
+
+
+def run_workers(work_dir, workers, preload):
+    """Runs in a fresh interpreter (see --run-in): create the app, fork workers, measure them."""
+    import logging
+
+    os.chdir(work_dir)
+    sys.path.insert(0, ROOT)
+    logging.disable(logging.WARNING)
+    import main
+    app = main.create_app({'WARM_UP': preload, 'WTF_CSRF_ENABLED': False, 'PROPAGATE_EXCEPTIONS': False})
+    master = memory_mb()
+
+    children = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        go_r, go_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            os.close(go_w)
+            status = 0
+            try:
+                errors = exercise(app, main)
+                os.write(ready_w, b'r')
+                os.read(go_r, 1)  # measure only once every worker has loaded everything
+                os.write(ready_w, json.dumps(dict(memory_mb(), errors=errors)).encode())
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        os.close(ready_w)
+        os.close(go_r)
+        children.append((pid, ready_r, go_w))
+    for _, ready_r, _ in children:
+        os.read(ready_r, 1)
+    for _, _, go_w in children:
+        os.write(go_w, b'g')
+        os.close(go_w)
+    reports = []
+    for pid, ready_r, _ in children:
+        with os.fdopen(ready_r, 'rb') as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        reports.append(json.loads(data) if data else None)
+    snapshots = sorted(os.listdir(os.path.join('data', '.catalog'))) if os.path.isdir('data/.catalog') else []
+    snapshot_mb = sum(os.path.getsize(os.path.join('data', '.catalog', name)) for name in snapshots
+                      if name.endswith('.snap')) / 1024 / 1024
+    return {'master': master, 'workers': reports, 'snapshot_mb': snapshot_mb}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', action='append', dest='modes', choices=['parsed', 'snapshot'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--tests', type=int, default=600)
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help='each worker loads the data itself instead of inheriting it from the master')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--run-in', help=argparse.SUPPRESS)
+    parser.add_argument('--options', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_in:
+        result = run_workers(args.run_in, **json.loads(args.options))
+        with open(os.path.join(args.run_in, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        parser.error('needs Linux (/proc/self/smaps_rollup)')
+    dataset, _ = ensure_dataset(args.cache_dir, 1000, args.seed)
+    print(f'{args.tests} tests, {args.words} words, {args.jobs} jobs; {args.workers} workers, '
+          f'{"preloaded" if args.preload else "no preload"}')
+    print(f"{'mode':<9} {'master RSS':>10} {'worker RSS':>10} {'worker PSS':>10} {'private':>8} "
+          f"{'total PSS':>10} {'snapshots':>10}")
+    failed = False
+    for mode in args.modes or ['parsed', 'snapshot']:
+        env = dict(os.environ, DATA_SNAPSHOTS='0' if mode == 'parsed' else '1', PASSWORD_WORKERS='0')
+        work_dir = tempfile.mkdtemp(prefix='oet-memory-')
+        try:
+            data_dir = os.path.join(work_dir, 'data')
+            shutil.copytree(dataset, data_dir, ignore=shutil.ignore_patterns('manifest.json'))
+            write_content(data_dir, args.tests, args.words, args.jobs, args.seed)
+            options = json.dumps({'workers': args.workers, 'preload': args.preload})
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run-in', work_dir, '--options', options],
+                           env=env, check=True)
+            with open(os.path.join(work_dir, 'result.json'), encoding='utf-8') as f:
+                r = json.load(f)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        workers = [w for w in r['workers'] if w]
+        if len(workers) < args.workers or any(w['errors'] for w in workers):
+            failed = True
+        median = lambda key: statistics.median(w[key] for w in workers) if workers else 0.0  # noqa: E731
+        total_pss = sum(w['pss'] for w in workers)
+        print(f"{mode:<9} {r['master']['rss']:>8.1f}MB {median('rss'):>8.1f}MB {median('pss'):>8.1f}MB "
+              f"{median('private'):>6.1f}MB {total_pss:>8.1f}MB {r['snapshot_mb']:>8.1f}MB")
+    if failed:
+        print('some workers failed or answered 5xx')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
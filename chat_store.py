@@ -0,0 +1,292 @@
+"""Append-only chat logs, one per conversation, and live delivery.
+
+Each user's conversation with support is a JSON-lines file
+``data/chat/<user_id>.jsonl``. Sending a message appends one line under the
+conversation's lock, so it never touches any other conversation. Message ids
+come from the conversation's ``IdSequence`` (``<user_id>.jsonl.seq``), so they
+keep increasing even after the log is rewritten with fewer messages. Every
+open log keeps the byte offset and id of each complete line and extends that
+index incrementally, so the latest N messages, or the N before a given id,
+are one seek and one read.
+
+Conversations that only exist in the old ``chat_messages.json`` are copied
+into their own log the first time they are opened.
+
+``ChatNotifier`` wakes Server-Sent-Events streams when their conversation
+grows. Appends in the same process notify at once. One watcher thread per
+process checks the conversations that have open streams every
+``CHAT_POLL_INTERVAL`` seconds, which picks up messages written by other
+workers.
+"""
+
+import os
+import json
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+from storage import read_json_file, file_lock, freeze, FrozenList, IdSequence
+
+logger = logging.getLogger(__name__)
+
+CHAT_LOG_CACHE_SIZE = int(os.environ.get('CHAT_LOG_CACHE_SIZE', 256))
+CHAT_POLL_INTERVAL = float(os.environ.get('CHAT_POLL_INTERVAL', 0.5))
+
+# Messages are written with the id first, so indexing a line rarely needs a full parse.
+_ID_PREFIX = b'{"id": '
+
+
+def _line_id(line):
+    if line.startswith(_ID_PREFIX):
+        end = line.find(b',', len(_ID_PREFIX))
+        try:
+            return int(line[len(_ID_PREFIX):end])
+        except ValueError:
+            pass
+    return json.loads(line)['id']
+
+
+def _with_id(message, message_id):
+    stored = {'id': message_id}
+    stored.update((k, v) for k, v in message.items() if k != 'id')
+    return stored
+
+
+class ChatLog:
+    """One conversation's JSON-lines file with an index of line offsets and message ids."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offsets = []  # start of each complete line
+        self._ids = []  # message id of each complete line, ascending
+        self._end = 0  # end of the last complete line
+        self._ino = None
+        self._sequence = IdSequence(path)
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._offsets, self._ids, self._end, self._ino = [], [], 0, None
+            return
+        if st.st_ino != self._ino or st.st_size < self._end:
+            self._offsets, self._ids, self._end, self._ino = [], [], 0, st.st_ino  # replaced: index from scratch
+        if st.st_size == self._end:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._end)
+            chunk = f.read()
+        position = 0
+        while True:
+            newline = chunk.find(b'\n', position)
+            if newline < 0:
+                break  # a torn final line is not a message yet
+            line = chunk[position:newline]
+            if line.strip():
+                try:
+                    message_id = _line_id(line)
+                except (ValueError, KeyError, TypeError):
+                    logger.warning('Skipping corrupt line in %s', self.path)
+                else:
+                    self._offsets.append(self._end + position)
+                    self._ids.append(message_id)
+            position = newline + 1
+        self._end += position
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def last_id(self):
+        with self._lock:
+            self._refresh()
+            return self._ids[-1] if self._ids else 0
+
+    def read(self, start, stop):
+        """Messages on lines [start, stop), 0-based."""
+        with self._lock:
+            self._refresh()
+            return self._read(start, stop)
+
+    def page(self, limit, before=None):
+        """The last limit messages with an id below before (any id when None)."""
+        with self._lock:
+            self._refresh()
+            stop = len(self._ids) if before is None else bisect.bisect_left(self._ids, before)
+            return self._read(stop - limit, stop)
+
+    def since(self, after_id):
+        """Messages with an id greater than after_id."""
+        with self._lock:
+            self._refresh()
+            return self._read(bisect.bisect_right(self._ids, after_id), len(self._ids))
+
+    def _read(self, start, stop):
+        start, stop = max(0, start), min(stop, len(self._offsets))
+        if start >= stop:
+            return FrozenList()
+        end = self._offsets[stop] if stop < len(self._offsets) else self._end
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[start])
+            data = f.read(end - self._offsets[start])
+        # Corrupt lines between indexed ones are in data too; skip them.
+        messages = []
+        for line in data.splitlines():
+            try:
+                messages.append(freeze(json.loads(line)))
+            except ValueError:
+                continue
+        return FrozenList(messages)
+
+    def append(self, message):
+        """Append message with the next id; the caller holds file_lock(self.path)."""
+        with self._lock:
+            self._refresh()
+            stored = _with_id(message, self._sequence.next(floor=self._ids[-1] if self._ids else 0))
+            line = json.dumps(stored, ensure_ascii=False).encode('utf-8') + b'\n'
+            with open(self.path, 'ab') as f:
+                if f.tell() > self._end:
+                    f.truncate(self._end)  # a torn line left by a crashed writer
+                f.write(line)
+            self._refresh()
+        return freeze(stored)
+
+    def write_all(self, messages):
+        """Replace the log with messages, keeping their ids where they still ascend.
+
+        The caller holds file_lock(self.path).
+        """
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        last = 0
+        with open(tmp_path, 'wb') as f:
+            for message in messages:
+                message_id = message.get('id')
+                if not isinstance(message_id, int) or message_id <= last:
+                    message_id = last + 1
+                last = message_id
+                f.write(json.dumps(_with_id(message, message_id), ensure_ascii=False).encode('utf-8') + b'\n')
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._refresh()
+
+
+class ChatStore:
+    def __init__(self, directory, legacy_path=None, cache_size=CHAT_LOG_CACHE_SIZE):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._logs = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f'{int(user_id)}.jsonl')
+
+    def _log(self, user_id):
+        with self._lock:
+            log = self._logs.get(user_id)
+            if log is not None:
+                self._logs.move_to_end(user_id)
+                return log
+        log = ChatLog(self._path(user_id))
+        if not os.path.exists(log.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            legacy = read_json_file(self.legacy_path, {}).get(str(user_id))
+            if legacy:
+                with file_lock(log.path):
+                    if not os.path.exists(log.path):
+                        log.write_all(legacy)
+        with self._lock:
+            log = self._logs.setdefault(user_id, log)
+            while len(self._logs) > self.cache_size:
+                self._logs.popitem(last=False)
+        return log
+
+    def messages(self, user_id):
+        log = self._log(user_id)
+        return log.read(0, log.count())
+
+    def page(self, user_id, limit=50, before=None):
+        """The newest limit messages (older than id ``before``), oldest first."""
+        return self._log(user_id).page(limit, before)
+
+    def since(self, user_id, after_id):
+        """Messages with an id greater than after_id, oldest first."""
+        return self._log(user_id).since(after_id)
+
+    def latest_id(self, user_id):
+        return self._log(user_id).last_id()
+
+    def append(self, user_id, message):
+        log = self._log(user_id)
+        with file_lock(log.path):
+            return log.append(message)
+
+    def replace(self, user_id, messages):
+        log = self._log(user_id)
+        with file_lock(log.path):
+            log.write_all(messages)
+
+
+class ChatNotifier:
+    """Lets SSE streams sleep until their conversation has a message newer than they have sent."""
+
+    def __init__(self, latest_id, poll_interval=CHAT_POLL_INTERVAL):
+        self.latest_id = latest_id
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conditions = {}  # user_id -> Condition on self._lock
+        self._waiters = {}
+        self._latest = {}
+        self._watcher = None
+        self._watcher_pid = None
+
+    def notify(self, user_id, message_id):
+        with self._lock:
+            condition = self._conditions.get(user_id)
+            if condition is None:
+                return  # nobody is streaming this conversation here
+            if message_id > self._latest[user_id]:
+                self._latest[user_id] = message_id
+                condition.notify_all()
+
+    def wait(self, user_id, last_id, timeout):
+        """Block until user_id has a message after last_id or timeout passes; True if it has."""
+        self._ensure_watcher()
+        with self._lock:
+            self._latest.setdefault(user_id, last_id)
+            condition = self._conditions.setdefault(user_id, threading.Condition(self._lock))
+            self._waiters[user_id] = self._waiters.get(user_id, 0) + 1
+            try:
+                return condition.wait_for(lambda: self._latest[user_id] > last_id, timeout)
+            finally:
+                self._waiters[user_id] -= 1
+                if not self._waiters[user_id]:
+                    del self._waiters[user_id], self._conditions[user_id], self._latest[user_id]
+
+    def streams(self):
+        with self._lock:
+            return sum(self._waiters.values())
+
+    def _ensure_watcher(self):
+        if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+            return
+        with self._lock:
+            if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name='chat-notifier', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        stop = threading.Event()
+        while not stop.wait(self.poll_interval):
+            with self._lock:
+                user_ids = list(self._waiters)
+            for user_id in user_ids:
+                try:
+                    self.notify(user_id, self.latest_id(user_id))
+                except Exception:
+                    logger.exception('Checking chat %s for new messages failed', user_id)
@@ -0,0 +1,48 @@
+"""Flask configuration profiles for ``main.create_app``.
+
+``production`` (the default) turns off the debugger and template
+auto-reloading, so templates are compiled once and never stat'ed again;
+``development`` turns both on for ``python main.py``. ``APP_ENV`` picks the
+profile when none is passed.
+"""
+
+import os
+
+APP_ENV = os.environ.get('APP_ENV', 'production')
+DEFAULT_SECRET_KEY = 'dev-secret-key-change-in-production'
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SESSION_SECRET', DEFAULT_SECRET_KEY)
+    DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+    # Compile every template when the app is created (before gunicorn forks)
+    WARM_UP = True
+
+
+class ProductionConfig(Config):
+    # Static files are fingerprint-free, so keep the browser cache short
+    SEND_FILE_MAX_AGE_DEFAULT = int(os.environ.get('STATIC_MAX_AGE', 3600))
+    SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', '0') in ('1', 'true', 'yes')
+    SESSION_COOKIE_HTTPONLY = True
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    WARM_UP = False
+
+
+PROFILES = {'production': ProductionConfig, 'development': DevelopmentConfig}
+
+
+def get_config(config=None):
+    """The config class for a profile name (default ``APP_ENV``); classes and dicts pass through."""
+    if config is None:
+        config = APP_ENV
+    if isinstance(config, str):
+        try:
+            return PROFILES[config]
+        except KeyError:
+            raise ValueError(f'Unknown config profile {config!r}; expected one of {", ".join(PROFILES)}') from None
+    return config
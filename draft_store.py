@@ -0,0 +1,251 @@
+"""Server-side drafts of in-progress test attempts.
+
+A draft is the latest state of one attempt: the answers so far, when the
+attempt started and the client's revision counter. Drafts are keyed by user
+and test (anonymous mock-test takers by session), so opening the same test
+on another device resumes the attempt. Each attempt gets a fresh ``attempt``
+id. Updates for an attempt that has been finished or replaced are ignored,
+and so are updates older than the stored revision, so late or reordered
+autosaves cannot bring an old attempt back.
+
+Test pages autosave every few seconds, so writes go through a write-behind
+``DraftBuffer``. It keeps the newest update per attempt in memory and hands
+them to the repository in one batch every ``DRAFT_FLUSH_INTERVAL`` seconds.
+With the JSON backend a batch is one append to ``data/drafts.jsonl``
+(``DraftJournal``), however many students are typing. The journal is
+rewritten with only the live drafts once it grows past
+``DRAFT_COMPACT_BYTES``. Drafts are best-effort: an update can be lost if a
+worker dies within one flush interval, and the final answers are always
+posted with the submission anyway.
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+from storage import file_lock, freeze
+from metrics import DRAFT_UPDATES, DRAFT_WRITES, DRAFT_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DRAFT_FLUSH_INTERVAL = float(os.environ.get('DRAFT_FLUSH_INTERVAL', 2.0))
+# Flush early once this many attempts have unsaved updates
+DRAFT_MAX_PENDING = int(os.environ.get('DRAFT_MAX_PENDING', 5000))
+DRAFT_MAX_AGE = float(os.environ.get('DRAFT_MAX_AGE', 24 * 3600))
+DRAFT_COMPACT_BYTES = int(os.environ.get('DRAFT_COMPACT_BYTES', 8 * 1024 * 1024))
+
+
+def merge_draft(current, update):
+    """The stored draft after applying update to current (None if there is none yet).
+
+    update is a new attempt (it has ``started_at``), a save of answers, or a
+    ``finished`` marker; it carries ``key``, ``attempt``, ``updated_at`` and,
+    for saves, ``answers`` and ``revision``. Stale updates return current.
+    """
+    if 'started_at' in update:
+        return update
+    if current is None:
+        # The attempt's first record was lost (e.g. it expired); start it from this update.
+        return dict(update, started_at=update['updated_at'])
+    if current.get('attempt') != update.get('attempt') or current.get('finished'):
+        return current
+    if not update.get('finished') and update.get('revision', 0) < current.get('revision', 0):
+        return current
+    return dict(current, **update)
+
+
+def _coalesce(current, update):
+    """One pending update for an attempt equivalent to current followed by update."""
+    if current is None or update.get('revision', 0) < current.get('revision', 0):
+        return update if current is None else current
+    return dict(current, **update)
+
+
+def _apply_order(update):
+    # New attempts before saves, then oldest first
+    return ('started_at' not in update, update['updated_at'])
+
+
+def is_live(draft, now=None, max_age=DRAFT_MAX_AGE):
+    if draft is None or draft.get('finished'):
+        return False
+    return (now or time.time()) - draft.get('updated_at', 0) <= max_age
+
+
+class DraftJournal:
+    """The latest draft per key, in a JSON-lines file shared by all workers.
+
+    Each process indexes the file incrementally, reading only the lines
+    appended since its last look, and starts over when compaction has
+    replaced the file.
+    """
+
+    def __init__(self, path, max_age=DRAFT_MAX_AGE, compact_bytes=DRAFT_COMPACT_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._drafts = {}
+        self._inode = None
+        self._offset = 0
+        self._compacted_size = 0
+        self.compactions = 0
+
+    def _refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._drafts, self._inode, self._offset = {}, None, 0
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._drafts, self._inode, self._offset = {}, st.st_ino, 0
+        if st.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        # A batch still being appended by another worker is picked up next time.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                update = json.loads(line)
+            except ValueError:
+                logger.warning('Skipping corrupt line in %s', self.path)
+                continue
+            self._drafts[update['key']] = freeze(merge_draft(self._drafts.get(update['key']), update))
+        self._offset += end
+
+    def get(self, key):
+        with self._lock:
+            self._refresh()
+            draft = self._drafts.get(key)
+        return draft if is_live(draft, max_age=self.max_age) else None
+
+    def append(self, updates):
+        """Append a batch of updates with one write."""
+        if not updates:
+            return
+        data = ''.join(json.dumps(u, separators=(',', ':'), ensure_ascii=False) + '\n' for u in updates)
+        with file_lock(self.path):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            size = os.path.getsize(self.path)
+            # Also wait for the file to double, in case the live drafts alone exceed compact_bytes.
+            if size > self.compact_bytes and size > 2 * self._compacted_size:
+                self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with only the live drafts; the caller holds the file lock."""
+        with self._lock:
+            self._refresh()
+            now = time.time()
+            # Finished attempts are kept until they expire, so late saves for them stay ignored.
+            keep = [d for d in self._drafts.values() if now - d.get('updated_at', 0) <= self.max_age]
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for draft in keep:
+                f.write(json.dumps(draft, separators=(',', ':'), ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+        self._compacted_size = os.path.getsize(self.path)
+        self.compactions += 1
+
+
+class DraftBuffer:
+    """Coalesce draft updates per attempt in memory and save them in batches."""
+
+    def __init__(self, repository, interval=DRAFT_FLUSH_INTERVAL, max_pending=DRAFT_MAX_PENDING):
+        self.repository = repository
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher = None
+        self._flusher_pid = None
+        self.updates = 0
+        self.writes = 0
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so each gunicorn worker starts its own.
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._pending = {}
+                atexit.register(self.flush)
+            if self._flusher is None or self._flusher_pid != os.getpid() or not self._flusher.is_alive():
+                self._flusher_pid = os.getpid()
+                self._flusher = threading.Thread(target=self._flush_loop, name='draft-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Saving drafts failed')
+
+    def get(self, key):
+        """The draft for key, including updates not saved yet; None if there is none."""
+        with self._lock:
+            updates = list(self._pending.get(key, {}).values())
+        draft = None if any('started_at' in u for u in updates) else self.repository.get(key)
+        for update in sorted(updates, key=_apply_order):
+            draft = merge_draft(draft, update)
+        return draft if is_live(draft) else None
+
+    def put(self, update):
+        """Queue an update (see merge_draft) for the next batch."""
+        self._ensure_flusher()
+        update = dict(update, updated_at=time.time())
+        with self._lock:
+            attempts = self._pending.setdefault(update['key'], {})
+            attempts[update['attempt']] = _coalesce(attempts.get(update['attempt']), update)
+            self.updates += 1
+            full = len(self._pending) >= self.max_pending
+        DRAFT_UPDATES.inc()
+        if full:
+            self.flush()
+
+    def finish(self, key, attempt):
+        """Close the attempt (after it has been submitted); written straight away."""
+        with self._lock:
+            attempts = self._pending.get(key)
+            if attempts is not None:
+                attempts.pop(attempt, None)
+                if not attempts:
+                    del self._pending[key]
+        self.repository.save_many([{'key': key, 'attempt': attempt, 'finished': True, 'updated_at': time.time()}])
+
+    def flush(self):
+        """Save every pending update in one batch."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        updates = sorted((u for attempts in batch.values() for u in attempts.values()), key=_apply_order)
+        if not updates:
+            return 0
+        started = time.perf_counter()
+        try:
+            self.repository.save_many(updates)
+        except Exception:
+            with self._lock:
+                # Put the batch back underneath any updates that arrived meanwhile.
+                for update in updates:
+                    attempts = self._pending.setdefault(update['key'], {})
+                    newer = attempts.get(update['attempt'])
+                    attempts[update['attempt']] = update if newer is None else _coalesce(update, newer)
+            raise
+        self.writes += len(updates)
+        DRAFT_WRITES.inc(amount=len(updates))
+        DRAFT_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        return len(updates)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {'pending': pending, 'updates': self.updates, 'writes': self.writes}
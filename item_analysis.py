@@ -0,0 +1,210 @@
+"""Item analysis of multiple-choice tests from the stored result history.
+
+For every test with an answer key, each submission's answers become one row
+of an (results x questions) matrix of option indexes (-1 for blank or
+anything that is not an option). Only those codes are buffered, and matrices
+are built ``ITEM_ANALYSIS_CHUNK`` rows at a time and folded into small running
+tables, so memory does not grow with the number of results:
+
+- ``by_total[t, j]``: how many respondents with raw score t got question j
+  right, and ``totals[t]``: how many respondents had raw score t;
+- ``choices[j, k]``: how often option k was chosen for question j (the
+  last column counts blanks).
+
+Everything in the summary is derived from those tables at the end:
+
+- difficulty: the share of respondents answering correctly (p-value);
+- discrimination: p-value in the top 27% by raw score minus p-value in the
+  bottom 27%, splitting tied scores at the group boundary proportionally;
+- point-biserial: correlation of the question with the rest of the test
+  (raw score without that question);
+- distractor frequencies, the raw-score distribution in ten-percent bins and
+  KR-20 reliability.
+
+Only this module needs NumPy; the app just reads the JSON summary it writes.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+
+from storage import atomic_write_json
+
+
+ITEM_ANALYSIS_CHUNK = int(os.environ.get('ITEM_ANALYSIS_CHUNK', 50_000))
+GROUP_FRACTION = 0.27
+SCORE_BINS = 10
+DEFAULT_OPTIONS = 10
+
+
+class ItemStats:
+    """Running tables for one test's answer key."""
+
+    def __init__(self, key):
+        self.key = key
+        self.questions = len(key.fields)
+        self.n_options = max(key.options or (0,)) or DEFAULT_OPTIONS
+        self.correct = np.array([int(c) if c.isdigit() else -2 for c in key.correct], dtype=np.int16)
+        # Form values are strings; stored JSON may also hold ints.
+        self.codes = {str(k): k for k in range(self.n_options)}
+        self.codes.update({k: k for k in range(self.n_options)})
+        self.by_total = np.zeros((self.questions + 1, self.questions), dtype=np.int64)
+        self.totals = np.zeros(self.questions + 1, dtype=np.int64)
+        self.choices = np.zeros((self.questions, self.n_options + 1), dtype=np.int64)
+        self.responses = 0
+
+    def codes_for(self, result):
+        """The option index chosen for each question of result (-1 if blank)."""
+        answers = result.get('answers') or {}
+        codes = self.codes
+        return [codes.get(answers.get(field), -1) for field in self.key.fields]
+
+    def add(self, flat):
+        """Fold a chunk of rows, concatenated codes_for() lists, into the tables."""
+        if not flat:
+            return
+        chosen = np.array(flat, dtype=np.int16).reshape(-1, self.questions)
+        right = chosen == self.correct
+        raw = right.sum(axis=1)
+
+        self.totals += np.bincount(raw, minlength=self.questions + 1)
+        rows, cols = np.nonzero(right)
+        self.by_total += np.bincount(raw[rows] * self.questions + cols,
+                                     minlength=(self.questions + 1) * self.questions).reshape(self.by_total.shape)
+        # Blanks (-1) go to the last column.
+        slots = np.where(chosen < 0, self.n_options, chosen) + np.arange(self.questions) * (self.n_options + 1)
+        self.choices += np.bincount(slots.ravel(), minlength=self.choices.size).reshape(self.choices.shape)
+        self.responses += len(chosen)
+
+    def _group_weights(self, from_top):
+        """Per raw score, the share of its respondents inside the top (or bottom) group."""
+        size = GROUP_FRACTION * self.responses
+        weights = np.zeros(self.questions + 1)
+        remaining = size
+        order = range(self.questions, -1, -1) if from_top else range(self.questions + 1)
+        for t in order:
+            if remaining <= 0:
+                break
+            if self.totals[t]:
+                taken = min(self.totals[t], remaining)
+                weights[t] = taken / self.totals[t]
+                remaining -= taken
+        return weights, size
+
+    def summary(self):
+        n = self.responses
+        q = self.questions
+        scores = np.arange(q + 1)
+        correct_counts = self.by_total.sum(axis=0)
+        difficulty = correct_counts / n
+
+        upper, size = self._group_weights(from_top=True)
+        lower, _ = self._group_weights(from_top=False)
+        discrimination = (upper @ self.by_total - lower @ self.by_total) / size if size else np.zeros(q)
+
+        # Item-rest correlation from sums: x is 0/1, rest = raw score - x.
+        sum_t = float(self.totals @ scores)
+        sum_t2 = float(self.totals @ scores ** 2)
+        sum_xt = scores @ self.by_total
+        sum_x = correct_counts.astype(float)
+        sum_rest = sum_t - sum_x
+        sum_rest2 = sum_t2 - 2 * sum_xt + sum_x
+        sum_x_rest = sum_xt - sum_x
+        covariance = n * sum_x_rest - sum_x * sum_rest
+        variance = (n * sum_x - sum_x ** 2) * (n * sum_rest2 - sum_rest ** 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            point_biserial = np.where(variance > 0, covariance / np.sqrt(np.where(variance > 0, variance, 1)), np.nan)
+
+        mean = sum_t / n
+        raw_variance = sum_t2 / n - mean ** 2
+        kr20 = None
+        if q > 1 and raw_variance > 0:
+            kr20 = q / (q - 1) * (1 - float((difficulty * (1 - difficulty)).sum()) / raw_variance)
+
+        percentages = scores / q * 100
+        bins = np.minimum((percentages // (100 / SCORE_BINS)).astype(int), SCORE_BINS - 1)
+        distribution = np.bincount(bins, weights=self.totals, minlength=SCORE_BINS).astype(int)
+        median = int(np.searchsorted(np.cumsum(self.totals), (n + 1) / 2))
+
+        items = []
+        for j, field in enumerate(self.key.fields):
+            items.append({
+                'field': field,
+                'correct_answer': self.key.correct[j],
+                'difficulty': round(float(difficulty[j]), 4),
+                'discrimination': round(float(discrimination[j]), 4),
+                'point_biserial': None if np.isnan(point_biserial[j]) else round(float(point_biserial[j]), 4),
+                'option_counts': self.choices[j, :-1].tolist(),
+                'blank': int(self.choices[j, -1]),
+            })
+        return {
+            'responses': n,
+            'questions': q,
+            'mean_score': round(mean / q * 100, 2),
+            'std_score': round(max(raw_variance, 0) ** 0.5 / q * 100, 2),
+            'median_score': round(median / q * 100, 2),
+            'reliability_kr20': None if kr20 is None else round(kr20, 4),
+            'score_distribution': distribution.tolist(),
+            'items': items,
+        }
+
+
+def analyse(result_sets, key_for, chunk_size=ITEM_ANALYSIS_CHUNK):
+    """Item statistics for every test found in result_sets.
+
+    ``result_sets`` is [(kind, iterable of results)], e.g. practice and mock
+    results streamed from disk; ``key_for(test_id)`` returns the test's
+    AnswerKey or None. Tests without a multiple-choice key are skipped.
+    Returns (summaries keyed by (kind, test_id), results scanned).
+    """
+    stats, buffers = {}, {}
+    keys = {}
+    scanned = 0
+    for kind, results in result_sets:
+        for result in results:
+            scanned += 1
+            test_id = result.get('test_id')
+            if test_id not in keys:
+                key = key_for(test_id)
+                keys[test_id] = key if key is not None and not key.is_manual else None
+            if keys[test_id] is None:
+                continue
+            name = (kind, test_id)
+            item_stats = stats.get(name)
+            if item_stats is None:
+                item_stats = stats[name] = ItemStats(keys[test_id])
+                buffers[name] = []
+            # Only the option codes are buffered, not the result dicts.
+            buffer = buffers[name]
+            buffer += item_stats.codes_for(result)
+            if len(buffer) >= chunk_size * item_stats.questions:
+                item_stats.add(buffer)
+                buffers[name] = []
+    for name, buffer in buffers.items():
+        stats[name].add(buffer)
+    return {name: item_stats.summary() for name, item_stats in stats.items()}, scanned
+
+
+def run_item_analysis(repos, path, chunk_size=ITEM_ANALYSIS_CHUNK):
+    """Analyse practice and mock results and write the summary file; returns the summary."""
+    from scoring import compile_answer_key
+
+    def key_for(test_id):
+        test = repos.tests.get(test_id)
+        return compile_answer_key(test) if test else None
+
+    result_sets = [('practice', repos.results.iter_all()), ('mock', repos.mock_results.iter_all())]
+    summaries, scanned = analyse(result_sets, key_for, chunk_size)
+    titles = repos.tests.get_summaries({test_id for _, test_id in summaries})
+    tests = []
+    for (kind, test_id), summary in sorted(summaries.items(), key=lambda item: (item[0][0], item[0][1])):
+        test = titles.get(test_id) or {}
+        tests.append(dict(summary, kind=kind, test_id=test_id, title=test.get('title'), section=test.get('section')))
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'results_scanned': scanned,
+        'tests': tests,
+    }
+    atomic_write_json(path, report)
+    return report
@@ -0,0 +1,230 @@
+"""Search, filters and pagination over the job listings.
+
+The active listings are indexed in memory, newest first, and the index is
+rebuilt whenever the jobs repository's version (the (mtime, size, inode) of
+jobs.json) changes, or every ``JOB_BOARD_MAX_AGE`` seconds when the backend
+has no cheap version (SQL). With the JSON backend the listings stay in the
+shared jobs snapshot (snapshot.py) and are decoded a page at a time; the
+index itself holds positions:
+
+- an inverted index from title, location and description terms to
+  {position: the term's BM25 weight in that listing}, with title and
+  location terms counting more than description terms; a search intersects
+  the postings of its terms, rarest first, and ranks the matches by the sum
+  of their weights;
+- per location, specialty and employment type, the sorted positions of the
+  matching listings plus the facets (name, count), so a filtered page is a
+  bisect into the smallest list.
+
+Pages are addressed with a cursor naming the last listing shown (its id, and
+its relevance for a search), so the next page starts right after it without
+counting from the top.
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import bisect
+import threading
+from functools import lru_cache
+from collections import Counter
+
+from storage import FrozenList
+from snapshot import take
+
+PAGE_SIZE = int(os.environ.get('JOB_BOARD_PAGE_SIZE', 24))
+JOB_BOARD_MAX_AGE = float(os.environ.get('JOB_BOARD_MAX_AGE', 60))
+FILTERS = ('location', 'specialty', 'job_type')
+DEFAULT_JOB_TYPE = 'Full-time'
+FIELD_WEIGHTS = (('title', 3.0), ('location', 2.0), ('description', 1.0))
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOP_WORDS = frozenset('a an and are as at be for from in is of on or the to with our we you your'.split())
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+
+def fold(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+@lru_cache(maxsize=65536)
+def _term(token):
+    if token in STOP_WORDS:
+        return None
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Search terms of text: lower-case words without stop words, plurals folded."""
+    return [term for term in map(_term, _TOKEN.findall((text or '').casefold())) if term]
+
+
+def filter_value(job, name):
+    value = job.get(name)
+    if name == 'job_type':
+        value = value or DEFAULT_JOB_TYPE
+    return value if isinstance(value, str) and value.strip() else None
+
+
+class _Index:
+    def __init__(self, jobs):
+        active = [(i, job) for i, job in enumerate(jobs) if job.get('is_active', True)]
+        active.sort(key=lambda item: (item[1].get('posted_date') or '', item[1].get('id') or 0), reverse=True)
+        self.jobs = take(jobs, [i for i, _ in active])
+        active = [job for _, job in active]
+        self.positions = {job.get('id'): i for i, job in enumerate(active)}
+
+        # Term frequencies weighted by field, then turned into each term's
+        # BM25 contribution so a search only adds up posting values.
+        self.postings = {}
+        lengths = []
+        for i, job in enumerate(active):
+            frequencies = Counter()
+            for field, weight in FIELD_WEIGHTS:
+                for token, n in Counter(_TOKEN.findall((job.get(field) or '').casefold())).items():
+                    term = _term(token)
+                    if term:
+                        frequencies[term] += weight * n
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, {})[i] = frequency
+            lengths.append(sum(frequencies.values()))
+        average = (sum(lengths) / len(lengths) if lengths else 0.0) or 1.0
+        n = len(active)
+        for posting in self.postings.values():
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for i, frequency in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[i] / average)
+                posting[i] = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        # Filter value -> ascending positions, and the facets to offer.
+        self.filters = {}
+        self.facets = {}
+        for name in FILTERS:
+            by_value, names = {}, {}
+            for i, job in enumerate(active):
+                value = filter_value(job, name)
+                if value:
+                    by_value.setdefault(fold(value), []).append(i)
+                    names.setdefault(fold(value), value)
+            self.filters[name] = by_value
+            self.facets[name] = tuple(sorted((names[k], len(by_value[k])) for k in names))
+
+    def filtered(self, filters):
+        """Ascending positions matching every filter, or None when there are no filters."""
+        lists = []
+        for name in FILTERS:
+            value = filters.get(name)
+            if value:
+                lists.append(self.filters[name].get(fold(value), []))
+        if not lists:
+            return None
+        lists.sort(key=len)
+        if len(lists) == 1:
+            return lists[0]
+        common = set(lists[0]).intersection(*lists[1:])
+        return sorted(common)
+
+    def matches(self, terms, allowed):
+        """{position: BM25 score} of listings containing every term."""
+        postings = sorted((self.postings.get(term, {}) for term in set(terms)), key=len)
+        if not postings or not postings[0]:
+            return {}
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        if allowed is not None:
+            candidates.intersection_update(allowed)
+        # Rounded so the score written into a cursor compares exactly.
+        return {i: round(sum(posting[i] for posting in postings), 6) for i in candidates}
+
+
+def parse_cursor(cursor):
+    """(relevance or None, job id) from a cursor; ValueError if malformed."""
+    score, _, job_id = cursor.rpartition(':')
+    return (float(score) if score else None), int(job_id)
+
+
+class JobBoard:
+    def __init__(self, repository, max_age=JOB_BOARD_MAX_AGE):
+        self.repository = repository
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._version = None
+        self._built_at = None
+        self._index = _Index(FrozenList())
+        self.rebuilds = 0
+
+    def _stale(self, version):
+        if self._built_at is None:
+            return True
+        if version is None:
+            return time.monotonic() - self._built_at > self.max_age
+        return version != self._version
+
+    def _current(self):
+        version = self.repository.version()
+        if not self._stale(version):
+            return self._index
+        if not self._lock.acquire(blocking=self._built_at is None):
+            return self._index  # another thread is rebuilding; serve the previous index meanwhile
+        try:
+            version = self.repository.version()
+            if self._stale(version):
+                self._index = _Index(self.repository.all())
+                self._version = version
+                self._built_at = time.monotonic()
+                self.rebuilds += 1
+            return self._index
+        finally:
+            self._lock.release()
+
+    def get(self, job_id):
+        index = self._current()
+        position = index.positions.get(job_id)
+        return index.jobs[position] if position is not None else None
+
+    def facets(self):
+        """{filter name: ((value, listing count), ...)} over all active listings."""
+        return self._current().facets
+
+    def search(self, query=None, filters=None, cursor=None, limit=PAGE_SIZE):
+        """One page of active listings matching query and filters.
+
+        Without a query listings come newest first; with one, by relevance.
+        ``filters`` maps location / specialty / job_type to a value (matched
+        case-insensitively). ``cursor`` is the ``next_cursor`` of the previous
+        page. Returns (listings, total matches, next_cursor or None).
+        Raises ValueError for a malformed cursor.
+        """
+        index = self._current()
+        allowed = index.filtered(filters or {})
+        after = parse_cursor(cursor) if cursor else None
+        terms = tokenize(query)
+        if after is not None and after[1] not in index.positions:
+            return FrozenList(), 0, None  # the listing the cursor points at is gone
+
+        if not terms:
+            positions = allowed if allowed is not None else range(len(index.jobs))
+            start = bisect.bisect_right(positions, index.positions[after[1]]) if after else 0
+            page = positions[start:start + limit]
+            listings = FrozenList(index.jobs[i] for i in page)
+            more = start + limit < len(positions)
+            next_cursor = str(listings[-1].get('id')) if more and listings else None
+            return listings, len(positions), next_cursor
+
+        scores = index.matches(terms, allowed)
+        keys = ((-score, i) for i, score in scores.items())
+        if after is not None:
+            last = (-(after[0] or 0.0), index.positions[after[1]])
+            keys = (key for key in keys if key > last)
+        page = heapq.nsmallest(limit + 1, keys)
+        more = len(page) > limit
+        page = page[:limit]
+        listings = FrozenList(index.jobs[i] for _, i in page)
+        next_cursor = f'{-page[-1][0]}:{index.jobs[page[-1][1]].get("id")}' if more else None
+        return listings, len(scores), next_cursor
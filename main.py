@@ -1,38 +1,50 @@
-
 #!/usr/bin/env python
 
 import os
 import copy
 import json
 import time
+import uuid
 import logging
+from functools import wraps
 from datetime import datetime, timedelta
 from io import BytesIO
 
-from flask import Flask, render_template, redirect, url_for, flash, request, session, jsonify, current_app, make_response
+from flask import Flask, Blueprint, render_template, redirect, url_for, flash, request, session, jsonify, current_app, make_response, send_file, abort, Response, stream_with_context, g
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, EmailField
 from wtforms.validators import DataRequired, Email, Length, EqualTo
-from werkzeug.security import generate_password_hash, check_password_hash
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from storage import StorageBusyError, read_json_file
+from repositories import create_repositories
+from test_catalog import test_kind
+from scoring import ScoringEngine
+from vocabulary_index import VocabularyIndex, PAGE_SIZE as VOCABULARY_PAGE_SIZE
+from spaced_repetition import ReviewScheduler
+from chat_store import ChatNotifier
+from progress_aggregates import ProgressTracker, average, day_streak
+from score_distributions import ScoreDistributions
+from page_cache import PageCache
+from draft_store import DraftBuffer
+from job_board import JobBoard, FILTERS as JOB_FILTERS, PAGE_SIZE as JOB_PAGE_SIZE
+from reports import ReportCache, ReportService, report_payload
+from config import DEFAULT_SECRET_KEY, get_config
+from passwords import PasswordHasher, PasswordHasherBusy
+from metrics import registry as metrics_registry, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, HTTP_SLOW_REQUESTS, PDF_RENDERS, PDF_RENDER_SECONDS
+from report_export import (EXPORT_FORMATS, EXPORT_MAX_RESULTS, EXPORT_RENDER_TIMEOUT, ExportProgress,
+                           parse_date_bounds, select_results, stream_zip, valid_export_id)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
 # ============ Flask App Configuration ============
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.config['DEBUG'] = True
-app.config['TEMPLATES_AUTO_RELOAD'] = True
+# Routes register on this blueprint; create_app() (bottom) builds an app for a profile and mounts it.
+bp = Blueprint('main', __name__)
 
-# Initialize Flask-Login
+# Initialize Flask-Login (bound to each app in create_app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message_category = 'info'
 
 # ============ Forms ============
@@ -64,19 +76,28 @@ VOCABULARY_FILE = os.path.join(DATA_DIR, 'vocabulary.json')
 VOCABULARY_PROGRESS_FILE = os.path.join(DATA_DIR, 'vocabulary_progress.json')
 JOBS_FILE = os.path.join(DATA_DIR, 'jobs.json')
 CHAT_MESSAGES_FILE = os.path.join(DATA_DIR, 'chat_messages.json')
+ITEM_ANALYSIS_FILE = os.path.join(DATA_DIR, 'item_analysis.json')
 
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+def _record_field(name, default=None):
+    return property(lambda self: self._record.get(name, default))
+
 class User(UserMixin):
-    def __init__(self, id, username, email, password_hash, subscription_type=None, subscription_expires=None, is_superuser=False):
-        self.id = id
-        self.username = username
-        self.email = email
-        self.password_hash = password_hash
-        self.subscription_type = subscription_type
-        self.subscription_expires = subscription_expires
-        self.is_superuser = is_superuser
+    """A read-only view of a user's record; building one per request copies nothing."""
+    __slots__ = ('_record',)
+
+    def __init__(self, record):
+        self._record = record
+
+    id = _record_field('id')
+    username = _record_field('username')
+    email = _record_field('email')
+    password_hash = _record_field('password_hash')
+    subscription_type = _record_field('subscription_type')
+    subscription_expires = _record_field('subscription_expires')
+    is_superuser = _record_field('is_superuser', False)
 
     def has_active_subscription(self):
         if not self.subscription_type or not self.subscription_expires:
@@ -94,208 +115,202 @@ def load_user(user_id):
     return get_user_by_id(int(user_id))
 
 # ============ Data Management Functions ============
-def load_json_file(filepath, default=None):
-    if default is None:
-        default = []
-    if not os.path.exists(filepath):
-        save_json_file(filepath, default)
-        return default
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return default
+# Storage backend: 'json' (flat files in DATA_DIR) or 'sql' (SQLAlchemy, see sql_repositories.py)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.abspath(os.path.join(DATA_DIR, 'oet.db')))
 
-def save_json_file(filepath, data):
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+repos = create_repositories(STORAGE_BACKEND, DATA_DIR, DATABASE_URL)
 
-def get_next_id(data_list):
-    if not data_list:
-        return 1
-    return max(item['id'] for item in data_list) + 1
+def user_from_record(user_data):
+    # Nothing changes a record once it is read, so the User wraps it instead of copying its fields.
+    return User(user_data)
 
 # User management
 def get_users():
-    return load_json_file(USERS_FILE, [])
+    return repos.users.all()
 
 def save_users(users):
-    save_json_file(USERS_FILE, users)
+    repos.users.replace_all(users)
 
 def get_user_by_email(email):
-    users = get_users()
-    for user_data in users:
-        if user_data['email'] == email:
-            return User(
-                id=user_data['id'],
-                username=user_data['username'],
-                email=user_data['email'],
-                password_hash=user_data['password_hash'],
-                subscription_type=user_data.get('subscription_type'),
-                subscription_expires=user_data.get('subscription_expires'),
-                is_superuser=user_data.get('is_superuser', False)
-            )
-    return None
+    user_data = repos.users.get_by_email(email)
+    return user_from_record(user_data) if user_data else None
 
 def get_user_by_id(user_id):
-    users = get_users()
-    for user_data in users:
-        if user_data['id'] == user_id:
-            return User(
-                id=user_data['id'],
-                username=user_data['username'],
-                email=user_data['email'],
-                password_hash=user_data['password_hash'],
-                subscription_type=user_data.get('subscription_type'),
-                subscription_expires=user_data.get('subscription_expires'),
-                is_superuser=user_data.get('is_superuser', False)
-            )
-    return None
+    user_data = repos.users.get_by_id(user_id)
+    return user_from_record(user_data) if user_data else None
+
+# Hashes and verifies passwords on a bounded process pool (see passwords.py)
+password_hasher = PasswordHasher()
+
+def authenticate(email, password):
+    """The user with these credentials, or None; upgrades a hash made with old KDF parameters."""
+    user = get_user_by_email(email)
+    if user is None or not password_hasher.verify(user.password_hash, password):
+        return None
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            repos.users.set_password_hash(user.id, password_hasher.hash(password))
+        except PasswordHasherBusy:
+            pass  # upgraded on a later sign-in
+    return user
 
 def create_user(username, email, password):
-    users = get_users()
-    user_id = get_next_id(users)
-    user_data = {
-        'id': user_id,
+    user_data = repos.users.create({
         'username': username,
         'email': email,
-        'password_hash': generate_password_hash(password),
+        'password_hash': password_hasher.hash(password),
         'subscription_type': None,
         'subscription_expires': None,
         'created_at': datetime.now().isoformat()
-    }
-    users.append(user_data)
-    save_users(users)
-    return User(id=user_id, username=username, email=email, password_hash=user_data['password_hash'])
+    })
+    return user_from_record(user_data)
 
 # Test management
 def get_practice_tests():
     """Load practice tests from comprehensive OET tests file"""
-    all_tests = load_json_file(OET_TESTS_FILE, [])
-    practice_tests = [t for t in all_tests if t.get('test_type') == 'practice' and not t.get('is_mock_test')]
-    if not practice_tests:
-        return load_json_file(PRACTICE_TESTS_FILE, [])
-    return practice_tests
+    return repos.tests.practice_tests()
 
 def get_full_mock_tests():
     """Load full mock tests from comprehensive OET tests file"""
-    all_tests = load_json_file(OET_TESTS_FILE, [])
-    mock_tests = [t for t in all_tests if t.get('is_mock_test', False)]
-    if not mock_tests:
-        return load_json_file(MOCK_TESTS_FILE, [])
-    return mock_tests
+    return repos.tests.mock_tests()
+
+def get_test_summary(test_id):
+    """Test fields without the (potentially large) content body"""
+    return repos.tests.get_summary(test_id)
 
 def get_test_by_id(test_id):
-    practice_tests = get_practice_tests()
-    for test in practice_tests:
-        if test['id'] == test_id:
-            test['test_type'] = 'practice'
-            return test
-    mock_tests = get_full_mock_tests()
-    for test in mock_tests:
-        if test['id'] == test_id:
-            test['test_type'] = 'mock'
-            return test
-    return None
+    test = repos.tests.get(test_id)
+    if not test:
+        return None
+    test_type = test_kind(test)
+    if test_type is None:
+        return None
+    test = test.copy()
+    test['test_type'] = test_type
+    return test
 
 # Test results management
 def get_test_results():
-    return load_json_file(TEST_RESULTS_FILE, [])
+    return repos.results.all()
+
+def get_test_result(result_id):
+    return repos.results.get(result_id)
 
 def save_test_results(results):
-    save_json_file(TEST_RESULTS_FILE, results)
+    repos.results.replace_all(results)
 
 def get_mock_test_results():
-    return load_json_file(MOCK_TEST_RESULTS_FILE, [])
+    return repos.mock_results.all()
+
+def get_mock_test_result(result_id):
+    return repos.mock_results.get(result_id)
 
 def save_mock_test_results(results):
-    save_json_file(MOCK_TEST_RESULTS_FILE, results)
+    repos.mock_results.replace_all(results)
 
-def get_user_test_results(user_id):
-    results = get_test_results()
+def get_user_test_results(user_id, limit=None, before=None):
+    """A user's results newest first, each joined with its test's title and section.
+
+    Pass ``limit`` and the id of the last result shown as ``before`` to page
+    through the history without loading all of it.
+    """
+    results = repos.results.for_user(user_id, limit=limit, before=before)
+    tests = repos.tests.get_summaries({result.get('test_id') for result in results})
     user_results = []
     for result in results:
-        if result.get('user_id') == user_id:
-            test = get_test_by_id(result.get('test_id'))
-            if test:
-                r = result.copy()
-                r['practice_test'] = {'title': test.get('title'), 'section': {'name': test.get('section')}}
-                user_results.append(r)
-    return sorted(user_results, key=lambda x: x.get('completed_at', ''), reverse=True)
+        test = tests.get(result.get('test_id'))
+        if test:
+            r = result.copy()
+            r['practice_test'] = {'title': test.get('title'), 'section': {'name': test.get('section')}}
+            user_results.append(r)
+    return user_results
+
+def count_user_test_results(user_id):
+    return repos.results.count_for_user(user_id)
+
+progress_tracker = ProgressTracker(repos.progress, repos.results, repos.tests)
+score_distributions = {'practice': ScoreDistributions(repos.results), 'mock': ScoreDistributions(repos.mock_results)}
 
 def save_test_result(user_id, test_id, score_percentage, time_taken_minutes, answers):
-    results = get_test_results()
-    result_id = get_next_id(results)
-    result = {
-        'id': result_id,
+    result = repos.results.append({
         'user_id': user_id,
         'test_id': test_id,
         'score_percentage': score_percentage,
         'time_taken_minutes': time_taken_minutes,
         'answers': answers,
         'completed_at': datetime.now().strftime('%Y-%m-%d %H:%M')
-    }
-    results.append(result)
-    save_test_results(results)
-    return result_id
+    })
+    progress_tracker.record(result)
+    score_distributions['practice'].refresh()
+    return result['id']
 
 def save_mock_test_result(user_id, test_id, score_percentage, time_taken_minutes, answers):
-    results = get_mock_test_results()
-    result_id = get_next_id(results)
-    result = {
-        'id': result_id,
+    result = repos.mock_results.append({
         'user_id': user_id,
         'test_id': test_id,
         'score_percentage': score_percentage,
         'time_taken_minutes': time_taken_minutes,
         'answers': answers,
         'completed_at': datetime.now().strftime('%Y-%m-%d %H:%M')
-    }
-    results.append(result)
-    save_mock_test_results(results)
-    return result_id
+    })
+    score_distributions['mock'].refresh()
+    return result['id']
 
 # Vocabulary management
+vocabulary_index = VocabularyIndex(VOCABULARY_FILE)
+
 def get_vocabulary_words(specialty=None):
-    words = load_json_file(VOCABULARY_FILE, [])
-    if specialty:
-        return [word for word in words if word.get('specialty', '').lower() == specialty.lower()]
-    return words
+    return vocabulary_index.words(specialty)
 
 def get_user_vocabulary_progress(user_id):
-    progress_data = load_json_file(VOCABULARY_PROGRESS_FILE, {})
-    return progress_data.get(str(user_id), {'learned_words': []})
+    return repos.vocabulary_progress.get(user_id)
+
+review_scheduler = ReviewScheduler(repos.vocabulary_reviews, repos.vocabulary_progress)
 
 def mark_word_as_learned(user_id, word_id):
-    progress_data = load_json_file(VOCABULARY_PROGRESS_FILE, {})
-    user_progress = progress_data.get(str(user_id), {'learned_words': []})
-    if word_id not in user_progress['learned_words']:
-        user_progress['learned_words'].append(word_id)
-        progress_data[str(user_id)] = user_progress
-        save_json_file(VOCABULARY_PROGRESS_FILE, progress_data)
-        return True
-    return False
+    learned = repos.vocabulary_progress.add_learned_word(user_id, word_id)
+    if learned:
+        review_scheduler.add(user_id, word_id)
+    return learned
+
+def vocabulary_entry(vocab_word):
+    return {
+        'word': vocab_word['word'],
+        'definition': vocab_word.get('definition', ''),
+        'specialty': vocab_word.get('specialty', '')
+    }
 
 def test_vocabulary_word(word):
-    vocabulary = get_vocabulary_words()
-    for vocab_word in vocabulary:
-        if vocab_word.get('word', '').lower() == word.lower():
-            return {
-                'correct': True,
-                'word': vocab_word['word'],
-                'definition': vocab_word.get('definition', ''),
-                'specialty': vocab_word.get('specialty', '')
-            }
-    return {'correct': False, 'message': f'"{word}" is not found in our medical vocabulary database.'}
+    vocab_word = vocabulary_index.lookup(word)
+    if vocab_word:
+        return dict(vocabulary_entry(vocab_word), correct=True)
+    return {
+        'correct': False,
+        'message': f'"{word}" is not found in our medical vocabulary database.',
+        'suggestions': [w['word'] for w in vocabulary_index.suggest(word)]
+    }
 
 def get_jobs():
     """Load jobs from jobs file"""
-    return load_json_file(JOBS_FILE, [])
+    return repos.jobs.all()
+
+job_board = JobBoard(repos.jobs)
+
+# Rendered public pages, revalidated against the data files they are built from
+page_cache = PageCache()
+
+def public_data_files(*paths):
+    """The files a public page depends on; None (not cached) when data lives in the database."""
+    return paths if STORAGE_BACKEND == 'json' else None
 
 # ============ Helper Functions ============
-PDF_DIR = os.path.join(app.root_path, 'testspdf')
+PDF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testspdf')
 os.makedirs(PDF_DIR, exist_ok=True)
+# Seconds a download request waits for a report that is still rendering
+PDF_RENDER_WAIT = float(os.environ.get('PDF_RENDER_WAIT', 10))
+report_service = ReportService(ReportCache(PDF_DIR))
+EXPORTS_DIR = os.path.join(PDF_DIR, 'exports')
 
 TEST_ANSWERS = {
     'Reading': {
@@ -332,95 +347,83 @@ TEST_ANSWERS = {
     }
 }
 
+scoring_engine = ScoringEngine(TEST_ANSWERS)
+
 def calculate_test_score(answers, test_section, test_data=None):
-    """Calculate test score based on correct answers"""
-    if test_section not in TEST_ANSWERS:
-        app.logger.warning(f"Section {test_section} not in test answers")
+    """Score answers against the key compiled from test_data's content.
+
+    Without test_data (or if its content has no key) the section's entry in
+    TEST_ANSWERS is used. Writing and Speaking get a provisional completion
+    score of at most 50% until a human reviewer adjusts it.
+    """
+    if test_data is not None and test_data.get('content'):
+        return scoring_engine.score(answers, test=test_data, version=repos.tests.version())
+    if scoring_engine.fallback_key(test_section) is None:
+        current_app.app.logger.warning(f"Section {test_section} not in test answers")
         return 0.0
-
-    correct_answers = TEST_ANSWERS[test_section]
-    
-    # For Writing and Speaking, require manual grading
-    if test_section in ['Writing', 'Speaking']:
-        # These sections need manual review
-        # Return a preliminary score based on completion
-        completed_tasks = sum(1 for key, value in answers.items() 
-                             if key.startswith('task_') and value.strip())
-        total_tasks = sum(1 for key in correct_answers.keys())
-        
-        if total_tasks == 0:
-            return 0.0
-        
-        # Give 50% completion score; human reviewer will adjust
-        completion_percentage = (completed_tasks / total_tasks) * 100
-        return min(50.0, completion_percentage * 0.5)  # Max 50% until human review
-    
-    # For multiple choice sections (Reading, Listening)
-    total_questions = len(correct_answers)
-    correct_count = 0
-
-    for question_key, correct_answer in correct_answers.items():
-        if question_key in answers and answers[question_key] == correct_answer:
-            correct_count += 1
-
-    score = (correct_count / total_questions) * 100 if total_questions > 0 else 0.0
-    return max(0.0, min(100.0, round(score, 1)))
+    return scoring_engine.score(answers, section=test_section)
 
 def generate_test_pdf(result, test, user_name, time_taken_minutes):
     """Generate PDF report for test results"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-
-    title = Paragraph(f"OET Test Results - {test['title']}", styles['Title'])
-    story.append(title)
-    story.append(Spacer(1, 12))
-
-    user_info = Paragraph(f"<b>Student:</b> {user_name}", styles['Normal'])
-    story.append(user_info)
-
-    completion_time = Paragraph(f"<b>Completed:</b> {result['completed_at']}", styles['Normal'])
-    story.append(completion_time)
-
-    time_taken = Paragraph(f"<b>Time Taken:</b> {time_taken_minutes} minutes", styles['Normal'])
-    story.append(time_taken)
-    story.append(Spacer(1, 12))
-
-    score = Paragraph(f"<b>Score:</b> {result['score_percentage']:.1f}%", styles['Heading2'])
-    story.append(score)
-
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    from reports import build_report  # pulls in ReportLab on first use only
+
+    payload = report_payload('test', dict(result, time_taken_minutes=time_taken_minutes), test, user_name)
+    with PDF_RENDER_SECONDS.time('inline'):
+        pdf = build_report(payload)
+    PDF_RENDERS.inc('inline', 'ok')
+    return BytesIO(pdf)
+
+def result_report_payload(kind, result):
+    test = get_test_summary(result['test_id']) or {'title': f'Test {result["test_id"]}'}
+    user = get_user_by_id(result['user_id']) if result.get('user_id') is not None else None
+    return report_payload(kind, result, test, user.username if user else 'Guest')
+
+def send_result_report(kind, result, status_endpoint):
+    """Serve a cached report, waiting briefly for a render in progress."""
+    key = report_service.request(result_report_payload(kind, result))
+    path = report_service.wait(key, PDF_RENDER_WAIT)
+    if not path:
+        response = jsonify({
+            'status': report_service.status(key),
+            'status_url': url_for(status_endpoint, result_id=result['id'])
+        })
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        return response
+    return send_file(path, mimetype='application/pdf', as_attachment=True,
+                     download_name=f'oet_{kind}_result_{result["id"]}.pdf',
+                     conditional=True, max_age=3600)
 
 # ============ Routes ============
-@app.route('/')
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
-    return redirect(url_for('login'))
+        return redirect(url_for('main.dashboard'))
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = get_user_by_email(form.email.data)
-        if user and user.password_hash and check_password_hash(user.password_hash, form.password.data):
+        try:
+            user = authenticate(form.email.data, form.password.data)
+        except PasswordHasherBusy:
+            return password_hasher_busy_page('login.html', form)
+        if user:
             login_user(user)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+            return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
         flash('Invalid email or password', 'danger')
 
     return render_template('login.html', form=form)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     form = RegisterForm()
     if form.validate_on_submit():
@@ -428,95 +431,185 @@ def register():
             flash('Email already registered', 'danger')
             return render_template('register.html', form=form)
 
-        create_user(form.username.data, form.email.data, form.password.data)
+        try:
+            create_user(form.username.data, form.email.data, form.password.data)
+        except PasswordHasherBusy:
+            return password_hasher_busy_page('register.html', form)
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html', form=form)
 
-@app.route('/logout')
+def password_hasher_busy_page(template, form):
+    """The form again with a 503, when too many sign-ins are being checked at once."""
+    flash('We are handling a lot of sign-ins right now. Please try again in a few seconds.', 'warning')
+    response = make_response(render_template(template, form=form), 503)
+    response.headers['Retry-After'] = '2'
+    return response
+
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    practice_results = get_user_test_results(current_user.id)
-    recent_tests = sorted(practice_results, key=lambda x: x.get('completed_at', ''), reverse=True)[:5]
+    stats = progress_tracker.get(current_user.id)
     vocab_progress = get_user_vocabulary_progress(current_user.id)
     vocab_learned = len(vocab_progress.get('learned_words', [])) if vocab_progress else 0
     
-    return render_template('dashboard.html', recent_tests=recent_tests, vocab_learned=vocab_learned, all_test_count=len(practice_results))
+    return render_template('dashboard.html', vocab_learned=vocab_learned, all_test_count=stats['attempts'], average_score=average(stats), day_streak=day_streak(stats))
 
-@app.route('/practice-tests')
+@bp.route('/practice-tests')
 @login_required
 def practice_tests():
     tests = get_practice_tests()
     mock_tests = get_full_mock_tests()
     return render_template('practice_tests.html', tests=tests, mock_tests=mock_tests)
 
-@app.route('/mock-tests')
+@bp.route('/mock-tests')
+@page_cache.public('mock_tests.html', public_data_files(OET_TESTS_FILE, FULL_MOCK_TESTS_FILE))
 def mock_tests():
     """Public mock tests page - accessible without login"""
     tests = get_full_mock_tests()
     return render_template('mock_tests.html', tests=tests)
 
-@app.route('/test/<int:test_id>')
+# ============ Test Drafts ============
+# In-progress answers autosaved by the test pages (static/js/draft-autosave.js), see draft_store.py
+draft_buffer = DraftBuffer(repos.drafts)
+DRAFT_MAX_ANSWERS = 500
+DRAFT_MAX_ANSWER_LENGTH = 20000  # writing tasks
+
+def is_draft_field(name):
+    """Form fields kept in drafts: question answers and written/transcribed task responses.
+
+    Recorded audio (``task_<id>_audio``, base64) is too large to autosave.
+    """
+    return name.startswith('question_') or (name.startswith('task_') and not name.endswith('_audio'))
+
+def draft_key(test_id):
+    """Drafts follow the user across devices; anonymous mock-test takers are tracked by session."""
+    if current_user.is_authenticated:
+        return f'user-{current_user.id}-test-{test_id}'
+    if 'draft_session' not in session:
+        session['draft_session'] = uuid.uuid4().hex
+    return f'anon-{session["draft_session"]}-test-{test_id}'
+
+def start_or_resume_draft(test_id):
+    key = draft_key(test_id)
+    draft = draft_buffer.get(key)
+    if draft is None:
+        draft = {'key': key, 'attempt': uuid.uuid4().hex, 'user_id': current_user.id if current_user.is_authenticated else None,
+                 'test_id': test_id, 'answers': {}, 'revision': 0, 'started_at': time.time()}
+        draft_buffer.put(draft)
+    return draft
+
+def draft_test_or_error(test_id):
+    """(test summary, None) if the current visitor may keep a draft of test_id, else (None, error response)."""
+    test = get_test_summary(test_id)
+    if not test:
+        return None, (jsonify({'error': 'Test not found'}), 404)
+    if not test.get('is_mock_test') and not current_user.is_authenticated:
+        return None, (jsonify({'error': 'Login required'}), 401)
+    return test, None
+
+@bp.route('/test/<int:test_id>')
 def take_test(test_id):
     test = get_test_by_id(test_id)
     if not test:
         flash('Test not found', 'danger')
-        return redirect(url_for('practice_tests') if current_user.is_authenticated else url_for('mock_tests'))
+        return redirect(url_for('main.practice_tests') if current_user.is_authenticated else url_for('main.mock_tests'))
 
-    session['test_start_time'] = time.time()
-    session['current_test_id'] = test_id
-    
     is_mock_test = test.get('is_mock_test', False)
-    session['mock_test'] = is_mock_test
-
     if not current_user.is_authenticated and not is_mock_test:
         flash('Please log in to take this test', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
+
+    # Opening the test again (here or on another device) resumes the attempt and its clock.
+    draft = start_or_resume_draft(test_id)
+    session['test_start_time'] = draft['started_at']
+    session['current_test_id'] = test_id
+    session['mock_test'] = is_mock_test
 
     # Route based on section
     section = test.get('section', 'Reading').lower()
-    
-    if section == 'reading':
-        return render_template('reading_test_interface.html', test=test)
-    elif section == 'listening':
-        return render_template('listening_test_interface.html', test=test)
-    elif section == 'writing':
-        return render_template('writing_test_interface.html', test=test)
-    elif section == 'speaking':
-        return render_template('speaking_test_interface.html', test=test)
-    elif section == 'all sections':
-        return render_template('mock_test_interface.html', test=test)
-    else:
-        # Default to practice test interface
-        return render_template('practice_test_interface.html', test=test)
-
-@app.route('/submit-test', methods=['POST'])
+    templates = {
+        'reading': 'reading_test_interface.html',
+        'listening': 'listening_test_interface.html',
+        'writing': 'writing_test_interface.html',
+        'speaking': 'speaking_test_interface.html',
+        'all sections': 'mock_test_interface.html',
+    }
+    # Default to practice test interface
+    return render_template(templates.get(section, 'practice_test_interface.html'), test=test, draft=draft)
+
+@bp.route('/api/drafts/<int:test_id>')
+def get_test_draft(test_id):
+    """The saved answers of the current attempt at a test."""
+    test, error = draft_test_or_error(test_id)
+    if error:
+        return error
+    draft = draft_buffer.get(draft_key(test_id))
+    if draft is None:
+        return jsonify({'error': 'No draft'}), 404
+    return jsonify({'attempt': draft['attempt'], 'answers': draft.get('answers', {}), 'revision': draft.get('revision', 0),
+                    'elapsed_seconds': int(time.time() - draft['started_at'])})
+
+@bp.route('/api/drafts/<int:test_id>', methods=['POST'])
+def save_test_draft(test_id):
+    """Autosave: {"attempt": ..., "revision": n, "answers": {"question_1": "2", "task_1": "...", ...}}.
+
+    Accepted updates are saved within seconds (202). An update for an attempt
+    that is no longer the current one, or older than the saved revision, is
+    answered with 409 and the current attempt and revision.
+    """
+    test, error = draft_test_or_error(test_id)
+    if error:
+        return error
+    # sendBeacon posts without a JSON content type
+    data = request.get_json(silent=True, force=True) or {}
+    answers = data.get('answers')
+    attempt = data.get('attempt')
+    revision = data.get('revision', 0)
+    if (not isinstance(answers, dict) or not isinstance(attempt, str) or not attempt
+            or not isinstance(revision, int) or len(answers) > DRAFT_MAX_ANSWERS
+            or not all(isinstance(k, str) and is_draft_field(k) and isinstance(v, str)
+                       and len(v) <= DRAFT_MAX_ANSWER_LENGTH for k, v in answers.items())):
+        return jsonify({'error': 'Invalid draft'}), 400
+    key = draft_key(test_id)
+    current = draft_buffer.get(key)
+    if current is None or current['attempt'] != attempt or revision < current.get('revision', 0):
+        return jsonify({'saved': False, 'error': 'Stale draft',
+                        'attempt': current['attempt'] if current else None,
+                        'revision': current.get('revision', 0) if current else None}), 409
+    draft_buffer.put({'key': key, 'attempt': attempt, 'revision': revision, 'answers': answers})
+    return jsonify({'saved': True, 'revision': revision}), 202
+
+@bp.route('/submit-test', methods=['POST'])
 def submit_test():
     test_id = session.get('current_test_id')
     if not test_id:
         flash('No active test found', 'danger')
-        return redirect(url_for('practice_tests') if current_user.is_authenticated else url_for('mock_tests'))
+        return redirect(url_for('main.practice_tests') if current_user.is_authenticated else url_for('main.mock_tests'))
 
     is_mock = bool(session.get('mock_test', False))
 
     if not is_mock and not current_user.is_authenticated:
         flash('Please log in to submit this test.', 'warning')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     test = get_test_by_id(test_id)
     if not test:
         flash('Test not found', 'danger')
-        return redirect(url_for('practice_tests'))
+        return redirect(url_for('main.practice_tests'))
 
-    answers = {}
+    # The posted form is the latest word; the draft fills in answers it lacks (e.g. from another device).
+    # Task responses in the draft only serve to restore the page, as before drafts.
+    draft = draft_buffer.get(draft_key(test_id))
+    answers = {k: v for k, v in draft.get('answers', {}).items() if k.startswith('question_')} if draft else {}
     for key, value in request.form.items():
         if key.startswith('question_'):
             answers[key] = value
@@ -524,7 +617,7 @@ def submit_test():
     test_section = test.get('section', 'Reading')
     score_percentage = calculate_test_score(answers, test_section, test)
 
-    start_time = session.get('test_start_time', time.time())
+    start_time = draft['started_at'] if draft else session.get('test_start_time', time.time())
     time_taken_seconds = int(time.time() - start_time)
     time_taken_minutes = max(1, time_taken_seconds // 60)
 
@@ -537,26 +630,27 @@ def submit_test():
     else:
         result_id = save_test_result(user_id, test_id, score_percentage, time_taken_minutes, answers)
 
+    if draft:
+        draft_buffer.finish(draft['key'], draft['attempt'])
     session.pop('test_start_time', None)
     session.pop('current_test_id', None)
     session.pop('mock_test', None)
 
     if is_mock:
-        return redirect(url_for('mock_test_results', result_id=result_id))
+        return redirect(url_for('main.mock_test_results', result_id=result_id))
     else:
-        return redirect(url_for('test_results', result_id=result_id))
+        return redirect(url_for('main.test_results', result_id=result_id))
 
-@app.route('/results/<int:result_id>')
+@bp.route('/results/<int:result_id>')
 @login_required
 def test_results(result_id):
-    all_results = get_test_results()
-    result = next((r for r in all_results if r['id'] == result_id and r.get('user_id') == current_user.id), None)
+    result = get_test_result(result_id)
 
-    if not result:
+    if not result or result.get('user_id') != current_user.id:
         flash('Test result not found', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-    test = get_test_by_id(result['test_id'])
+    test = get_test_summary(result['test_id'])
     if not test:
         test = {
             'id': result['test_id'],
@@ -565,30 +659,192 @@ def test_results(result_id):
             'description': 'Test completed'
         }
 
-    return render_template('practice_test_results.html', result=result, test=test)
+    # Start rendering the PDF now so the download link is usually instant.
+    report_service.request(result_report_payload('test', result))
+    percentile, attempts = score_distributions['practice'].percentile(result['test_id'], result['score_percentage'])
+    return render_template('practice_test_results.html', result=result, test=test,
+                           percentile=percentile, attempts=attempts)
 
-@app.route('/mock-results/<int:result_id>')
+@bp.route('/results/<int:result_id>/pdf')
+@login_required
+def download_test_pdf(result_id):
+    result = get_test_result(result_id)
+    if not result or result.get('user_id') != current_user.id:
+        flash('Test result not found', 'danger')
+        return redirect(url_for('main.dashboard'))
+    return send_result_report('test', result, 'main.test_pdf_status')
+
+@bp.route('/results/<int:result_id>/pdf/status')
+@login_required
+def test_pdf_status(result_id):
+    result = get_test_result(result_id)
+    if not result or result.get('user_id') != current_user.id:
+        return jsonify({'status': 'not_found'}), 404
+    key = report_service.request(result_report_payload('test', result))
+    return jsonify({'status': report_service.status(key), 'download_url': url_for('main.download_test_pdf', result_id=result_id)})
+
+@bp.route('/mock-results/<int:result_id>')
 def mock_test_results(result_id):
-    all_results = get_mock_test_results()
-    result = next((r for r in all_results if r['id'] == result_id), None)
+    result = get_mock_test_result(result_id)
     if not result:
         flash('Mock result not found', 'danger')
-        return redirect(url_for('mock_tests'))
-    test = get_test_by_id(result['test_id'])
-    return render_template('mock_test_results.html', result=result, test=test)
+        return redirect(url_for('main.mock_tests'))
+    test = get_test_summary(result['test_id'])
+    report_service.request(result_report_payload('mock', result))
+    percentile, attempts = score_distributions['mock'].percentile(result['test_id'], result['score_percentage'])
+    return render_template('mock_test_results.html', result=result, test=test,
+                           percentile=percentile, attempts=attempts)
+
+@bp.route('/mock-results/<int:result_id>/pdf')
+def download_mock_pdf(result_id):
+    result = get_mock_test_result(result_id)
+    if not result:
+        flash('Mock result not found', 'danger')
+        return redirect(url_for('main.mock_tests'))
+    return send_result_report('mock', result, 'main.mock_pdf_status')
 
-@app.route('/vocabulary')
+@bp.route('/mock-results/<int:result_id>/pdf/status')
+def mock_pdf_status(result_id):
+    result = get_mock_test_result(result_id)
+    if not result:
+        return jsonify({'status': 'not_found'}), 404
+    key = report_service.request(result_report_payload('mock', result))
+    return jsonify({'status': report_service.status(key), 'download_url': url_for('main.download_mock_pdf', result_id=result_id)})
+
+def superuser_required(view):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not current_user.is_super_user():
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapped
+
+@bp.route('/api/leaderboard/<int:test_id>')
 @login_required
-def vocabulary():
+def api_leaderboard(test_id):
+    """Each user's best score on a test, highest first: ?kind=practice|mock&limit=10"""
+    kind = request.args.get('kind', 'practice')
+    if kind not in score_distributions:
+        return jsonify({'error': 'kind must be practice or mock'}), 400
+    if not get_test_summary(test_id):
+        return jsonify({'error': 'test not found'}), 404
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    leaders = []
+    for rank, entry in enumerate(score_distributions[kind].leaderboard(test_id, limit), 1):
+        user = get_user_by_id(entry['user_id'])
+        leaders.append({
+            'rank': rank,
+            'username': user.username if user else None,
+            'score_percentage': entry['score_percentage'],
+            'is_you': entry['user_id'] == current_user.id,
+        })
+    attempts = score_distributions[kind].attempts(test_id)
+    return jsonify({'test_id': test_id, 'kind': kind, 'attempts': attempts, 'leaders': leaders})
+
+@bp.route('/admin/reports/export')
+@superuser_required
+def export_reports():
+    """Bulk report export.
+
+    ?users=1,2,3 and/or ?since=YYYY-MM-DD&until=YYYY-MM-DD select the results,
+    ?kind=test|mock|all picks the result sets and ?format=zip|pdf the output.
+    Poll /admin/reports/exports/<X-Export-Id> for progress.
+    """
+    export_format = request.args.get('format', 'zip')
+    kind = request.args.get('kind', 'test')
+    export_id = request.args.get('export_id') or uuid.uuid4().hex
+    try:
+        user_ids = [int(u) for u in request.args.get('users', '').split(',') if u.strip()]
+        since, until = parse_date_bounds(request.args.get('since'), request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'users must be ids and since/until ISO dates'}), 400
+    if export_format not in EXPORT_FORMATS or kind not in ('test', 'mock', 'all') or not valid_export_id(export_id):
+        return jsonify({'error': 'invalid format, kind or export_id'}), 400
+    if not user_ids and not (since or until):
+        return jsonify({'error': 'select results with users and/or since/until'}), 400
+
+    selected = []
+    for result_kind, repository in (('test', repos.results), ('mock', repos.mock_results)):
+        if kind in (result_kind, 'all'):
+            selected += [(result_kind, r) for r in select_results(repository, user_ids, since, until)]
+    if len(selected) > EXPORT_MAX_RESULTS:
+        return jsonify({'error': f'{len(selected)} results selected; the limit is {EXPORT_MAX_RESULTS}'}), 400
+    payloads = [result_report_payload(result_kind, result) for result_kind, result in selected]
+
+    if export_format == 'pdf':
+        key = report_service.request_cohort(payloads)
+        path = report_service.wait(key, PDF_RENDER_WAIT)
+        if not path:
+            response = jsonify({'status': report_service.status(key), 'retry_url': request.full_path})
+            response.status_code = 202
+            response.headers['Retry-After'] = '5'
+            return response
+        return send_file(path, mimetype='application/pdf', as_attachment=True,
+                         download_name=f'oet_reports_{export_id}.pdf', conditional=True)
+
+    progress = ExportProgress(EXPORTS_DIR, export_id, total=len(payloads))
+    rendered = report_service.render_many(payloads, timeout=EXPORT_RENDER_TIMEOUT)
+    response = Response(stream_zip(rendered, progress), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename=oet_reports_{export_id}.zip'
+    response.headers['X-Export-Id'] = export_id
+    return response
+
+@bp.route('/admin/reports/exports/<export_id>')
+@superuser_required
+def export_progress(export_id):
+    progress = ExportProgress.read(EXPORTS_DIR, export_id) if valid_export_id(export_id) else None
+    if progress is None:
+        return jsonify({'status': 'not_found'}), 404
+    return jsonify(progress)
+
+@bp.route('/admin/analytics/items')
+@superuser_required
+def item_analysis_summary():
+    """The latest analyse_items.py summary; ?test_id=1&kind=practice|mock narrows the tests."""
+    if not os.path.exists(ITEM_ANALYSIS_FILE):
+        return jsonify({'status': 'not_generated', 'hint': 'run analyse_items.py'}), 404
+    report = read_json_file(ITEM_ANALYSIS_FILE, {})
+    test_id = request.args.get('test_id', type=int)
+    kind = request.args.get('kind')
+    tests = [t for t in report.get('tests', [])
+             if (test_id is None or t['test_id'] == test_id) and (kind is None or t['kind'] == kind)]
+    return jsonify(dict(report, tests=tests))
+
+def vocabulary_page_args():
     specialty = request.args.get('specialty', 'all')
-    words = get_vocabulary_words(specialty if specialty != 'all' else None)
-    vocab_progress = get_user_vocabulary_progress(current_user.id)
-    learned_word_ids = vocab_progress.get('learned_words', [])
-    all_words = get_vocabulary_words()
-    specialties = sorted(set(word.get('specialty') for word in all_words if word.get('specialty')))
-    return render_template('vocabulary.html', words=words, learned_word_ids=learned_word_ids, specialties=[(s,) for s in specialties], selected_specialty=specialty)
+    after = request.args.get('after', type=int)
+    limit = min(max(request.args.get('limit', VOCABULARY_PAGE_SIZE, type=int), 1), 200)
+    return specialty, after, limit
 
-@app.route('/vocabulary-test', methods=['POST'])
+@bp.route('/vocabulary')
+@login_required
+def vocabulary():
+    specialty, after, limit = vocabulary_page_args()
+    selected = specialty if specialty != 'all' else None
+    words, next_after = vocabulary_index.page(selected, after, limit)
+    learned_word_ids = set(get_user_vocabulary_progress(current_user.id).get('learned_words', []))
+    return render_template('vocabulary.html', words=words, learned_word_ids=learned_word_ids,
+                           learned_count=len(learned_word_ids), total_words=vocabulary_index.count(selected),
+                           specialties=vocabulary_index.facets(), selected_specialty=specialty,
+                           next_after=next_after, first_page=after is None)
+
+@bp.route('/api/vocabulary')
+@login_required
+def api_vocabulary():
+    """Page through the vocabulary: ?specialty=Cardiology&limit=60&after=<last word id>"""
+    specialty, after, limit = vocabulary_page_args()
+    selected = specialty if specialty != 'all' else None
+    words, next_after = vocabulary_index.page(selected, after, limit)
+    learned_word_ids = set(get_user_vocabulary_progress(current_user.id).get('learned_words', []))
+    return jsonify({
+        'words': [dict(word, learned=word.get('id') in learned_word_ids) for word in words],
+        'total': vocabulary_index.count(selected),
+        'next_after': next_after,
+        'facets': [{'specialty': name, 'count': count} for name, count in vocabulary_index.facets()],
+    })
+
+@bp.route('/vocabulary-test', methods=['POST'])
 @login_required
 def vocabulary_test():
     data = request.get_json()
@@ -596,84 +852,337 @@ def vocabulary_test():
     result = test_vocabulary_word(word)
     return jsonify(result)
 
-@app.route('/mark-word-learned/<int:word_id>', methods=['POST'])
+@bp.route('/vocabulary/autocomplete')
+@login_required
+def vocabulary_autocomplete():
+    prefix = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 10)
+    return jsonify({'words': [vocabulary_entry(w) for w in vocabulary_index.autocomplete(prefix, limit)]})
+
+@bp.route('/vocabulary/review')
+@login_required
+def vocabulary_review():
+    """The next learned words due for review: ?limit=10"""
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    words = []
+    for word_id, state in review_scheduler.due(current_user.id, limit):
+        vocab_word = vocabulary_index.get(word_id)
+        if vocab_word:
+            words.append(dict(vocabulary_entry(vocab_word), id=word_id, review=state))
+    return jsonify({'words': words, 'next_due': None if words else review_scheduler.next_due(current_user.id)})
+
+@bp.route('/vocabulary/review/<int:word_id>', methods=['POST'])
+@login_required
+def review_word(word_id):
+    """Grade a review with JSON {"quality": 0-5} (0 = forgot, 5 = instant recall)."""
+    data = request.get_json(silent=True) or {}
+    quality = data.get('quality')
+    if not isinstance(quality, int) or not 0 <= quality <= 5:
+        return jsonify({'error': 'quality must be an integer from 0 to 5'}), 400
+    if not vocabulary_index.get(word_id):
+        return jsonify({'error': 'word not found'}), 404
+    state = review_scheduler.review(current_user.id, word_id, quality)
+    return jsonify({'word_id': word_id, 'review': state})
+
+@bp.route('/mark-word-learned/<int:word_id>', methods=['POST'])
 @login_required
 def mark_word_learned(word_id):
     success = mark_word_as_learned(current_user.id, word_id)
     return jsonify({'success': success})
 
-@app.route('/subscription')
+@bp.route('/subscription')
 @login_required
 def subscription():
     return render_template('subscription.html')
 
 
+CHAT_PAGE_SIZE = int(os.environ.get('CHAT_PAGE_SIZE', 50))
+CHAT_KEEPALIVE_SECONDS = float(os.environ.get('CHAT_KEEPALIVE_SECONDS', 15))
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# so a worker thread is never held by one tab indefinitely.
+CHAT_STREAM_MAX_SECONDS = float(os.environ.get('CHAT_STREAM_MAX_SECONDS', 300))
+
+chat_notifier = ChatNotifier(repos.chat.latest_id)
+
+
 def get_chat_messages(user_id):
     """Return chat messages for a user as a list."""
-    data = load_json_file(CHAT_MESSAGES_FILE, {})
-    return data.get(str(user_id), [])
+    return repos.chat.messages(user_id)
 
 
 def save_chat_messages(user_id, messages):
-    data = load_json_file(CHAT_MESSAGES_FILE, {})
-    data[str(user_id)] = messages
-    save_json_file(CHAT_MESSAGES_FILE, data)
+    repos.chat.replace(user_id, messages)
+
+
+def add_chat_message(user_id, message):
+    stored = repos.chat.append(user_id, message)
+    chat_notifier.notify(user_id, stored['id'])
+    return stored
 
 
-@app.route('/chat')
+def chat_message_json(message):
+    return {key: message.get(key) for key in ('id', 'message', 'timestamp', 'is_admin_reply')}
+
+
+@bp.route('/chat')
 @login_required
 def chat():
-    messages = get_chat_messages(current_user.id)
-    return render_template('chat.html', messages=messages)
+    messages = repos.chat.page(current_user.id, CHAT_PAGE_SIZE)
+    return render_template('chat.html', messages=messages, page_size=CHAT_PAGE_SIZE)
 
 
-@app.route('/send_message', methods=['POST'])
+@bp.route('/api/chat/messages')
+@login_required
+def api_chat_messages():
+    """The newest messages, oldest first: ?limit=50&before=<oldest id already shown>"""
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), 200)
+    before = request.args.get('before', type=int)
+    messages = repos.chat.page(current_user.id, limit, before)
+    return jsonify({
+        'messages': [chat_message_json(m) for m in messages],
+        'before': messages[0]['id'] if len(messages) == limit else None,
+    })
+
+
+@bp.route('/chat/stream')
+@login_required
+def chat_stream():
+    """Server-Sent Events: every message after Last-Event-ID (or ?after=<id>)."""
+    user_id = current_user.id
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('after', type=int)
+    if last_id is None:
+        last_id = repos.chat.latest_id(user_id)
+
+    def events(last_id):
+        deadline = time.monotonic() + CHAT_STREAM_MAX_SECONDS
+        yield 'retry: 3000\n\n'
+        while True:
+            for message in repos.chat.since(user_id, last_id):
+                last_id = message['id']
+                yield f"id: {last_id}\nevent: message\ndata: {json.dumps(chat_message_json(message))}\n\n"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not chat_notifier.wait(user_id, last_id, min(CHAT_KEEPALIVE_SECONDS, remaining)):
+                yield ': keepalive\n\n'
+
+    response = Response(stream_with_context(events(last_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/send_message', methods=['POST'])
 @login_required
 def send_message():
     msg = request.form.get('message', '').strip()
     if not msg:
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': 'Message cannot be empty'}), 400
         flash('Message cannot be empty', 'warning')
-        return redirect(url_for('chat'))
-    messages = get_chat_messages(current_user.id)
-    messages.append({
+        return redirect(url_for('main.chat'))
+    stored = add_chat_message(current_user.id, {
         'message': msg,
         'timestamp': datetime.now().isoformat(sep=' ', timespec='seconds'),
         'is_admin_reply': False
     })
-    save_chat_messages(current_user.id, messages)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(chat_message_json(stored))
     flash('Message sent. Support will reply soon.', 'success')
-    return redirect(url_for('chat'))
+    return redirect(url_for('main.chat'))
+
+
+@bp.route('/admin/chat/<int:user_id>/reply', methods=['POST'])
+@superuser_required
+def admin_chat_reply(user_id):
+    """Reply to a user's conversation; form or JSON field ``message``."""
+    data = request.get_json(silent=True) or request.form
+    msg = (data.get('message') or '').strip()
+    if not msg:
+        return jsonify({'error': 'Message cannot be empty'}), 400
+    if not get_user_by_id(user_id):
+        return jsonify({'error': 'user not found'}), 404
+    stored = add_chat_message(user_id, {
+        'message': msg,
+        'timestamp': datetime.now().isoformat(sep=' ', timespec='seconds'),
+        'is_admin_reply': True
+    })
+    return jsonify(chat_message_json(stored))
 
-@app.route('/consultation')
+@bp.route('/consultation')
+@page_cache.public('consultation.html')
 def consultation():
     return render_template('consultation.html')
 
-@app.route('/materials')
+@bp.route('/materials')
+@page_cache.public('materials.html')
 def materials():
     return render_template('materials.html')
 
-@app.route('/jobs')
+def job_search_args():
+    query = request.args.get('q', '').strip()
+    filters = {name: request.args.get(name, '').strip() for name in JOB_FILTERS}
+    cursor = request.args.get('cursor') or None
+    limit = min(max(request.args.get('limit', JOB_PAGE_SIZE, type=int), 1), 100)
+    return query, filters, cursor, limit
+
+def search_jobs():
+    query, filters, cursor, limit = job_search_args()
+    try:
+        listings, total, next_cursor = job_board.search(query, filters, cursor, limit)
+    except ValueError:
+        abort(400)
+    return query, filters, cursor, listings, total, next_cursor
+
+@bp.route('/jobs')
+@page_cache.public('jobs.html', public_data_files(JOBS_FILE))
 def jobs():
-    jobs_list = get_jobs()
-    return render_template('jobs.html', jobs=jobs_list)
+    query, filters, cursor, listings, total, next_cursor = search_jobs()
+    search_params = {name: value for name, value in dict(filters, q=query).items() if value}
+    return render_template('jobs.html', jobs=listings, total=total, next_cursor=next_cursor,
+                           first_page=cursor is None, query=query, filters=filters,
+                           search_params=search_params, facets=job_board.facets())
+
+@bp.route('/jobs/<int:job_id>')
+@page_cache.public('job_detail.html', public_data_files(JOBS_FILE))
+def job_detail(job_id):
+    job = job_board.get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('job_detail.html', job=job)
+
+@bp.route('/api/jobs')
+def api_jobs():
+    """Search the job board: ?q=nurse&location=Sydney&job_type=Full-time&limit=24&cursor=<next_cursor>"""
+    query, filters, cursor, listings, total, next_cursor = search_jobs()
+    return jsonify({
+        'jobs': list(listings),
+        'total': total,
+        'next_cursor': next_cursor,
+        'facets': {name: [{'value': value, 'count': count} for value, count in values]
+                   for name, values in job_board.facets().items()},
+    })
 
-@app.route('/progress')
+@bp.route('/progress')
 @login_required
 def progress():
-    test_results = get_user_test_results(current_user.id)
+    stats = progress_tracker.get(current_user.id)
     vocab_progress = get_user_vocabulary_progress(current_user.id)
     vocab_count = len(vocab_progress.get('learned_words', [])) if vocab_progress else 0
-    total_vocab = len(get_vocabulary_words())
-    return render_template('progress.html', test_results=test_results, vocab_count=vocab_count, total_vocab=total_vocab)
+    total_vocab = vocabulary_index.count()
+    sections = [(name, average(totals), totals['attempts']) for name, totals in stats['sections'].items()]
+    trend = [(day, round(total / attempts, 1)) for day, attempts, total in stats['trend']]
+    return render_template('progress.html', stats=stats, average_score=average(stats), sections=sections,
+                           trend=trend, vocab_count=vocab_count, total_vocab=total_vocab)
 
-@app.errorhandler(404)
+@bp.route('/api/test-results')
+@login_required
+def api_test_results():
+    """Page through the current user's results: ?limit=20&before=<last result id>"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    before = request.args.get('before', type=int)
+    results = get_user_test_results(current_user.id, limit=limit, before=before)
+    for result in results:
+        result.pop('answers', None)
+    next_before = results[-1]['id'] if len(results) == limit else None
+    return jsonify({'results': results, 'next_before': next_before})
+
+# ============ Metrics ============
+# Per-process metric files, summed by /metrics across gunicorn workers (see metrics.py)
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(DATA_DIR, 'metrics'))
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Requests slower than this many seconds are logged and counted
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+slow_request_logger = logging.getLogger('oet.slow_requests')
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    # The route name, not the path, so ids in URLs do not create new series
+    endpoint = request.endpoint or 'unmatched'
+    HTTP_REQUESTS.inc(request.method, endpoint, str(response.status_code))
+    HTTP_REQUEST_SECONDS.observe(elapsed, request.method, endpoint)
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        HTTP_SLOW_REQUESTS.inc(request.method, endpoint)
+        user_id = current_user.id if current_user.is_authenticated else None
+        slow_request_logger.warning(f'Slow request: {request.method} {request.full_path.rstrip("?")} '
+                                    f'({endpoint}) -> {response.status_code} in {elapsed:.3f}s, user {user_id}')
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    """Request, storage and PDF metrics of all workers in the Prometheus text format."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        abort(403)
+    response = Response(metrics_registry.render(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.app_errorhandler(404)
 def page_not_found(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(StorageBusyError)
+def storage_busy(error):
+    current_app.app.logger.warning(f'Storage busy: {error}')
+    return render_template('errors/500.html'), 503
+
+@bp.app_errorhandler(500)
 def internal_server_error(error):
-    app.logger.error(f'Server Error: {error}')
+    current_app.app.logger.error(f'Server Error: {error}')
     return render_template('errors/500.html'), 500
 
+# ============ App Factory ============
+def warm_up(app):
+    """Compile every template, build the data snapshots and load the read-mostly indexes.
+
+    Run before gunicorn forks (``--preload``) so workers share the result
+    instead of each paying for it on their first requests.
+    """
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    if STORAGE_BACKEND == 'json':
+        # Database connections must not be opened before fork, so the SQL backend warms up lazily.
+        get_practice_tests()
+        vocabulary_index.count()
+        job_board.facets()
+
+def create_app(config=None):
+    """Return a new app configured for a profile (see config.py), warmed up.
+
+    config is a profile name ('production', 'development'), a config class,
+    or a dict of overrides on top of the APP_ENV profile. Serve it with:
+
+        gunicorn --preload -w 4 -k gthread --threads 8 'main:create_app()'
+    """
+    app = Flask(__name__)
+    if isinstance(config, dict):
+        app.config.from_object(get_config())
+        app.config.update(config)
+    else:
+        app.config.from_object(get_config(config))
+    # The test interfaces number options with enumerate()
+    app.jinja_env.globals['enumerate'] = enumerate
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    if not app.debug and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        app.logger.warning('SESSION_SECRET is not set; sessions are signed with the development key')
+    # In the gunicorn master with --preload, so workers inherit it and a server restart resets the counters.
+    metrics_registry.start(METRICS_DIR)
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app('development').run(host='0.0.0.0', port=5000)
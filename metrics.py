@@ -0,0 +1,373 @@
+"""Counters and histograms for the /metrics endpoint, summed across workers.
+
+Every process records into its own in-memory registry (a dict update under a
+lock, so instrumenting a hot path is cheap). Once ``registry.start(directory)``
+has been called, a background thread writes the process's totals to
+``<directory>/<pid>-<start time>.json`` every ``METRICS_FLUSH_INTERVAL``
+seconds, and ``/metrics`` adds up the files of all processes - gunicorn
+workers, including ones that have since exited, whose counts must not
+vanish from counters. Files of exited processes are merged into one
+``accumulated.json`` as they are found. ``start`` clears the directory when
+no other process is running on it, so counters restart with the server.
+
+Output is the Prometheus text exposition format. The metrics the app records
+are declared at the bottom of this module.
+"""
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: merges are only serialised within this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+# Seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Totals of processes that have exited, merged from their files
+ACCUMULATED_FILE = 'accumulated.json'
+# Seconds (at least ten flush intervals) after which a file no longer counts as a running process's
+STALE_AFTER = 60.0
+
+
+class _Metric:
+    def __init__(self, registry, name, kind, help_text, labels, buckets=None):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+
+
+class Counter(_Metric):
+    def inc(self, *labels, amount=1):
+        self.registry._add(self.name, labels, amount)
+
+
+class Histogram(_Metric):
+    def observe(self, value, *labels):
+        self.registry._observe(self.name, self.buckets, labels, value)
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running, as another user
+    return True
+
+
+def _read_snapshots(paths):
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # missing, replaced or half-written; counted on the next scrape
+    return snapshots
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._started = time.time()
+        self.directory = None
+        self.flush_interval = METRICS_FLUSH_INTERVAL
+        self._flusher = None
+        self._flusher_pid = None
+
+    def counter(self, name, help_text, labels=()):
+        return self._declare(Counter(self, name, 'counter', help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._declare(Histogram(self, name, 'histogram', help_text, labels, buckets))
+
+    def _declare(self, metric):
+        self._metrics[metric.name] = metric
+        self._values.setdefault(metric.name, {})
+        return metric
+
+    def _check_fork(self):
+        # A forked worker starts from zero; the parent's counts stay in the parent's file.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._started = time.time()
+            self._values = {name: {} for name in self._metrics}
+            if self.directory is not None:
+                self._start_flusher()
+
+    def _add(self, name, labels, amount):
+        with self._lock:
+            self._check_fork()
+            values = self._values[name]
+            values[labels] = values.get(labels, 0) + amount
+
+    def _observe(self, name, buckets, labels, value):
+        with self._lock:
+            self._check_fork()
+            values = self._values[name]
+            state = values.get(labels)
+            if state is None:
+                # Per-bucket counts (not cumulative), then sum and count.
+                state = values[labels] = [0] * (len(buckets) + 1) + [0.0, 0]
+            state[bisect.bisect_left(buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        """{metric name: [[label values, value]]} for this process."""
+        with self._lock:
+            self._check_fork()
+            return {name: [[list(labels), value if not isinstance(value, list) else list(value)]
+                           for labels, value in values.items()]
+                    for name, values in self._values.items()}
+
+    # ---- sharing between processes ----
+    def start(self, directory, flush_interval=None):
+        """Write this process's metrics to directory; forked workers follow on their first record.
+
+        If no other running process writes to directory, the server has
+        restarted: its old files are removed so counters start again from zero.
+        """
+        self.directory = directory
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        with self._directory_lock():
+            files = list(self._process_files())
+            if any(alive for _, alive in files):
+                self._merge_exited(files)
+            else:
+                for name in os.listdir(directory):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(directory, name))
+            # Written now, so processes starting after this one see it running.
+            self.flush()
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        self._start_flusher()
+
+    def _start_flusher(self):
+        # Threads do not survive fork, so each worker starts its own on first use.
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing metrics to %s failed', self.directory)
+
+    def _path(self):
+        return os.path.join(self.directory, f'{os.getpid()}-{int(self._started * 1000)}.json')
+
+    @contextmanager
+    def _directory_lock(self):
+        if fcntl is None:
+            with self._merge_lock:
+                yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _process_files(self):
+        """(path, running) of the other processes' files in the directory."""
+        own = os.path.basename(self._path())
+        # A running process rewrites its file every flush interval; an old file whose pid is
+        # running again belongs to an earlier process (pids repeat across container restarts).
+        stale_after = max(STALE_AFTER, 10 * self.flush_interval)
+        now = time.time()
+        for name in os.listdir(self.directory):
+            pid = name.partition('-')[0]
+            if not name.endswith('.json') or not pid.isdigit() or name == own:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                age = now - os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            yield path, age < stale_after and _running(int(pid))
+
+    def _merge_exited(self, files):
+        """Add the files of exited processes into ACCUMULATED_FILE; the caller holds the directory lock."""
+        exited = [path for path, running in files if not running]
+        if not exited:
+            return
+        accumulated_path = os.path.join(self.directory, ACCUMULATED_FILE)
+        totals = self._sum(_read_snapshots([accumulated_path] + exited))
+        snapshot = {name: [[list(labels), value] for labels, value in series.items()]
+                    for name, series in totals.items()}
+        tmp_path = f'{accumulated_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, accumulated_path)
+        for path in exited:
+            os.remove(path)
+
+    def flush(self):
+        if self.directory is None:
+            return
+        snapshot = self.snapshot()
+        path = self._path()
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """{metric name: {label values: value}} summed over every process sharing the directory."""
+        if self.directory is None:
+            return self._sum([self.snapshot()])
+        self.flush()
+        with self._directory_lock():
+            self._merge_exited(list(self._process_files()))
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.json')]
+            return self._sum(_read_snapshots(paths))
+
+    def _sum(self, snapshots):
+        totals = {name: {} for name in self._metrics}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                if name not in totals:
+                    continue
+                merged = totals[name]
+                for labels, value in series:
+                    key = tuple(labels)
+                    current = merged.get(key)
+                    if current is None:
+                        merged[key] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list):
+                        merged[key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[key] = current + value
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        totals = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in sorted(totals[name].items()):
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_format_labels(metric.labels, labels)} {_format_number(value)}')
+                    continue
+                cumulative = 0
+                bounds = [_format_number(float(b)) for b in metric.buckets] + ['+Inf']
+                for bound, count in zip(bounds, value[:-2]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{_format_labels(metric.labels, labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(metric.labels, labels)} {_format_number(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(metric.labels, labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# ---- HTTP ----
+HTTP_REQUESTS = registry.counter(
+    'oet_http_requests_total', 'HTTP requests by endpoint and status.', ('method', 'endpoint', 'status'))
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'oet_http_request_duration_seconds', 'Time to produce a response (streamed bodies excluded).',
+    ('method', 'endpoint'))
+HTTP_SLOW_REQUESTS = registry.counter(
+    'oet_http_slow_requests_total', 'Requests slower than SLOW_REQUEST_SECONDS.', ('method', 'endpoint'))
+
+# ---- storage.py ----
+STORAGE_READS = registry.counter(
+    'oet_storage_reads_total', 'JSON file reads by function.', ('operation',))
+STORAGE_CACHE = registry.counter(
+    'oet_storage_cache_total', 'Parsed-file cache lookups by result (hit, miss, reparse).', ('result',))
+STORAGE_READ_BYTES = registry.counter(
+    'oet_storage_read_bytes_total', 'Bytes of JSON parsed from disk.')
+STORAGE_PARSE_SECONDS = registry.histogram(
+    'oet_storage_parse_seconds', 'Time to read and parse a JSON file on a cache miss.')
+STORAGE_WRITES = registry.counter(
+    'oet_storage_writes_total', 'Atomic JSON file writes.')
+STORAGE_WRITE_BYTES = registry.counter(
+    'oet_storage_write_bytes_total', 'Bytes of JSON written.')
+STORAGE_WRITE_SECONDS = registry.histogram(
+    'oet_storage_write_seconds', 'Time to serialise, write (and fsync) and rename a JSON file.')
+STORAGE_LOCK_WAIT_SECONDS = registry.histogram(
+    'oet_storage_lock_wait_seconds', 'Time spent waiting for a data file lock.')
+
+# ---- snapshot.py ----
+SNAPSHOT_BUILDS = registry.counter(
+    'oet_snapshot_builds_total', 'Shared data snapshots compiled, by snapshot.', ('name',))
+SNAPSHOT_BUILD_SECONDS = registry.histogram(
+    'oet_snapshot_build_seconds', 'Time to compile a shared data snapshot from its source file.', ('name',),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+# ---- passwords.py ----
+PASSWORD_OPERATIONS = registry.counter(
+    'oet_password_operations_total', 'Password hashes and verifications by outcome (ok, rejected, timeout).',
+    ('operation', 'outcome'))
+PASSWORD_SECONDS = registry.histogram(
+    'oet_password_seconds', 'Time a request spent on a password hash or verification, queueing included.',
+    ('operation',), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+# ---- draft_store.py ----
+DRAFT_UPDATES = registry.counter(
+    'oet_draft_updates_total', 'Draft autosaves received (before coalescing).')
+DRAFT_WRITES = registry.counter(
+    'oet_draft_writes_total', 'Draft updates written to storage (after coalescing).')
+DRAFT_FLUSH_SECONDS = registry.histogram(
+    'oet_draft_flush_seconds', 'Time to write one batch of draft updates.')
+
+# ---- reports.py ----
+PDF_RENDERS = registry.counter(
+    'oet_pdf_renders_total', 'PDF renders by kind (report, cohort, inline) and outcome.', ('kind', 'outcome'))
+PDF_RENDER_SECONDS = registry.histogram(
+    'oet_pdf_render_seconds', 'Time from queueing a PDF render until its file is written.', ('kind',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
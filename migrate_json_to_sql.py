@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""One-shot import of the JSON files in data/ into the SQL backend.
+
+Usage:
+    python migrate_json_to_sql.py [--data-dir data] [--database-url URL]
+                                  [--batch-size 1000] [--replace]
+
+Files are read incrementally (results also replay their journals) and inserted
+in batches, so large result histories never have to fit in memory. Tables
+that already contain rows are skipped unless --replace is given, in which
+case they are emptied first. Afterwards run the app with STORAGE_BACKEND=sql.
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+from itertools import islice
+
+from sqlalchemy import select, delete, func, insert, text
+
+from storage import iter_json_array, iter_json_object
+from results_store import iter_records
+from sql_repositories import (
+    create_sql_engine, users_table, tests_table, test_results_table, mock_test_results_table,
+    vocabulary_progress_table, vocabulary_reviews_table, chat_messages_table, jobs_table,
+    user_row, test_row, result_row, review_row, chat_row, job_row,
+)
+
+logger = logging.getLogger('migrate_json_to_sql')
+
+
+def iter_array_file(path):
+    if not os.path.exists(path):
+        return
+    yield from iter_json_array(path)
+
+
+def iter_user_files(directory, suffix):
+    """(user_id, path) of the per-user files in directory."""
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+            yield int(name[:-len(suffix)]), os.path.join(directory, name)
+
+
+def iter_json_lines(path):
+    """The values of a JSON-lines log, skipping blank, corrupt and torn final lines."""
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')[:-1]  # a torn final line has no newline yet
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            logger.warning('Skipping corrupt line in %s', path)
+
+
+def iter_vocabulary_progress_rows(directory, legacy_path):
+    """Learned words from the per-user logs, then users only in the old vocabulary_progress.json."""
+    migrated = set()
+    for user_id, path in iter_user_files(directory, '.jsonl'):
+        migrated.add(user_id)
+        for position, word_id in enumerate(dict.fromkeys(iter_json_lines(path))):
+            yield {'user_id': user_id, 'word_id': word_id, 'position': position}
+    if not os.path.exists(legacy_path):
+        return
+    for user_id, progress in iter_json_object(legacy_path):
+        if int(user_id) in migrated:
+            continue
+        for position, word_id in enumerate(dict.fromkeys(progress.get('learned_words', []))):
+            yield {'user_id': int(user_id), 'word_id': word_id, 'position': position}
+
+
+def iter_vocabulary_review_rows(directory, legacy_path):
+    """Review states from the per-user files, then users only in the old vocabulary_reviews.json."""
+    migrated = set()
+    for user_id, path in iter_user_files(directory, '.json'):
+        migrated.add(user_id)
+        with open(path, encoding='utf-8') as f:
+            states = json.load(f)
+        for word_id, state in states.items():
+            yield review_row(user_id, word_id, state)
+    if not os.path.exists(legacy_path):
+        return
+    for user_id, states in iter_json_object(legacy_path):
+        if int(user_id) in migrated:
+            continue
+        for word_id, state in states.items():
+            yield review_row(user_id, word_id, state)
+
+
+def iter_chat_rows(directory, legacy_path):
+    """Messages from the per-user logs, then conversations only in the old chat_messages.json."""
+    migrated = set()
+    for user_id, path in iter_user_files(directory, '.jsonl'):
+        migrated.add(user_id)
+        for message in iter_json_lines(path):
+            yield chat_row(user_id, message)
+    if not os.path.exists(legacy_path):
+        return
+    for user_id, messages in iter_json_object(legacy_path):
+        if int(user_id) in migrated:
+            continue
+        for message in messages:
+            yield chat_row(user_id, message)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_table(engine, table, rows, batch_size, replace):
+    with engine.begin() as conn:
+        existing = conn.execute(select(func.count()).select_from(table)).scalar()
+        if existing and not replace:
+            logger.warning('Skipping %s: already has %d rows (use --replace to overwrite)', table.name, existing)
+            return 0
+        if existing:
+            conn.execute(delete(table))
+    total = 0
+    for batch in batched(rows, batch_size):
+        with engine.begin() as conn:
+            conn.execute(insert(table), batch)
+        total += len(batch)
+        logger.info('%s: %d rows', table.name, total)
+    return total
+
+
+def reset_sequences(engine, tables):
+    """Move PostgreSQL id sequences past the ids copied from JSON."""
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {table.name}), 0) + 1, false)"
+            ))
+
+
+def migrate(data_dir, database_url, batch_size=1000, replace=False):
+    engine = create_sql_engine(database_url)
+    path = lambda name: os.path.join(data_dir, name)
+    plan = [
+        (users_table, (user_row(r) for r in iter_array_file(path('users.json')))),
+        (tests_table, (test_row(r) for r in iter_array_file(path('oet_tests.json')))),
+        (test_results_table, (result_row(r) for r in iter_records(path('test_results.json')))),
+        (mock_test_results_table, (result_row(r) for r in iter_records(path('mocktests_results.json')))),
+        (vocabulary_progress_table,
+         iter_vocabulary_progress_rows(path('vocabulary_progress'), path('vocabulary_progress.json'))),
+        (vocabulary_reviews_table,
+         iter_vocabulary_review_rows(path('vocabulary_reviews'), path('vocabulary_reviews.json'))),
+        (chat_messages_table, iter_chat_rows(path('chat'), path('chat_messages.json'))),
+        (jobs_table, (job_row(r) for r in iter_array_file(path('jobs.json')))),
+    ]
+    counts = {}
+    for table, rows in plan:
+        counts[table.name] = import_table(engine, table, rows, batch_size, replace)
+    reset_sequences(engine, [users_table, test_results_table, mock_test_results_table, chat_messages_table])
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import data/*.json into the SQL storage backend.')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--replace', action='store_true', help='empty tables that already contain rows')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(os.path.join(args.data_dir, 'oet.db'))
+    counts = migrate(args.data_dir, database_url, args.batch_size, args.replace)
+    for name, count in counts.items():
+        print(f'{name}: {count} rows imported')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""HTTP caching for public pages that look the same to every anonymous visitor.
+
+Pages such as /mock-tests and /jobs depend only on a few data files and their
+templates. ``PageCache.public`` wraps such a view: the response's ETag is a
+hash of the URL and the (mtime, size, inode) of those files and templates,
+Last-Modified is the newest of their mtimes, and a request carrying a
+matching If-None-Match / If-Modified-Since gets a 304 without rendering.
+Anonymous responses are marked cacheable by browsers and shared caches
+(``Cache-Control: public`` with ``s-maxage`` and ``stale-while-revalidate``
+for a CDN, ``Vary: Cookie``) and the rendered body is kept in an in-process
+LRU keyed by the ETag, so editing oet_tests.json or jobs.json changes the key
+and the next request renders the page again.
+
+Signed-in users see their own navigation, and a pending flash message is
+shown once, so those responses are rendered normally and marked private.
+"""
+
+import os
+import hashlib
+import threading
+from functools import wraps
+from datetime import datetime, timezone
+from collections import OrderedDict
+
+from flask import request, session, current_app, make_response
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 256))
+# Browser and shared-cache (CDN) lifetimes of public pages, in seconds
+PUBLIC_PAGE_MAX_AGE = int(os.environ.get('PUBLIC_PAGE_MAX_AGE', 60))
+PUBLIC_PAGE_SHARED_MAX_AGE = int(os.environ.get('PUBLIC_PAGE_SHARED_MAX_AGE', 300))
+PUBLIC_PAGE_STALE_SECONDS = int(os.environ.get('PUBLIC_PAGE_STALE_SECONDS', 60))
+# Templates every public page extends
+LAYOUT_TEMPLATES = ('base.html',)
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class PageCache:
+    def __init__(self, max_entries=PAGE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, etag):
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+
+    def put(self, etag, body):
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
+
+    @staticmethod
+    def validators(template, data_files):
+        """(ETag, Last-Modified) of the current URL rendered from template and data_files."""
+        template_dir = os.path.join(current_app.root_path, current_app.template_folder)
+        paths = [os.path.join(template_dir, name) for name in (template,) + LAYOUT_TEMPLATES] + list(data_files)
+        signatures = [file_signature(path) for path in paths]
+        digest = hashlib.sha1(repr((request.full_path, signatures)).encode()).hexdigest()[:32]
+        newest = max((sig[0] for sig in signatures if sig), default=0)
+        # HTTP dates have one-second resolution
+        return digest, datetime.fromtimestamp(newest // 1_000_000_000, tz=timezone.utc)
+
+    def public(self, template, data_files=()):
+        """Decorator for a view that renders template from data_files only.
+
+        ``data_files=None`` means the data does not live in files (the SQL
+        backend); the view is then rendered on every request as before.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if (data_files is None or request.method not in ('GET', 'HEAD')
+                        or current_user.is_authenticated or session.get('_flashes')):
+                    response = make_response(view(*args, **kwargs))
+                    if data_files is not None:
+                        response.headers['Cache-Control'] = 'private, no-cache'
+                    return response
+
+                etag, last_modified = self.validators(template, data_files)
+                if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                    with self._lock:
+                        self.not_modified += 1
+                    response = make_response('', 304)
+                else:
+                    body = self.get(etag)
+                    with self._lock:
+                        if body is None:
+                            self.misses += 1
+                        else:
+                            self.hits += 1
+                    if body is None:
+                        response = make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        body = response.get_data()
+                        self.put(etag, body)
+                    else:
+                        response = make_response(body)
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.cache_control.public = True
+                response.cache_control.max_age = PUBLIC_PAGE_MAX_AGE
+                response.cache_control.s_maxage = PUBLIC_PAGE_SHARED_MAX_AGE
+                response.headers['Cache-Control'] += f', stale-while-revalidate={PUBLIC_PAGE_STALE_SECONDS}'
+                response.vary.add('Cookie')
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,156 @@
+"""Password hashing and verification off the request thread.
+
+Werkzeug's KDFs are deliberately slow (scrypt takes ~0.1-0.2 s of CPU per
+call), so a burst of sign-ins at the start of an exam would otherwise keep
+every web worker busy hashing. ``PasswordHasher`` runs them on a small
+process pool (``PASSWORD_WORKERS``) and admits at most
+``PASSWORD_QUEUE_DEPTH`` of them at a time, per web worker. Any call past
+that limit, or one still waiting after ``PASSWORD_WAIT`` seconds, raises
+``PasswordHasherBusy`` straight away. The route then answers 503 and the
+worker's threads stay free for other pages.
+
+``PASSWORD_HASH_METHOD`` is any Werkzeug method string
+(``scrypt:32768:8:1``, ``pbkdf2:sha256:600000``). Stored hashes made
+with different parameters still verify, and ``needs_rehash`` tells the login
+view to store a fresh hash. That way a cost change reaches every account as
+its owner signs in. ``PASSWORD_WORKERS=0`` hashes inline, without a queue
+limit.
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import PASSWORD_OPERATIONS, PASSWORD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 2))
+# Hash/verify calls admitted at once per web worker (running + queued). Keep it below the
+# worker's thread count, or waiting sign-ins can still take every thread.
+PASSWORD_QUEUE_DEPTH = int(os.environ.get('PASSWORD_QUEUE_DEPTH', max(PASSWORD_WORKERS, 1) * 2))
+# Seconds a request waits for its result before giving up with a 503
+PASSWORD_WAIT = float(os.environ.get('PASSWORD_WAIT', 5.0))
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many password operations are queued; retry shortly."""
+
+
+def hash_method(pwhash):
+    """The method part of a Werkzeug hash, e.g. 'scrypt:32768:8:1'."""
+    return (pwhash or '').split('$', 1)[0]
+
+
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH,
+                 workers=PASSWORD_WORKERS, queue_depth=PASSWORD_QUEUE_DEPTH, wait=PASSWORD_WAIT):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.wait = wait
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._method = None
+        self.rejected = 0
+
+    def _get_executor(self):
+        # Pools do not survive fork, so each gunicorn worker starts its own.
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._executor_pid = os.getpid()
+                # The pool's workers are non-daemon children, which a multiprocessing child joins when
+                # it exits. Stop them first (ahead of the call queue's own finaliser, which
+                # would drop the stop sentinels) so such a process can exit.
+                Finalize(self._executor, self._executor.shutdown, kwargs={'wait': True, 'cancel_futures': True},
+                         exitpriority=100)
+                self._slots = threading.BoundedSemaphore(self.queue_depth)
+            return self._executor
+
+    def _run(self, operation, fn, *args):
+        started = time.perf_counter()
+        if self.workers <= 0:
+            result = fn(*args)
+        else:
+            result = self._run_on_pool(operation, fn, *args)
+        PASSWORD_OPERATIONS.inc(operation, 'ok')
+        PASSWORD_SECONDS.observe(time.perf_counter() - started, operation)
+        return result
+
+    def _run_on_pool(self, operation, fn, *args):
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            PASSWORD_OPERATIONS.inc(operation, 'rejected')
+            raise PasswordHasherBusy(f'{self.queue_depth} password operations already queued')
+        try:
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool once before giving up.
+                with self._lock:
+                    self._executor = None
+                future = self._get_executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError, OSError):
+            slots.release()
+            logger.exception('Password pool unavailable, hashing inline')
+            return fn(*args)
+        # The slot is freed when the work finishes, even if this request stops waiting.
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(timeout=self.wait)
+        except FutureTimeoutError:
+            self.rejected += 1
+            PASSWORD_OPERATIONS.inc(operation, 'timeout')
+            raise PasswordHasherBusy(f'{operation} did not finish within {self.wait}s') from None
+        except BrokenProcessPool:
+            # A worker died while running this call; the next call starts a fresh pool.
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            logger.exception('Password pool worker died, hashing inline')
+            return fn(*args)
+
+    def hash(self, password):
+        """A new hash of password with the configured method."""
+        return self._run('hash', _hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        """Whether password matches pwhash (made with any method Werkzeug knows)."""
+        if not pwhash:
+            return False
+        return self._run('verify', _verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether pwhash was made with other parameters than the configured ones."""
+        if self._method is None:
+            # Werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), so compare with a real hash.
+            self._method = hash_method(generate_password_hash('', method=self.method, salt_length=1))
+        return hash_method(pwhash) != self._method
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.workers, 'queue_depth': self.queue_depth,
+                'rejected': self.rejected}
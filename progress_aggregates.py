@@ -0,0 +1,189 @@
+"""Per-user progress summaries, kept up to date as results come in.
+
+/dashboard and /progress only need counts and recent scores, so every user
+has one small aggregate record::
+
+    {'last_result_id': 42, 'attempts': 12, 'total_score': 843.5,
+     'best_score': 95.0, 'last_score': 71.0, 'excellent': 4,
+     'time_spent_minutes': 310,
+     'sections': {'Reading': {'attempts': 5, 'total_score': 360.0,
+                              'best_score': 95.0, 'last_score': 71.0,
+                              'time_spent_minutes': 140}, ...},
+     'trend': [['2025-01-06', 2, 151.0], ...],   # day, attempts, total score
+     'recent': [{'id': 42, 'test_id': 3, 'title': ..., 'section': ...,
+                 'score_percentage': 71.0, 'time_taken_minutes': 25,
+                 'completed_at': '2025-01-06 10:15'}, ...]}   # newest first
+
+``add_result`` folds one new result in; results at or below
+``last_result_id`` are ignored, so applying a result twice is harmless.
+Rebuilds count every result in the history whatever the order of its ids.
+The submit path adds each new result, ``ProgressTracker.get`` rebuilds a
+user's record from their history when it is missing or its attempt count
+disagrees with the results store, and ``rebuild_progress.py`` rebuilds
+everyone's in one pass.
+"""
+
+import os
+import logging
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_RECENT = int(os.environ.get('PROGRESS_RECENT', 10))
+PROGRESS_TREND_DAYS = int(os.environ.get('PROGRESS_TREND_DAYS', 90))
+EXCELLENT_SCORE = 80
+
+
+def new_aggregate():
+    return dict(_new_totals(), last_result_id=0, excellent=0, sections={}, trend=[], recent=[])
+
+
+def _new_totals():
+    return {'attempts': 0, 'total_score': 0.0, 'best_score': None, 'last_score': None, 'time_spent_minutes': 0}
+
+
+def _add_score(totals, score, minutes):
+    totals['attempts'] += 1
+    totals['total_score'] = round(totals['total_score'] + score, 4)
+    best = totals['best_score']
+    if best is None or score > best:
+        totals['best_score'] = score
+    totals['last_score'] = score
+    totals['time_spent_minutes'] += minutes
+
+
+def add_result(aggregate, result, summary=None):
+    """Fold one result into aggregate in place; False if it was already counted.
+
+    ``summary`` is the test's catalog summary (title and section).
+    """
+    if (result.get('id') or 0) <= aggregate['last_result_id']:
+        return False
+    _fold(aggregate, result, summary)
+    return True
+
+
+def _fold(aggregate, result, summary):
+    result_id = result.get('id') or 0
+    summary = summary or {}
+    section = summary.get('section') or 'Unknown'
+    score = float(result.get('score_percentage') or 0.0)
+    minutes = int(result.get('time_taken_minutes') or 0)
+
+    aggregate['last_result_id'] = max(aggregate['last_result_id'], result_id)
+    _add_score(aggregate, score, minutes)
+    if score >= EXCELLENT_SCORE:
+        aggregate['excellent'] += 1
+    totals = aggregate['sections'].get(section)
+    if totals is None:
+        totals = aggregate['sections'][section] = _new_totals()
+    _add_score(totals, score, minutes)
+
+    day = (result.get('completed_at') or '')[:10]
+    trend = aggregate['trend']
+    if trend and trend[-1][0] == day:
+        trend[-1][1] += 1
+        trend[-1][2] = round(trend[-1][2] + score, 4)
+    else:
+        trend.append([day, 1, score])
+        del trend[:-PROGRESS_TREND_DAYS]
+
+    aggregate['recent'].insert(0, {
+        'id': result_id,
+        'test_id': result.get('test_id'),
+        'title': summary.get('title'),
+        'section': section,
+        'score_percentage': score,
+        'time_taken_minutes': minutes,
+        'completed_at': result.get('completed_at'),
+    })
+    del aggregate['recent'][PROGRESS_RECENT:]
+
+
+def build_aggregates(results, summary_for):
+    """{user_id: aggregate} from results (each once, oldest first), in one pass.
+
+    ``summary_for(test_id)`` returns a test's catalog summary. Results without
+    a user are skipped. Every result is counted whatever its id, so ids need
+    not follow completion order (imported data, SQL sequences).
+    """
+    aggregates = {}
+    for result in results:
+        user_id = result.get('user_id')
+        if user_id is None:
+            continue
+        aggregate = aggregates.get(user_id)
+        if aggregate is None:
+            aggregate = aggregates[user_id] = new_aggregate()
+        _fold(aggregate, result, summary_for(result.get('test_id')))
+    return aggregates
+
+
+def average(totals):
+    """Mean score of an aggregate or one of its sections, 0.0 without attempts."""
+    attempts = (totals or {}).get('attempts', 0)
+    return round(totals['total_score'] / attempts, 1) if attempts else 0.0
+
+
+def day_streak(aggregate, today=None):
+    """Consecutive days with a test, ending today or yesterday."""
+    today = today or date.today()
+    days = {day for day, _, _ in aggregate['trend']}
+    day = today if today.isoformat() in days else today - timedelta(days=1)
+    streak = 0
+    while day.isoformat() in days:
+        streak += 1
+        day -= timedelta(days=1)
+    return streak
+
+
+class ProgressTracker:
+    def __init__(self, repository, results_repository, tests_repository):
+        self.repository = repository
+        self.results = results_repository
+        self.tests = tests_repository
+        self.rebuilds = 0
+
+    def get(self, user_id):
+        """The user's aggregate, rebuilt from their history if missing or out of date."""
+        aggregate = self.repository.get(user_id)
+        if aggregate is not None and aggregate['attempts'] == self.results.count_for_user(user_id):
+            return aggregate
+        return self.rebuild_user(user_id)
+
+    def _summary_lookup(self):
+        summaries = {}
+
+        def summary_for(test_id):
+            if test_id not in summaries:
+                summaries[test_id] = self.tests.get_summaries({test_id}).get(test_id)
+            return summaries[test_id]
+        return summary_for
+
+    def rebuild_user(self, user_id):
+        history = reversed(self.results.for_user(user_id))  # for_user is newest first
+        aggregate = build_aggregates(history, self._summary_lookup()).get(user_id) or new_aggregate()
+        self.repository.save_many({user_id: aggregate})
+        self.rebuilds += 1
+        return aggregate
+
+    def record(self, result):
+        """Fold a just-saved result into its user's aggregate."""
+        if result.get('user_id') is None:
+            return
+        summary = self.tests.get_summaries({result.get('test_id')}).get(result.get('test_id'))
+        try:
+            self.repository.add_result(result['user_id'], result, summary)
+        except Exception:
+            # The result itself is stored; the next get() notices and rebuilds.
+            logger.exception('Updating progress for user %s failed', result['user_id'])
+
+    def rebuild_all(self):
+        """Recompute every user's aggregate, streaming the result history once."""
+        aggregates = build_aggregates(self.results.iter_all(), self._summary_lookup())
+        self.repository.replace_all(aggregates)
+        return len(aggregates)
+
+    def invalidate(self, user_ids):
+        """Drop the aggregates of user_ids, e.g. after their scores were changed."""
+        self.repository.discard(user_ids)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""Rebuild every user's progress aggregate from the stored results.
+
+Usage:
+    python rebuild_progress.py [--data-dir data] [--backend json|sql] [--database-url URL]
+
+The app keeps the aggregates up to date itself and rebuilds a user's on
+demand when it looks stale; run this after importing or editing results
+outside the app to refresh them all in one pass over the history.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+from repositories import create_repositories, STORAGE_BACKENDS
+from progress_aggregates import ProgressTracker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the per-user progress aggregates from the result history.')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=os.environ.get('STORAGE_BACKEND', 'json'))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(os.path.join(args.data_dir, 'oet.db'))
+    repos = create_repositories(args.backend, args.data_dir, database_url)
+    started = time.perf_counter()
+    users = ProgressTracker(repos.progress, repos.results, repos.tests).rebuild_all()
+    print(f'rebuilt progress for {users} users in {time.perf_counter() - started:.2f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Bulk result report exports for instructors.
+
+An export selects stored results by user and/or completion date, renders
+every report on the ReportService pool (reusing reports already in the
+cache) and streams them to the client as a ZIP while later reports are
+still rendering. The archive is written in chunks as each report finishes,
+so only the current report is ever held in memory. A ``manifest.csv`` at the
+end of the archive lists every result and the file it was saved as.
+
+Progress is written to ``<cache dir>/exports/<export_id>.json`` so that any
+worker can answer a progress poll for an export running in another worker.
+"""
+
+import os
+import re
+import csv
+import io
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+from storage import atomic_write_json, read_json_file
+
+EXPORT_MAX_RESULTS = int(os.environ.get('EXPORT_MAX_RESULTS', 5000))
+# Seconds to wait for any single report before leaving it out of the export
+EXPORT_RENDER_TIMEOUT = float(os.environ.get('EXPORT_RENDER_TIMEOUT', 120))
+EXPORT_FORMATS = ('zip', 'pdf')
+
+_EXPORT_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def valid_export_id(export_id):
+    return bool(export_id and _EXPORT_ID.match(export_id))
+
+
+def parse_date_bounds(since=None, until=None):
+    """ISO bounds [since, until) for 'YYYY-MM-DD' or ISO datetime query values.
+
+    A bare ``until`` date includes the whole day. Bounds use a space separator
+    like the stored ``completed_at`` values. Raises ValueError for values
+    that are not ISO dates.
+    """
+    lower = datetime.fromisoformat(since).isoformat(sep=' ') if since else None
+    upper = None
+    if until:
+        upper_dt = datetime.fromisoformat(until)
+        if len(until) == 10:
+            upper_dt += timedelta(days=1)
+        upper = upper_dt.isoformat(sep=' ')
+    return lower, upper
+
+
+def select_results(repository, user_ids=None, since=None, until=None):
+    """Results matching the filters, ordered by user then completion time.
+
+    ``since``/``until`` are bounds from parse_date_bounds. With user_ids the
+    per-user index is used instead of scanning every result.
+    """
+    if user_ids:
+        candidates = []
+        for user_id in user_ids:
+            candidates.extend(reversed(repository.for_user(user_id)))
+    else:
+        candidates = sorted(repository.all(), key=lambda r: (r.get('user_id') or 0, r.get('completed_at') or '', r['id']))
+    selected = []
+    for result in candidates:
+        completed_at = (result.get('completed_at') or '').replace('T', ' ', 1)
+        if since and completed_at < since:
+            continue
+        if until and completed_at >= until:
+            continue
+        selected.append(result)
+    return selected
+
+
+class ExportProgress:
+    """Progress of one export, persisted as a small JSON file."""
+
+    def __init__(self, directory, export_id, total, min_interval=0.5):
+        self.path = os.path.join(directory, f'{export_id}.json')
+        self.export_id = export_id
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._write('running')
+
+    def _write(self, state):
+        atomic_write_json(self.path, {
+            'export_id': self.export_id,
+            'state': state,
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'updated_at': datetime.now().isoformat(),
+        }, fsync=False)
+        self._last_write = time.monotonic()
+
+    def advance(self, ok=True):
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        if time.monotonic() - self._last_write >= self.min_interval:
+            self._write('running')
+
+    def finish(self, state='complete'):
+        self._write(state)
+
+    @staticmethod
+    def read(directory, export_id):
+        path = os.path.join(directory, f'{export_id}.json')
+        if not os.path.exists(path):
+            return None
+        return read_json_file(path, {})
+
+
+class _ChunkSink:
+    """Write-only file object that hands what ZipFile wrote back to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '-', text or '').strip('-').lower() or 'report'
+
+
+def archive_name(payload):
+    result = payload['result']
+    return f"{_slug(payload['user_name'])}/{payload['kind']}_{result['id']}_{_slug(payload['test']['title'])}.pdf"
+
+
+def stream_zip(rendered, progress=None):
+    """Yield a ZIP archive built from (payload, pdf path or None) pairs as they arrive.
+
+    The sink is not seekable, so ZipFile writes data descriptors after each
+    member and the archive can be sent before its size is known.
+    """
+    sink = _ChunkSink()
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(['result_id', 'kind', 'student', 'test', 'completed_at', 'score_percentage', 'file'])
+    state = 'failed'
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for payload, path in rendered:
+                result = payload['result']
+                name = archive_name(payload) if path else ''
+                if path:
+                    try:
+                        archive.write(path, name)
+                    except FileNotFoundError:
+                        # Evicted between render and read; leave it out rather than abort.
+                        name = ''
+                writer.writerow([result['id'], payload['kind'], payload['user_name'], payload['test']['title'],
+                                 result.get('completed_at'), result.get('score_percentage'), name or 'NOT RENDERED'])
+                if progress:
+                    progress.advance(ok=bool(name))
+                data = sink.drain()
+                if data:
+                    yield data
+            archive.writestr('manifest.csv', manifest.getvalue())
+        yield sink.drain()
+        state = 'complete'
+    finally:
+        if progress:
+            progress.finish(state)
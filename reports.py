@@ -0,0 +1,323 @@
+"""PDF result reports rendered off the request path.
+
+A stored result never changes, so a report is fully determined by its inputs:
+the result fields it prints, the test title, the student name and
+``REPORT_TEMPLATE_VERSION``. The SHA-256 of those inputs is the report's cache
+key and its file name under ``testspdf/``. Requests for a report that is
+already on disk are served straight from the file. Missing reports are rendered
+by a small process pool (``PDF_WORKERS``), so ReportLab never runs in a web
+worker thread. Old or excess files are evicted by age (``PDF_CACHE_MAX_AGE``
+seconds) and total size (``PDF_CACHE_MAX_BYTES``).
+
+Bump REPORT_TEMPLATE_VERSION whenever the layout in ``build_report`` changes.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import multiprocessing
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+
+from metrics import PDF_RENDERS, PDF_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
+
+REPORT_TEMPLATE_VERSION = 1
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+PDF_CACHE_MAX_AGE = float(os.environ.get('PDF_CACHE_MAX_AGE', 30 * 24 * 3600))
+PDF_EVICT_INTERVAL = 60.0
+
+
+def report_payload(kind, result, test, user_name):
+    """The inputs that fully determine a report, as plain JSON-able data."""
+    return {
+        'template_version': REPORT_TEMPLATE_VERSION,
+        'kind': kind,
+        'result': {
+            'id': result['id'],
+            'completed_at': result.get('completed_at'),
+            'score_percentage': result.get('score_percentage', 0.0),
+            'time_taken_minutes': result.get('time_taken_minutes'),
+        },
+        'test': {'title': test.get('title', '')},
+        'user_name': user_name,
+    }
+
+
+def report_key(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _report_story(payload, styles):
+    from reportlab.platypus import Paragraph, Spacer
+
+    result = payload['result']
+    story = []
+
+    title = Paragraph(f"OET Test Results - {payload['test']['title']}", styles['Title'])
+    story.append(title)
+    story.append(Spacer(1, 12))
+
+    user_info = Paragraph(f"<b>Student:</b> {payload['user_name']}", styles['Normal'])
+    story.append(user_info)
+
+    completion_time = Paragraph(f"<b>Completed:</b> {result['completed_at']}", styles['Normal'])
+    story.append(completion_time)
+
+    time_taken = Paragraph(f"<b>Time Taken:</b> {result['time_taken_minutes']} minutes", styles['Normal'])
+    story.append(time_taken)
+    story.append(Spacer(1, 12))
+
+    score = Paragraph(f"<b>Score:</b> {result['score_percentage']:.1f}%", styles['Heading2'])
+    story.append(score)
+    return story
+
+
+def build_report(payload):
+    """Render the report described by payload and return the PDF bytes."""
+    # ReportLab is heavy; only the processes that render reports import it.
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    doc.build(_report_story(payload, getSampleStyleSheet()))
+    return buffer.getvalue()
+
+
+def cohort_key(payloads):
+    return hashlib.sha256('\n'.join(report_key(p) for p in payloads).encode('ascii')).hexdigest()
+
+
+def render_cohort_to_file(payloads, path):
+    """Process-pool entry point: one PDF with a page per report, written straight to path."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+
+    styles = getSampleStyleSheet()
+    story = []
+    for payload in payloads:
+        if story:
+            story.append(PageBreak())
+        story.extend(_report_story(payload, styles))
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        SimpleDocTemplate(tmp_path, pagesize=letter).build(story)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_to_file(payload, path):
+    """Process-pool entry point: render payload into path (atomically)."""
+    _write_atomic(path, build_report(payload))
+    return path
+
+
+class ReportCache:
+    """Content-addressed PDF files in one directory, evicted by age and total size."""
+
+    def __init__(self, directory, max_bytes=PDF_CACHE_MAX_BYTES, max_age=PDF_CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key):
+        """Return the cached file path, or None. A hit refreshes the file's age."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def evict(self):
+        """Remove expired reports, then the least recently used until under max_bytes."""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - st.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ReportService:
+    """Queue report renders on a process pool and track them by cache key."""
+
+    def __init__(self, cache, workers=PDF_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._futures = {}
+        self._last_evict = 0.0
+        self.renders = 0
+        self.failures = 0
+
+    def _get_executor(self):
+        # Pools do not survive fork, so each gunicorn worker starts its own.
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._executor_pid = os.getpid()
+            # The pool's workers are non-daemon children, which a multiprocessing child joins when
+            # it exits. Stop them first (ahead of the call queue's own finaliser, which
+            # would drop the stop sentinels) so such a process can exit.
+            Finalize(self._executor, self._executor.shutdown, kwargs={'wait': True, 'cancel_futures': True},
+                     exitpriority=100)
+            self._futures = {}
+        return self._executor
+
+    def _submit(self, fn, *args):
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool once before giving up.
+            self._executor = None
+            return self._get_executor().submit(fn, *args)
+
+    def _ensure(self, key, fn, *args):
+        if self.cache.get(key):
+            return key
+        kind = 'cohort' if fn is render_cohort_to_file else 'report'
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and not (future.done() and future.exception() is not None):
+                return key
+            try:
+                future = self._submit(fn, *args)
+            except (BrokenProcessPool, RuntimeError, OSError):
+                # The pool could not start (e.g. no spawn support); render inline.
+                logger.exception('Report pool unavailable, rendering %s inline', key)
+                self._executor = None
+                with PDF_RENDER_SECONDS.time(kind):
+                    fn(*args)
+                PDF_RENDERS.inc(kind, 'ok')
+                self.renders += 1
+                return key
+            self._futures[key] = future
+        queued_at = time.monotonic()
+        # Outside the lock: a render that already finished runs the callback right here.
+        future.add_done_callback(lambda f, key=key: self._finished(key, f, kind, queued_at))
+        return key
+
+    def request(self, payload):
+        """Make sure the report for payload exists or is being rendered; return its key."""
+        key = report_key(payload)
+        return self._ensure(key, render_to_file, payload, self.cache.path(key))
+
+    def request_cohort(self, payloads):
+        """Like request, for one combined PDF of several reports."""
+        key = cohort_key(payloads)
+        return self._ensure(key, render_cohort_to_file, list(payloads), self.cache.path(key))
+
+    def render_many(self, payloads, timeout, window=None):
+        """Render payloads on the pool and yield (payload, path or None) in input order.
+
+        At most ``window`` renders are queued ahead of the consumer, so a large
+        export keeps every worker busy without queueing the whole batch.
+        """
+        window = window or self.workers * 4
+        queued = deque()
+        for payload in payloads:
+            queued.append((payload, self.request(payload)))
+            if len(queued) >= window:
+                payload, key = queued.popleft()
+                yield payload, self.wait(key, timeout)
+        while queued:
+            payload, key = queued.popleft()
+            yield payload, self.wait(key, timeout)
+
+    def _finished(self, key, future, kind, queued_at):
+        if future.exception() is not None:
+            self.failures += 1
+            PDF_RENDERS.inc(kind, 'failed')
+            logger.error('Rendering report %s failed: %s', key, future.exception())
+            return
+        self.renders += 1
+        PDF_RENDERS.inc(kind, 'ok')
+        PDF_RENDER_SECONDS.observe(time.monotonic() - queued_at, kind)
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+            due = time.monotonic() - self._last_evict > PDF_EVICT_INTERVAL
+            if due:
+                self._last_evict = time.monotonic()
+        if due:
+            self.cache.evict()
+
+    def status(self, key):
+        """'ready', 'pending', 'failed' or 'missing' for a report key."""
+        if self.cache.get(key):
+            return 'ready'
+        with self._lock:
+            future = self._futures.get(key)
+        if future is None:
+            return 'missing'
+        if not future.done():
+            return 'pending'
+        return 'failed' if future.exception() is not None else 'ready'
+
+    def wait(self, key, timeout):
+        """Block up to timeout seconds for a queued report; return its path or None."""
+        with self._lock:
+            future = self._futures.get(key)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        return self.cache.get(key)
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for f in self._futures.values() if not f.done())
+        return {'renders': self.renders, 'failures': self.failures, 'pending': pending}
@@ -0,0 +1,460 @@
+"""Storage repositories for the app's data.
+
+main.py talks to storage only through the repositories returned by
+``create_repositories``. Two backends implement the same methods:
+
+- ``json`` (default): the flat files in ``data/``, read through the cached
+  loader in storage.py, with results in the append-only journal, chat and
+  learned words in per-user logs under ``data/chat/`` and
+  ``data/vocabulary_progress/``, review states in ``data/vocabulary_reviews/``
+  and tests and jobs served from shared snapshots (snapshot.py).
+- ``sql``: SQLAlchemy tables (see sql_repositories.py), SQLite locally or
+  PostgreSQL in production, selected with ``STORAGE_BACKEND=sql`` and
+  ``DATABASE_URL``.
+
+Records are returned as read-only dicts/lists in the same shape as the JSON
+files; copy them before modifying.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from storage import (read_json_file, load_json_file, save_json_file, iter_json_array, file_lock, freeze, thaw,
+                     FrozenList)
+from results_store import ResultJournal, iter_records
+from user_directory import UserDirectory
+from test_catalog import TestCatalog
+from chat_store import ChatStore
+from draft_store import DraftJournal
+from snapshot import SharedSnapshot
+from progress_aggregates import add_result
+
+STORAGE_BACKENDS = ('json', 'sql')
+# Users whose learned words are kept indexed in memory, per process
+VOCABULARY_PROGRESS_CACHE_SIZE = int(os.environ.get('VOCABULARY_PROGRESS_CACHE_SIZE', 1000))
+
+
+class Repositories:
+    """The set of repositories the app works with, one per dataset."""
+
+    def __init__(self, users, tests, results, mock_results, vocabulary_progress, vocabulary_reviews, progress, chat, jobs,
+                 drafts):
+        self.users = users
+        self.tests = tests
+        self.results = results
+        self.mock_results = mock_results
+        self.vocabulary_progress = vocabulary_progress
+        self.vocabulary_reviews = vocabulary_reviews
+        self.progress = progress
+        self.chat = chat
+        self.jobs = jobs
+        self.drafts = drafts
+
+
+# ============ JSON implementations ============
+class JsonUserRepository:
+    def __init__(self, path):
+        self.directory = UserDirectory(path)
+
+    def all(self):
+        return self.directory.all()
+
+    def get_by_id(self, user_id):
+        return self.directory.get_by_id(user_id)
+
+    def get_by_email(self, email):
+        return self.directory.get_by_email(email)
+
+    def create(self, user_data):
+        return self.directory.add(user_data)
+
+    def set_password_hash(self, user_id, password_hash):
+        self.directory.update(user_id, {'password_hash': password_hash})
+
+    def replace_all(self, users):
+        self.directory.replace_all(users)
+
+
+class JsonTestRepository:
+    """Tests served from the compiled TestCatalog; listings return summaries without content."""
+
+    def __init__(self, path, practice_fallback_path=None, mock_fallback_path=None):
+        self.catalog = TestCatalog(path)
+        self.practice_fallback_path = practice_fallback_path
+        self.mock_fallback_path = mock_fallback_path
+
+    def all(self):
+        return self.catalog.summaries()
+
+    def practice_tests(self):
+        tests = self.catalog.by_kind('practice')
+        if not tests and self.practice_fallback_path:
+            return read_json_file(self.practice_fallback_path, [])
+        return tests
+
+    def mock_tests(self):
+        tests = self.catalog.by_kind('mock')
+        if not tests and self.mock_fallback_path:
+            return read_json_file(self.mock_fallback_path, [])
+        return tests
+
+    def _fallback(self, test_id):
+        tests = []
+        if not self.catalog.by_kind('practice') and self.practice_fallback_path:
+            tests += read_json_file(self.practice_fallback_path, [])
+        if not self.catalog.by_kind('mock') and self.mock_fallback_path:
+            tests += read_json_file(self.mock_fallback_path, [])
+        return next((t for t in tests if t['id'] == test_id), None)
+
+    def get_summary(self, test_id):
+        return self.catalog.get_summary(test_id) or self._fallback(test_id)
+
+    def get(self, test_id):
+        return self.catalog.get(test_id) or self._fallback(test_id)
+
+    def version(self):
+        return self.catalog.version()
+
+    def get_summaries(self, test_ids):
+        """Map each of test_ids to its summary in one pass over the catalog index."""
+        summaries = self.catalog.get_summaries(test_ids)
+        for test_id in test_ids:
+            if test_id not in summaries:
+                fallback = self._fallback(test_id)
+                if fallback:
+                    summaries[test_id] = fallback
+        return summaries
+
+
+class JsonResultRepository:
+    """Test or mock-test results stored in a ResultJournal."""
+
+    def __init__(self, path):
+        self.store = ResultJournal(path)
+
+    def all(self):
+        return self.store.all()
+
+    def get(self, result_id):
+        return self.store.get(result_id)
+
+    def for_user(self, user_id, limit=None, before=None):
+        return self.store.for_user(user_id, limit=limit, before=before)
+
+    def count_for_user(self, user_id):
+        return self.store.count_for_user(user_id)
+
+    def for_test(self, test_id):
+        return FrozenList(r for r in self.store.all() if r.get('test_id') == test_id)
+
+    def iter_all(self):
+        """Stream every record from disk in storage order, for offline jobs."""
+        return iter_records(self.store.snapshot_path)
+
+    def since(self, cursor):
+        """(records stored after cursor, new cursor); start with cursor None.
+
+        Returns (None, None) if the store was rewritten since the cursor was
+        taken (records replaced or changed in place); start again from None.
+        """
+        start, last_id, generation = cursor if cursor is not None else (0, None, None)
+        current = self.store.generation()
+        if cursor is not None and generation != current:
+            return None, None
+        records = self.store.records_after(start, last_id)
+        if records is None:
+            return None, None
+        if records:
+            last_id = records[-1].get('id')
+        return records, (start + len(records), last_id, current)
+
+    def append(self, record):
+        return self.store.append(record)
+
+    def update_many(self, changes):
+        return self.store.update_many(changes)
+
+    def replace_all(self, records):
+        self.store.replace_all(records)
+
+
+class JsonVocabularyProgressRepository:
+    """Learned words as per-user append-only logs, ``<directory>/<user_id>.jsonl``.
+
+    Each line is one word id, so marking a word appends a line under that
+    user's lock. Every cached log keeps the word ids as a list (in the order
+    learned) and a set, extended from the last offset read. Users still in the
+    old vocabulary_progress.json are copied into their own log the first time
+    they are read.
+    """
+
+    def __init__(self, directory, legacy_path=None, cache_size=VOCABULARY_PROGRESS_CACHE_SIZE):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._logs = OrderedDict()  # user_id -> [inode, end of the last complete line, word ids, set of them]
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f'{int(user_id)}.jsonl')
+
+    def _import_legacy(self, path, user_id):
+        if os.path.exists(path) or not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        legacy = read_json_file(self.legacy_path, {}).get(str(user_id))
+        if not legacy or not legacy.get('learned_words'):
+            return
+        with file_lock(path):
+            if os.path.exists(path):
+                return
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for word_id in dict.fromkeys(legacy['learned_words']):
+                    f.write(json.dumps(word_id) + '\n')
+            os.replace(tmp_path, path)
+
+    def _log(self, user_id, path):
+        """The user's cache entry, brought up to date with the file; the caller holds self._lock."""
+        log = self._logs.pop(user_id, None)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is None or log is None or log[0] != st.st_ino or st.st_size < log[1]:
+            log = [st and st.st_ino, 0, [], set()]  # new or replaced: read from scratch
+        if st is not None and st.st_size > log[1]:
+            with open(path, 'rb') as f:
+                f.seek(log[1])
+                chunk = f.read()
+            complete = chunk.rfind(b'\n') + 1  # a torn final line is not a word yet
+            for line in chunk[:complete].split(b'\n'):
+                if not line.strip():
+                    continue
+                try:
+                    word_id = json.loads(line)
+                except ValueError:
+                    continue
+                if word_id not in log[3]:
+                    log[3].add(word_id)
+                    log[2].append(word_id)
+            log[1] += complete
+        self._logs[user_id] = log
+        while len(self._logs) > self.cache_size:
+            self._logs.popitem(last=False)
+        return log
+
+    def get(self, user_id):
+        path = self._path(user_id)
+        self._import_legacy(path, user_id)
+        with self._lock:
+            return freeze({'learned_words': list(self._log(user_id, path)[2])})
+
+    def add_learned_word(self, user_id, word_id):
+        path = self._path(user_id)
+        self._import_legacy(path, user_id)
+        with file_lock(path), self._lock:
+            log = self._log(user_id, path)
+            if word_id in log[3]:
+                return False
+            with open(path, 'ab') as f:
+                if f.tell() > log[1]:
+                    f.truncate(log[1])  # a torn line left by a crashed writer
+                f.write(json.dumps(word_id).encode('utf-8') + b'\n')
+            self._log(user_id, path)
+        return True
+
+
+class JsonVocabularyReviewRepository:
+    """Spaced-repetition states as per-user files ``<directory>/<user_id>.json`` of {word_id: state}.
+
+    A user's states are read from the old vocabulary_reviews.json until their
+    next write moves them into their own file.
+    """
+
+    def __init__(self, directory, legacy_path=None):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f'{int(user_id)}.json')
+
+    def version(self, user_id):
+        """Signature of the file user_id's states are read from, or None if there is none."""
+        for path in (self._path(user_id), self.legacy_path):
+            if not path:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return (path, st.st_mtime_ns, st.st_size, st.st_ino)
+        return None
+
+    def _stored(self, user_id):
+        path = self._path(user_id)
+        if os.path.exists(path):
+            return read_json_file(path, {})
+        if self.legacy_path:
+            return read_json_file(self.legacy_path, {}).get(str(user_id), {})
+        return {}
+
+    def states(self, user_id):
+        return {int(word_id): state for word_id, state in self._stored(user_id).items()}
+
+    def save_many(self, updates):
+        """Merge {user_id: {word_id: state}} into each user's file; the newer review wins."""
+        for user_id, states in updates.items():
+            path = self._path(user_id)
+            with file_lock(path):
+                user_states = thaw(self._stored(user_id))
+                for word_id, state in states.items():
+                    current = user_states.get(str(word_id))
+                    if current is None or current.get('reviewed_at', '') <= state.get('reviewed_at', ''):
+                        user_states[str(word_id)] = state
+                save_json_file(path, user_states)
+
+
+class JsonProgressRepository:
+    """Progress aggregates (see progress_aggregates.py), one file per user."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id):
+        return os.path.join(self.directory, f'{int(user_id)}.json')
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return None
+        return read_json_file(path, {}) or None
+
+    def get(self, user_id):
+        return self._read(self._path(user_id))
+
+    def add_result(self, user_id, result, summary):
+        """Fold result into the user's stored aggregate; no-op if there is none yet."""
+        path = self._path(user_id)
+        with file_lock(path):
+            aggregate = self._read(path)
+            if aggregate is None:
+                return False
+            aggregate = thaw(aggregate)
+            if not add_result(aggregate, result, summary):
+                return False
+            save_json_file(path, aggregate)
+        return True
+
+    def save_many(self, aggregates):
+        for user_id, aggregate in aggregates.items():
+            path = self._path(user_id)
+            with file_lock(path):
+                save_json_file(path, aggregate)
+
+    def replace_all(self, aggregates):
+        self.save_many(aggregates)
+        keep = {f'{int(user_id)}.json' for user_id in aggregates}
+        stale = [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json') and name not in keep]
+        self.discard(stale)
+
+    def discard(self, user_ids):
+        for user_id in user_ids:
+            path = self._path(user_id)
+            with file_lock(path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class JsonChatRepository:
+    """Conversations as per-user append-only logs (see chat_store.py)."""
+
+    def __init__(self, directory, legacy_path=None):
+        self.store = ChatStore(directory, legacy_path)
+
+    def messages(self, user_id):
+        return self.store.messages(user_id)
+
+    def page(self, user_id, limit=50, before=None):
+        return self.store.page(user_id, limit, before)
+
+    def since(self, user_id, after_id):
+        return self.store.since(user_id, after_id)
+
+    def latest_id(self, user_id):
+        return self.store.latest_id(user_id)
+
+    def append(self, user_id, message):
+        return self.store.append(user_id, message)
+
+    def replace(self, user_id, messages):
+        self.store.replace(user_id, messages)
+
+
+class JsonJobRepository:
+    """Job listings served from a shared snapshot of jobs.json (see snapshot.py)."""
+
+    def __init__(self, path, compiled_dir=None):
+        self.path = path
+        compiled_dir = compiled_dir or os.path.join(os.path.dirname(path) or '.', '.catalog')
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.snapshot = SharedSnapshot(path, os.path.join(compiled_dir, f'{name}.snap'), iter_json_array)
+
+    def version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def all(self):
+        return self.snapshot.current().view()
+
+    def get(self, job_id):
+        return next((j for j in self.all() if j.get('id') == job_id), None)
+
+
+class JsonDraftRepository:
+    """In-progress test drafts in an append-only journal (see draft_store.py)."""
+
+    def __init__(self, path):
+        self.journal = DraftJournal(path)
+
+    def get(self, key):
+        return self.journal.get(key)
+
+    def save_many(self, updates):
+        self.journal.append(updates)
+
+
+def create_json_repositories(data_dir):
+    path = lambda name: os.path.join(data_dir, name)
+    return Repositories(
+        users=JsonUserRepository(path('users.json')),
+        tests=JsonTestRepository(path('oet_tests.json'), path('practice_tests.json'), path('full_mock_tests.json')),
+        results=JsonResultRepository(path('test_results.json')),
+        mock_results=JsonResultRepository(path('mocktests_results.json')),
+        vocabulary_progress=JsonVocabularyProgressRepository(path('vocabulary_progress'),
+                                                             path('vocabulary_progress.json')),
+        vocabulary_reviews=JsonVocabularyReviewRepository(path('vocabulary_reviews'), path('vocabulary_reviews.json')),
+        progress=JsonProgressRepository(path('progress')),
+        chat=JsonChatRepository(path('chat'), path('chat_messages.json')),
+        jobs=JsonJobRepository(path('jobs.json')),
+        drafts=JsonDraftRepository(path('drafts.jsonl')),
+    )
+
+
+def create_repositories(backend, data_dir, database_url=None):
+    """Build the repositories for backend ('json' or 'sql')."""
+    if backend == 'json':
+        return create_json_repositories(data_dir)
+    if backend == 'sql':
+        # SQLAlchemy is only needed when the SQL backend is selected.
+        from sql_repositories import create_sql_repositories
+        return create_sql_repositories(database_url)
+    raise ValueError(f'Unknown STORAGE_BACKEND {backend!r}; expected one of {STORAGE_BACKENDS}')
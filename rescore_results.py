@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Re-score stored results after an answer key in oet_tests.json was corrected.
+
+Usage:
+    python rescore_results.py [--test-id 1 --test-id 2] [--mock] [--dry-run]
+                              [--data-dir data] [--backend json|sql] [--database-url URL]
+
+Every result of the selected tests (all tests with an answer key by default)
+is scored again from its stored answers with scoring.rescore, and the
+results whose score changed are written back in one batch per results set.
+Writing and Speaking results are left alone; their scores come from human
+reviewers. Progress aggregates of the users whose scores changed are dropped
+and rebuilt on their next visit. Requires NumPy.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+from repositories import create_repositories, STORAGE_BACKENDS
+from scoring import compile_answer_key, rescore
+
+logger = logging.getLogger('rescore_results')
+
+
+def rescore_results(repos, test_ids=None, mock=False, dry_run=False):
+    """Return {test id: (results checked, scores changed)} for the selected tests."""
+    results_repo = repos.mock_results if mock else repos.results
+    if test_ids is None:
+        test_ids = [t['id'] for t in repos.tests.all()]
+    report = {}
+    changes = {}
+    affected_users = set()
+    for test_id in test_ids:
+        test = repos.tests.get(test_id)
+        key = compile_answer_key(test) if test else None
+        if key is None or key.is_manual:
+            continue
+        results = results_repo.for_test(test_id)
+        new_scores = rescore(results, key)
+        changed = 0
+        for result in results:
+            score = new_scores[result['id']]
+            if result.get('score_percentage') != score:
+                changes[result['id']] = {'score_percentage': score}
+                affected_users.add(result.get('user_id'))
+                changed += 1
+        report[test_id] = (len(results), changed)
+    if changes and not dry_run:
+        results_repo.update_many(changes)
+        if not mock:
+            repos.progress.discard(affected_users - {None})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-score stored results against the answer keys in the test content.')
+    parser.add_argument('--test-id', type=int, action='append', dest='test_ids', help='only these tests (repeatable)')
+    parser.add_argument('--mock', action='store_true', help='re-score mock test results instead of practice results')
+    parser.add_argument('--dry-run', action='store_true', help='report changes without saving them')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=os.environ.get('STORAGE_BACKEND', 'json'))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(os.path.join(args.data_dir, 'oet.db'))
+    repos = create_repositories(args.backend, args.data_dir, database_url)
+    started = time.perf_counter()
+    report = rescore_results(repos, args.test_ids, args.mock, args.dry_run)
+    elapsed = time.perf_counter() - started
+    for test_id, (checked, changed) in report.items():
+        print(f'test {test_id}: {checked} results checked, {changed} scores changed')
+    print(f'{"would update" if args.dry_run else "updated"} {sum(c for _, c in report.values())} results in {elapsed:.2f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""Append-only storage for test and mock-test results.
+
+Each results file (e.g. ``data/test_results.json``) becomes a snapshot plus a
+JSON-lines journal next to it (``test_results.json.journal``). Saving a result
+appends one line to the journal, so a submission costs the same regardless of
+how many results are already stored. A background thread periodically folds
+the journal into the snapshot:
+
+1. under the writer lock, the live journal is renamed to ``.journal.compacting``
+   so new appends go to a fresh journal;
+2. the snapshot is rewritten atomically with every record seen so far;
+3. the sealed journal is removed.
+
+On load the snapshot is read and both journals are replayed. Records are keyed
+by id, so anything replayed twice after a crash between steps 2 and 3 is
+skipped, and a torn final line from a crash mid-append is ignored.
+
+Rewrites that replace or change stored records (``replace_all``,
+``update_many``) also bump ``.generation``, so readers that follow the store
+incrementally know to start over; compaction keeps the records as they are
+and leaves it alone.
+"""
+
+import os
+import json
+import time
+import logging
+import bisect
+import threading
+
+from storage import read_json_file, atomic_write_json, file_lock, freeze, iter_json_array, FrozenList, StorageBusyError, IdSequence
+
+logger = logging.getLogger(__name__)
+
+# 'always' fsyncs every append, 'interval' at most once per RESULTS_FSYNC_INTERVAL
+# seconds, 'never' leaves flushing to the OS.
+RESULTS_FSYNC = os.environ.get('RESULTS_FSYNC', 'always')
+RESULTS_FSYNC_INTERVAL = float(os.environ.get('RESULTS_FSYNC_INTERVAL', 1.0))
+RESULTS_COMPACT_THRESHOLD = int(os.environ.get('RESULTS_COMPACT_THRESHOLD', 500))
+RESULTS_COMPACT_INTERVAL = float(os.environ.get('RESULTS_COMPACT_INTERVAL', 60.0))
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def iter_records(snapshot_path):
+    """Yield the records of a results file and its journals without loading them all.
+
+    Meant for offline jobs (migration, analytics); replayed duplicates are
+    skipped by id.
+    """
+    seen = set()
+    if os.path.exists(snapshot_path):
+        for record in iter_json_array(snapshot_path):
+            seen.add(record.get('id'))
+            yield record
+    for journal in (snapshot_path + '.journal.compacting', snapshot_path + '.journal'):
+        if not os.path.exists(journal):
+            continue
+        with open(journal, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning('Skipping corrupt line in %s', journal)
+                    continue
+                if record.get('id') not in seen:
+                    seen.add(record.get('id'))
+                    yield record
+
+
+def _user_key(record):
+    return (record.get('completed_at') or '', record.get('id'))
+
+
+class ResultJournal:
+    """Result records backed by a JSON snapshot and an append-only journal."""
+
+    def __init__(self, snapshot_path, fsync_policy=RESULTS_FSYNC, fsync_interval=RESULTS_FSYNC_INTERVAL,
+                 compact_threshold=RESULTS_COMPACT_THRESHOLD, compact_interval=RESULTS_COMPACT_INTERVAL):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f'fsync_policy must be one of {FSYNC_POLICIES}, got {fsync_policy!r}')
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + '.journal'
+        self.sealed_path = snapshot_path + '.journal.compacting'
+        self.compact_lock_path = snapshot_path + '.compact'
+        self.generation_path = snapshot_path + '.generation'
+        # Ids come from a counter rather than the current maximum, so ones dropped by replace_all are not reused
+        self._ids = IdSequence(snapshot_path)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.compact_interval = compact_interval
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._snapshot_sig = None
+        self._journal_ino = None
+        self._offset = 0
+        self._records = []
+        self._by_id = {}
+        self._by_user = {}
+        self._max_id = 0
+        self._pending = 0
+        self._view = None
+        self._last_fsync = 0.0
+
+        self._compactor = None
+        self._compactor_pid = None
+        self._wakeup = threading.Event()
+
+        self.appends = 0
+        self.compactions = 0
+        self.reloads = 0
+
+    # ---- loading ----
+    def _apply(self, record):
+        record_id = record.get('id')
+        if record_id in self._by_id:
+            return
+        self._records.append(record)
+        self._by_id[record_id] = record
+        # Per-user (completed_at, id) keys kept sorted; results normally arrive
+        # in completion order, so this is an append.
+        bisect.insort(self._by_user.setdefault(record.get('user_id'), []), _user_key(record))
+        if isinstance(record_id, int) and record_id > self._max_id:
+            self._max_id = record_id
+        self._view = None
+
+    def _replay(self, f, offset):
+        """Apply complete lines from an open journal; return the offset after the last one."""
+        f.seek(offset)
+        chunk = f.read()
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return offset
+        for line in chunk[:end].split(b'\n'):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning('Skipping corrupt line in %s', f.name)
+                continue
+            self._apply(freeze(record))
+            self._pending += 1
+        return offset + end + 1
+
+    def _reload(self):
+        for _ in range(5):
+            snapshot_sig = _signature(self.snapshot_path)
+            self._records = []
+            self._by_id = {}
+            self._by_user = {}
+            self._max_id = 0
+            self._pending = 0
+            self._view = None
+            for record in read_json_file(self.snapshot_path, []):
+                self._apply(record)
+            try:
+                with open(self.sealed_path, 'rb') as f:
+                    self._replay(f, 0)
+            except FileNotFoundError:
+                pass
+            try:
+                with open(self.journal_path, 'rb') as f:
+                    self._journal_ino = os.fstat(f.fileno()).st_ino
+                    self._offset = self._replay(f, 0)
+            except FileNotFoundError:
+                self._journal_ino = None
+                self._offset = 0
+            # A compaction finishing while we read can remove the sealed journal
+            # after we read the old snapshot; retry until the snapshot is stable.
+            if _signature(self.snapshot_path) == snapshot_sig:
+                break
+        self._snapshot_sig = _signature(self.snapshot_path)
+        self._loaded = True
+        self.reloads += 1
+
+    def _refresh(self):
+        if not self._loaded or _signature(self.snapshot_path) != self._snapshot_sig:
+            self._reload()
+            return
+        try:
+            with open(self.journal_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != self._journal_ino:
+                    self._reload()
+                    return
+                self._offset = self._replay(f, self._offset)
+        except FileNotFoundError:
+            if self._journal_ino is not None:
+                self._reload()
+
+    # ---- reads ----
+    def all(self):
+        """Return every stored record as a read-only list in insertion order."""
+        with self._lock:
+            self._refresh()
+            if self._view is None:
+                self._view = FrozenList(self._records)
+            return self._view
+
+    def records_after(self, position, last_id=None):
+        """Records stored after the first ``position`` ones, without building ``all()``.
+
+        ``last_id`` is the id of record ``position - 1`` as the caller last saw
+        it; returns None if that record has changed (the journal was rewritten).
+        """
+        with self._lock:
+            self._refresh()
+            records = self._records
+            if position > len(records) or (position and records[position - 1].get('id') != last_id):
+                return None
+            return FrozenList(records[position:])
+
+    def generation(self):
+        """Changes whenever stored records are replaced or changed in place (not on appends)."""
+        return _signature(self.generation_path)
+
+    def get(self, record_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(record_id)
+
+    def for_user(self, user_id, limit=None, before=None):
+        """Return user_id's records newest first (by completed_at, then id).
+
+        ``before`` is the id of a record already shown; only older records are
+        returned. ``limit`` caps the number of records materialised.
+        """
+        with self._lock:
+            self._refresh()
+            keys = self._by_user.get(user_id, [])
+            end = len(keys)
+            if before is not None:
+                cursor = self._by_id.get(before)
+                if cursor is None or cursor.get('user_id') != user_id:
+                    return []
+                end = bisect.bisect_left(keys, _user_key(cursor))
+            start = 0 if limit is None else max(0, end - limit)
+            return [self._by_id[key[1]] for key in reversed(keys[start:end])]
+
+    def count_for_user(self, user_id):
+        with self._lock:
+            self._refresh()
+            return len(self._by_user.get(user_id, []))
+
+    # ---- writes ----
+    def _sync(self, f):
+        if self.fsync_policy == 'always':
+            os.fsync(f.fileno())
+        elif self.fsync_policy == 'interval':
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(f.fileno())
+                self._last_fsync = now
+
+    def append(self, record):
+        """Assign the next id to record, append it to the journal and return the stored copy."""
+        with self._lock, file_lock(self.snapshot_path):
+            self._refresh()
+            stored = {'id': self._ids.next(floor=self._max_id)}
+            stored.update((k, v) for k, v in record.items() if k != 'id')
+            line = json.dumps(stored, ensure_ascii=False).encode('utf-8') + b'\n'
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            with open(self.journal_path, 'ab') as f:
+                # Bytes past our offset are a torn line from a crashed writer;
+                # start on a fresh line so this record stays parseable.
+                if f.tell() > self._offset:
+                    line = b'\n' + line
+                f.write(line)
+                f.flush()
+                self._sync(f)
+            self._refresh()
+            self.appends += 1
+            pending = self._pending
+        self._ensure_compactor()
+        if pending >= self.compact_threshold:
+            self._wakeup.set()
+        return self._by_id[stored['id']]
+
+    def replace_all(self, records):
+        """Overwrite the whole store with records, discarding both journals."""
+        with file_lock(self.compact_lock_path), self._lock, file_lock(self.snapshot_path):
+            self._rewrite(list(records))
+
+    def update_many(self, changes):
+        """Apply {record id: {field: value}} to stored records in one snapshot rewrite.
+
+        Returns the number of records changed.
+        """
+        with file_lock(self.compact_lock_path), self._lock, file_lock(self.snapshot_path):
+            self._refresh()
+            updated = 0
+            records = []
+            for record in self._records:
+                change = changes.get(record.get('id'))
+                if change:
+                    record = dict(record, **change)
+                    updated += 1
+                records.append(record)
+            if updated:
+                self._rewrite(records)
+            return updated
+
+    def _rewrite(self, records):
+        atomic_write_json(self.snapshot_path, records)
+        for path in (self.sealed_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        try:
+            with open(self.generation_path, encoding='ascii') as f:
+                generation = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            generation = 0
+        tmp_path = f'{self.generation_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='ascii') as f:
+            f.write(str(generation + 1))
+        os.replace(tmp_path, self.generation_path)
+        self._reload()
+
+    def compact(self):
+        """Fold the journal into the snapshot. Returns False if there was nothing to do."""
+        try:
+            with file_lock(self.compact_lock_path, timeout=0):
+                return self._compact()
+        except StorageBusyError:
+            return False  # another worker is compacting, or appends kept the lock busy
+
+    def _compact(self):
+        with self._lock, file_lock(self.snapshot_path):
+            self._refresh()
+            if not os.path.exists(self.sealed_path):
+                if not self._offset:
+                    return False
+                os.replace(self.journal_path, self.sealed_path)
+            records = list(self._records)
+        # Appends carry on against the fresh journal while the snapshot is written.
+        atomic_write_json(self.snapshot_path, records)
+        os.remove(self.sealed_path)
+        with self._lock:
+            self.compactions += 1
+            self._refresh()
+        return True
+
+    # ---- background compaction ----
+    def _ensure_compactor(self):
+        if self._compactor is not None and self._compactor_pid == os.getpid() and self._compactor.is_alive():
+            return
+        with self._lock:
+            if self._compactor is not None and self._compactor_pid == os.getpid() and self._compactor.is_alive():
+                return
+            self._compactor_pid = os.getpid()
+            self._compactor = threading.Thread(target=self._compact_loop, name=f'compact:{os.path.basename(self.snapshot_path)}', daemon=True)
+            self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            self._wakeup.wait(self.compact_interval)
+            self._wakeup.clear()
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('Compaction of %s failed', self.snapshot_path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'records': len(self._records),
+                'journal_records': self._pending,
+                'appends': self.appends,
+                'compactions': self.compactions,
+                'reloads': self.reloads,
+            }
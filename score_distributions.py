@@ -0,0 +1,159 @@
+"""Per-test score distributions for percentile ranks and leaderboards.
+
+Scores are percentages with one decimal, so each test's distribution is a
+fixed histogram of 1001 buckets (0.0, 0.1, ... 100.0) kept as a Fenwick
+tree: adding a score and counting the scores below one are both
+O(log buckets). Each test also keeps every user's best result and a list of
+those bests sorted with bisect, so the top N is a slice.
+
+Distributions live in memory per worker and follow the results store: every
+read first folds in the results stored since the last one (the repository's
+``since`` cursor), which also picks up submissions made by other workers.
+Only when the store was rewritten - records replaced, or scores changed in
+place by rescore_results.py - does the cursor break, and everything is
+rebuilt from history.
+"""
+
+import bisect
+import threading
+
+BUCKETS = 1001
+
+
+def _bucket(score):
+    return min(max(int(round(float(score or 0.0) * 10)), 0), BUCKETS - 1)
+
+
+class ScoreDistribution:
+    """Scores of one test: a Fenwick-tree histogram plus a leaderboard of personal bests."""
+
+    def __init__(self):
+        self._tree = [0] * (BUCKETS + 1)
+        self.count = 0
+        self._best = {}  # user_id -> leaderboard entry
+        self._board = []  # (-score, result_id, user_id), best first
+
+    @classmethod
+    def build(cls, results):
+        """A distribution of results built in one pass (linear Fenwick construction, one sort)."""
+        distribution = cls()
+        tree, best = distribution._tree, distribution._best
+        for result in results:
+            score = result.get('score_percentage')
+            tree[_bucket(score) + 1] += 1
+            distribution.count += 1
+            user_id = result.get('user_id')
+            if user_id is not None:
+                entry = (-float(score or 0.0), result.get('id'), user_id)
+                current = best.get(user_id)
+                if current is None or entry < current:
+                    best[user_id] = entry
+        for i in range(1, BUCKETS + 1):
+            parent = i + (i & -i)
+            if parent <= BUCKETS:
+                tree[parent] += tree[i]
+        distribution._board = sorted(best.values())
+        return distribution
+
+    def add(self, result):
+        i = _bucket(result.get('score_percentage')) + 1
+        while i <= BUCKETS:
+            self._tree[i] += 1
+            i += i & -i
+        self.count += 1
+
+        user_id = result.get('user_id')
+        if user_id is None:
+            return
+        entry = (-float(result.get('score_percentage') or 0.0), result.get('id'), user_id)
+        current = self._best.get(user_id)
+        if current is not None:
+            if current <= entry:
+                return  # not better than the personal best (earlier result wins ties)
+            del self._board[bisect.bisect_left(self._board, current)]
+        self._best[user_id] = entry
+        bisect.insort(self._board, entry)
+
+    def below(self, score):
+        """How many stored scores are strictly lower than score."""
+        i = _bucket(score)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def percentile(self, score):
+        """Share of attempts (0-100) that scored lower than score."""
+        if not self.count:
+            return None
+        return round(self.below(score) / self.count * 100, 1)
+
+    def top(self, limit):
+        return [{'user_id': user_id, 'result_id': result_id, 'score_percentage': -negative}
+                for negative, result_id, user_id in self._board[:limit]]
+
+
+class ScoreDistributions:
+    """The distributions of every test in one results repository, kept in step with it."""
+
+    def __init__(self, results_repository):
+        self.results = results_repository
+        self._lock = threading.Lock()
+        self._tests = {}
+        self._cursor = None
+        self._built = False
+        self.rebuilds = 0
+
+    def _catch_up(self):
+        if not self._built:
+            self._rebuild()
+            return
+        records, cursor = self.results.since(self._cursor)
+        if records is None:
+            self._rebuild()
+            return
+        for result in records:
+            self._tests.setdefault(result.get('test_id'), ScoreDistribution()).add(result)
+        self._cursor = cursor
+
+    def _rebuild(self):
+        records, cursor = self.results.since(None)
+        by_test = {}
+        for result in records:
+            by_test.setdefault(result.get('test_id'), []).append(result)
+        self._tests = {test_id: ScoreDistribution.build(results) for test_id, results in by_test.items()}
+        self._cursor = cursor
+        self._built = True
+        self.rebuilds += 1
+
+    def refresh(self):
+        """Fold in newly stored results; call after saving one."""
+        with self._lock:
+            self._catch_up()
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def percentile(self, test_id, score):
+        """(share of attempts scoring lower, number of attempts) for a score on test_id."""
+        with self._lock:
+            self._catch_up()
+            distribution = self._tests.get(test_id)
+            if distribution is None:
+                return None, 0
+            return distribution.percentile(score), distribution.count
+
+    def attempts(self, test_id):
+        with self._lock:
+            self._catch_up()
+            distribution = self._tests.get(test_id)
+            return distribution.count if distribution else 0
+
+    def leaderboard(self, test_id, limit=10):
+        """The best result of each user on test_id, highest score first."""
+        with self._lock:
+            self._catch_up()
+            distribution = self._tests.get(test_id)
+            return distribution.top(limit) if distribution else []
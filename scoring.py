@@ -0,0 +1,139 @@
+"""Answer keys compiled from test content, and bulk re-scoring.
+
+Each test's key is read from its ``content`` once: every multiple-choice
+question in ``content['passages']`` gives a form field (``question_<id>``)
+and the expected option index. Writing and Speaking tests have ``tasks``
+and no key; they get a provisional completion score until a human grades
+them. Keys are cached per test and catalog version, so a corrected
+oet_tests.json takes effect without a restart. Tests whose content has no
+key fall back to the per-section answers passed to ScoringEngine.
+
+``rescore`` compares stored answers against a key in bulk with NumPy: one
+(results x questions) array of answers against the key vector, in chunks.
+Only that path needs NumPy, so it is imported there.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANUAL_SECTIONS = ('Writing', 'Speaking')
+RESCORE_CHUNK_SIZE = 100_000
+
+
+class AnswerKey:
+    """The form fields of one test with their correct answers, in question order."""
+
+    __slots__ = ('section', 'fields', 'correct', 'manual_tasks', 'options')
+
+    def __init__(self, section, fields=(), correct=(), manual_tasks=0, options=()):
+        self.section = section
+        self.fields = tuple(fields)
+        self.correct = tuple(correct)
+        self.manual_tasks = manual_tasks
+        self.options = tuple(options)  # number of options per question, when known
+
+    @property
+    def is_manual(self):
+        return not self.fields
+
+    def score(self, answers):
+        if self.is_manual:
+            if not self.manual_tasks:
+                return 0.0
+            # Provisional score for completion; a human reviewer sets the real one.
+            completed = sum(1 for key, value in answers.items() if key.startswith('task_') and value.strip())
+            return min(50.0, completed / self.manual_tasks * 100 * 0.5)
+        correct_count = sum(1 for field, expected in zip(self.fields, self.correct) if answers.get(field) == expected)
+        return max(0.0, min(100.0, round(correct_count / len(self.fields) * 100, 1)))
+
+
+def compile_answer_key(test):
+    """Build the AnswerKey for a full test from its content, or None if it has none."""
+    content = test.get('content') or {}
+    section = test.get('section')
+    fields, correct, options = [], [], []
+    for passage in content.get('passages') or []:
+        for question in passage.get('questions') or []:
+            if question.get('correct_answer') is None or question.get('id') is None:
+                continue
+            fields.append(f"question_{question['id']}")
+            correct.append(str(question['correct_answer']))
+            options.append(len(question.get('options') or ()))
+    if fields:
+        return AnswerKey(section, fields, correct, options=options)
+    if section in MANUAL_SECTIONS and content.get('tasks'):
+        return AnswerKey(section, manual_tasks=len(content['tasks']))
+    return None
+
+
+def answer_key_from_table(section, answers):
+    """AnswerKey for a {field: answer} table such as main.TEST_ANSWERS[section]."""
+    if section in MANUAL_SECTIONS:
+        return AnswerKey(section, manual_tasks=len(answers))
+    return AnswerKey(section, answers.keys(), answers.values())
+
+
+class ScoringEngine:
+    def __init__(self, section_answers=None):
+        self._fallback = {section: answer_key_from_table(section, answers)
+                          for section, answers in (section_answers or {}).items()}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.compiles = 0
+
+    def key_for(self, test, version=None):
+        """The AnswerKey for a full test; cached while ``version`` stays the same.
+
+        With version None (no catalog version available) the key is compiled
+        on every call.
+        """
+        cache_key = (test.get('id'), version)
+        if version is not None:
+            with self._lock:
+                key = self._keys.get(cache_key)
+            if key is not None:
+                return key
+        key = compile_answer_key(test) or self._fallback.get(test.get('section'))
+        self.compiles += 1
+        if key is not None and version is not None:
+            with self._lock:
+                # Keys for older catalog versions are never asked for again.
+                self._keys = {k: v for k, v in self._keys.items() if k[1] == version}
+                self._keys[cache_key] = key
+        return key
+
+    def fallback_key(self, section):
+        return self._fallback.get(section)
+
+    def score(self, answers, test=None, section=None, version=None):
+        key = self.key_for(test, version) if test is not None else self.fallback_key(section)
+        if key is None:
+            logger.warning('No answer key for section %s', section or (test or {}).get('section'))
+            return 0.0
+        return key.score(answers)
+
+
+def rescore(results, key, chunk_size=RESCORE_CHUNK_SIZE):
+    """Score each result's stored ``answers`` against key; return {result id: new score}.
+
+    Manual keys cannot be re-scored and return an empty mapping.
+    """
+    import numpy as np
+
+    if key.is_manual:
+        return {}
+    expected = np.array(key.correct)
+    n_questions = len(key.fields)
+    scores = {}
+    for start in range(0, len(results), chunk_size):
+        chunk = results[start:start + chunk_size]
+        # Pulling answers out of the stored dicts is the only per-item Python
+        # work; one flat list converts to a fixed-width string array in one go.
+        given = np.array([str((r.get('answers') or {}).get(field, '')) for r in chunk for field in key.fields])
+        given = given.reshape(len(chunk), n_questions)
+        correct_counts = (given == expected).sum(axis=1)
+        percentages = np.clip(np.round(correct_counts / n_questions * 100, 1), 0.0, 100.0)
+        scores.update(zip((r['id'] for r in chunk), percentages.tolist()))
+    return scores
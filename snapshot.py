@@ -0,0 +1,265 @@
+"""Read-only record snapshots shared by every worker through mmap.
+
+Test catalogs, vocabulary and job listings are read on almost every request
+and edited rarely. Parsing them into dicts in each gunicorn worker
+multiplies their memory by the worker count, so they are compiled once per
+version of the source file into ``data/.catalog/<name>.snap`` and every
+worker maps that file read-only. The pages are then shared through the OS
+page cache, and a record is decoded only when a request looks at it.
+
+File layout (native byte order; a snapshot is read on the host that built it):
+
+    data      every record as compact UTF-8 JSON, back to back, padded to 8
+    offsets   (count + 1) unsigned 64-bit offsets of the records in data
+    header    JSON: the source signature and the record count
+    footer    offsets start, count, header length (3 x uint64) and MAGIC
+
+``SharedSnapshot`` builds the file under a lock, so concurrent workers
+compile it once, and compares the signature it was built from with the
+source file's on every access. When the source changes (content edited,
+file replaced) the next access rebuilds it into a temporary file and
+``os.replace``s it over the old one. Each process then maps the new file,
+and views already handed out keep reading the old mapping until they are
+released. ``DATA_SNAPSHOTS=0`` keeps decoded records in memory instead
+(the behaviour before snapshots).
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import logging
+import threading
+from array import array
+from collections.abc import Sequence
+
+from storage import file_lock, freeze, FrozenList, StorageBusyError
+from metrics import SNAPSHOT_BUILDS, SNAPSHOT_BUILD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DATA_SNAPSHOTS = os.environ.get('DATA_SNAPSHOTS', '1').lower() not in ('0', 'false', 'no')
+# Seconds a worker waits for another one to finish building a snapshot
+SNAPSHOT_BUILD_TIMEOUT = float(os.environ.get('SNAPSHOT_BUILD_TIMEOUT', 120.0))
+
+MAGIC = b'OETSNAP1'
+_FOOTER = struct.Struct('=QQQ8s')
+
+
+def source_signature(path):
+    """[mtime_ns, size, inode] of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def write_snapshot(path, records, source=None):
+    """Write records (any iterable of JSON values) to a snapshot at path atomically."""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    offsets = array('Q', [0])
+    try:
+        with open(tmp_path, 'wb') as f:
+            position = 0
+            for record in records:
+                data = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+                f.write(data)
+                position += len(data)
+                offsets.append(position)
+            f.write(b'\0' * (-position % 8))
+            offsets_start = position + (-position % 8)
+            f.write(offsets.tobytes())
+            header = json.dumps({'source': source, 'count': len(offsets) - 1,
+                                 'byteorder': sys.byteorder}).encode('utf-8')
+            f.write(header)
+            f.write(_FOOTER.pack(offsets_start, len(offsets) - 1, len(header), MAGIC))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Snapshot:
+    """A snapshot file mapped read-only; ``snapshot[i]`` decodes record i."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _FOOTER.size:
+            raise ValueError(f'{path} is not a snapshot')
+        offsets_start, count, header_length, magic = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a snapshot')
+        header_start = offsets_start + (count + 1) * 8
+        header = json.loads(self._map[header_start:header_start + header_length])
+        if header.get('byteorder') != sys.byteorder:
+            raise ValueError(f'{path} was built on another platform')
+        self.path = path
+        self.source = header['source']
+        self._offsets = memoryview(self._map)[offsets_start:header_start].cast('Q')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, i):
+        """The undecoded JSON bytes of record i."""
+        return self._map[self._offsets[i]:self._offsets[i + 1]]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('snapshot record out of range')
+        return freeze(json.loads(self.raw(i)))
+
+    def view(self):
+        return RecordView(self, range(len(self)))
+
+
+class MemorySnapshot:
+    """Decoded records held in memory, with the interface of Snapshot (DATA_SNAPSHOTS=0)."""
+
+    def __init__(self, records, source=None):
+        self.path = None
+        self.source = source
+        self._records = FrozenList(freeze(record) for record in records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, i):
+        return self._records[i]
+
+    def view(self):
+        return RecordView(self, range(len(self)))
+
+
+class RecordView(Sequence):
+    """A read-only sequence of some of a snapshot's records, decoded on access.
+
+    Indexing returns one record; slicing returns a FrozenList of decoded
+    records (a page); ``take`` narrows the view without decoding anything.
+    """
+
+    __slots__ = ('snapshot', 'positions')
+
+    def __init__(self, snapshot, positions):
+        self.snapshot = snapshot
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return FrozenList(self.snapshot[p] for p in self.positions[i])
+        return self.snapshot[self.positions[i]]
+
+    def __iter__(self):
+        snapshot = self.snapshot
+        for p in self.positions:
+            yield snapshot[p]
+
+    def take(self, indexes):
+        """A view of items ``indexes`` (positions in this view), in that order."""
+        positions = self.positions
+        return RecordView(self.snapshot, array('L', (positions[i] for i in indexes)))
+
+    def __repr__(self):
+        return f'<RecordView of {len(self)} records from {self.snapshot.path or "memory"}>'
+
+
+def take(records, indexes):
+    """records[i] for i in indexes, as a view when records is one, else a FrozenList."""
+    if isinstance(records, RecordView):
+        return records.take(indexes)
+    return FrozenList(records[i] for i in indexes)
+
+
+class SharedSnapshot:
+    """The snapshot of one source file, rebuilt when the source changes.
+
+    ``build(source_path)`` yields the records; it is called in one process
+    per source version. current() returns the Snapshot for the source as it
+    is now.
+    """
+
+    def __init__(self, source_path, path, build, enabled=DATA_SNAPSHOTS):
+        self.source_path = source_path
+        self.path = path
+        self.build = build
+        self.enabled = enabled
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.builds = 0
+        self.opens = 0
+
+    def current(self):
+        source = source_signature(self.source_path)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.source == source:
+            return snapshot
+        with self._lock:
+            source = source_signature(self.source_path)
+            if self._snapshot is None or self._snapshot.source != source:
+                self._snapshot = self._load(source)
+            return self._snapshot
+
+    def _load(self, source):
+        if source is None:
+            return MemorySnapshot([], None)
+        try:
+            if not self.enabled:
+                snapshot = MemorySnapshot(self.build(self.source_path), source)
+                self.builds += 1
+                return snapshot
+            snapshot = self._open(source)
+            if snapshot is None:
+                with file_lock(self.path, timeout=SNAPSHOT_BUILD_TIMEOUT):
+                    # Another worker may have built it while this one waited for the lock.
+                    snapshot = self._open(source)
+                    if snapshot is None:
+                        self._build(source)
+                        snapshot = self._open(source)
+            return snapshot or MemorySnapshot([], source)
+        except StorageBusyError:
+            raise
+        except (ValueError, OSError):
+            # Served empty until the source changes again, instead of retrying on every request.
+            logger.exception('Could not build a snapshot of %s', self.source_path)
+            return MemorySnapshot([], source)
+
+    def _open(self, source):
+        try:
+            snapshot = Snapshot(self.path)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning('Rebuilding unreadable snapshot %s', self.path)
+            return None
+        if snapshot.source != source:
+            return None
+        self.opens += 1
+        return snapshot
+
+    def _build(self, source):
+        started = time.perf_counter()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        write_snapshot(self.path, self.build(self.source_path), source)
+        self.builds += 1
+        SNAPSHOT_BUILDS.inc(self.name)
+        SNAPSHOT_BUILD_SECONDS.observe(time.perf_counter() - started, self.name)
+        logger.info('Built snapshot %s from %s', self.path, self.source_path)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {'records': len(snapshot) if snapshot is not None else 0,
+                'mapped': isinstance(snapshot, Snapshot), 'builds': self.builds, 'opens': self.opens}
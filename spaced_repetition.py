@@ -0,0 +1,238 @@
+"""Spaced-repetition reviews for learned vocabulary (SM-2).
+
+Every (user, word) pair has a review state::
+
+    {'ease': 2.5, 'interval': 6, 'repetitions': 2,
+     'due': '2025-01-07T09:30:00', 'reviewed_at': '2025-01-01T09:30:00'}
+
+``interval`` is in days and ``due`` is an ISO timestamp, so due times sort as
+strings. Each user's states sit in a min-heap keyed by ``due`` (stale heap
+entries are skipped lazily), so the next N due words cost O(N log n).
+
+Reviews are written behind: ``ReviewScheduler.review`` updates the in-memory
+queue at once and buffers the new state, and the buffer is flushed in one
+repository write every ``REVIEW_FLUSH_INTERVAL`` seconds, once
+``REVIEW_FLUSH_MAX`` states are waiting, or at exit. A worker that is killed
+outright loses at most the last interval of reviews.
+"""
+
+import os
+import heapq
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+REVIEW_FLUSH_INTERVAL = float(os.environ.get('REVIEW_FLUSH_INTERVAL', 2.0))
+REVIEW_FLUSH_MAX = int(os.environ.get('REVIEW_FLUSH_MAX', 200))
+REVIEW_QUEUE_CACHE_SIZE = int(os.environ.get('REVIEW_QUEUE_CACHE_SIZE', 1000))
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+
+def _timestamp(moment):
+    return moment.replace(microsecond=0).isoformat()
+
+
+def new_state(now):
+    """State for a word that was just learned: first review in a day."""
+    return {
+        'ease': INITIAL_EASE,
+        'interval': 1,
+        'repetitions': 0,
+        'due': _timestamp(now + timedelta(days=1)),
+        'reviewed_at': _timestamp(now),
+    }
+
+
+def sm2(state, quality, now):
+    """Next state after a review graded quality (0 = blackout .. 5 = perfect recall)."""
+    ease = state.get('ease', INITIAL_EASE)
+    repetitions = state.get('repetitions', 0)
+    interval = state.get('interval', 0)
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = max(1, round(interval * ease))
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        'ease': round(ease, 4),
+        'interval': interval,
+        'repetitions': repetitions,
+        'due': _timestamp(now + timedelta(days=interval)),
+        'reviewed_at': _timestamp(now),
+    }
+
+
+class ReviewQueue:
+    """One user's review states with a heap of (due, word_id)."""
+
+    def __init__(self, states):
+        self.states = dict(states)
+        self._heap = [(state['due'], word_id) for word_id, state in self.states.items()]
+        heapq.heapify(self._heap)
+
+    def set(self, word_id, state):
+        self.states[word_id] = state
+        heapq.heappush(self._heap, (state['due'], word_id))
+
+    def due(self, now, limit):
+        """Up to limit (word_id, state) pairs due at or before now, earliest first."""
+        now = _timestamp(now)
+        taken = []
+        while self._heap and len(taken) < limit and self._heap[0][0] <= now:
+            due, word_id = heapq.heappop(self._heap)
+            state = self.states.get(word_id)
+            if state is None or state['due'] != due:
+                continue  # superseded by a later review
+            taken.append((word_id, state))
+        for word_id, state in taken:
+            heapq.heappush(self._heap, (state['due'], word_id))
+        return taken
+
+    def next_due(self):
+        """The earliest due time, or None if nothing is scheduled."""
+        while self._heap:
+            due, word_id = self._heap[0]
+            state = self.states.get(word_id)
+            if state is not None and state['due'] == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+
+class ReviewScheduler:
+    def __init__(self, repository, progress_repository, flush_interval=REVIEW_FLUSH_INTERVAL,
+                 max_pending=REVIEW_FLUSH_MAX, cache_size=REVIEW_QUEUE_CACHE_SIZE):
+        self.repository = repository
+        self.progress_repository = progress_repository
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._queues = OrderedDict()  # user_id -> (repository version, ReviewQueue)
+        self._pending = {}  # user_id -> {word_id: state} not yet written
+        self._pending_count = 0
+        self._inflight = {}  # states being written by flush()
+        self._flusher = None
+        self._flusher_pid = None
+        self._wakeup = threading.Event()
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    def _queue(self, user_id, now):
+        version = self.repository.version(user_id)
+        cached = self._queues.get(user_id)
+        if cached is not None and version is not None and cached[0] == version:
+            self._queues.move_to_end(user_id)
+            return cached[1]
+        states = dict(self.repository.states(user_id))
+        states.update(self._inflight.get(user_id, {}))
+        states.update(self._pending.get(user_id, {}))
+        # Words learned before reviews existed start out due now.
+        for word_id in self.progress_repository.get(user_id).get('learned_words', []):
+            if word_id not in states:
+                states[word_id] = dict(new_state(now), due=_timestamp(now))
+        queue = ReviewQueue(states)
+        self._queues[user_id] = (version, queue)
+        self._queues.move_to_end(user_id)
+        while len(self._queues) > self.cache_size:
+            self._queues.popitem(last=False)
+        return queue
+
+    def due(self, user_id, limit=10, now=None):
+        """The next words due for review as (word_id, state), earliest first."""
+        now = now or datetime.now()
+        with self._lock:
+            return self._queue(user_id, now).due(now, limit)
+
+    def next_due(self, user_id, now=None):
+        with self._lock:
+            return self._queue(user_id, now or datetime.now()).next_due()
+
+    def add(self, user_id, word_id, now=None):
+        """Start scheduling a newly learned word; no-op if it already has a state."""
+        now = now or datetime.now()
+        with self._lock:
+            queue = self._queue(user_id, now)
+            if word_id in queue.states:
+                return queue.states[word_id]
+            return self._record(user_id, word_id, new_state(now), queue)
+
+    def review(self, user_id, word_id, quality, now=None):
+        """Grade one review (quality 0-5) and return the word's new state."""
+        if not 0 <= quality <= 5:
+            raise ValueError('quality must be between 0 and 5')
+        now = now or datetime.now()
+        with self._lock:
+            queue = self._queue(user_id, now)
+            state = sm2(queue.states.get(word_id) or new_state(now), quality, now)
+            return self._record(user_id, word_id, state, queue)
+
+    def _record(self, user_id, word_id, state, queue):
+        queue.set(word_id, state)
+        user_pending = self._pending.setdefault(user_id, {})
+        if word_id not in user_pending:
+            self._pending_count += 1
+        user_pending[word_id] = state
+        self._ensure_flusher()
+        if self._pending_count >= self.max_pending:
+            self._wakeup.set()
+        return state
+
+    def flush(self):
+        """Write all buffered states in one repository update."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_count = self._pending, {}, 0
+                self._inflight = pending
+            if not pending:
+                return 0
+            try:
+                self.repository.save_many(pending)
+            except Exception:
+                # Put them back (newer reviews win) so the next flush retries.
+                with self._lock:
+                    for user_id, states in pending.items():
+                        merged = dict(states, **self._pending.get(user_id, {}))
+                        self._pending_count += len(merged) - len(self._pending.get(user_id, {}))
+                        self._pending[user_id] = merged
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            self.flushes += 1
+            return sum(len(states) for states in pending.values())
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._flush_loop, name='review-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing vocabulary reviews failed')
+
+    def stats(self):
+        with self._lock:
+            return {'cached_users': len(self._queues), 'pending': self._pending_count, 'flushes': self.flushes}
@@ -0,0 +1,639 @@
+"""SQLAlchemy implementation of the repositories in repositories.py.
+
+Tables are created on first use. Every record is stored with its filter and
+sort fields as indexed columns (user_id, email, test_id, completed_at, ...).
+Tests and jobs also keep the full JSON document in a ``data`` column so they
+come back exactly as they are in the JSON files; tests additionally store a
+content-free ``summary`` so listings never load passages.
+"""
+
+import time
+
+from sqlalchemy import (
+    MetaData, Table, Column, Integer, Float, String, Text, Boolean, JSON, Index,
+    create_engine, select, delete, update, func, insert, and_, or_, bindparam,
+)
+from sqlalchemy.exc import IntegrityError
+
+from storage import freeze
+from draft_store import DRAFT_MAX_AGE, is_live, merge_draft
+from repositories import Repositories
+from progress_aggregates import add_result
+from user_directory import normalize_email
+
+metadata = MetaData()
+
+users_table = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), nullable=False),
+    Column('email', String(255), nullable=False),
+    Column('password_hash', String(255)),
+    Column('subscription_type', String(50)),
+    Column('subscription_expires', String(32)),
+    Column('is_superuser', Boolean, nullable=False, default=False),
+    Column('created_at', String(32)),
+)
+# Logins look users up by case-normalised email.
+Index('ix_users_email_lower', func.lower(users_table.c.email))
+
+tests_table = Table(
+    'tests', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('title', String(255)),
+    Column('section', String(50)),
+    Column('test_type', String(20)),
+    Column('is_mock_test', Boolean, nullable=False, default=False),
+    Column('is_premium', Boolean, nullable=False, default=False),
+    Column('duration_minutes', Integer),
+    Column('summary', JSON, nullable=False),
+    Column('data', JSON, nullable=False),
+    Index('ix_tests_section', 'section'),
+    Index('ix_tests_type', 'test_type', 'is_mock_test'),
+)
+
+
+def _results_table(name):
+    return Table(
+        name, metadata,
+        Column('id', Integer, primary_key=True),
+        Column('user_id', Integer),
+        Column('test_id', Integer),
+        Column('score_percentage', Float),
+        Column('time_taken_minutes', Integer),
+        Column('answers', JSON),
+        Column('completed_at', String(32)),
+        Index(f'ix_{name}_user_completed', 'user_id', 'completed_at'),
+        Index(f'ix_{name}_test_id', 'test_id'),
+        Index(f'ix_{name}_completed_at', 'completed_at'),
+    )
+
+
+test_results_table = _results_table('test_results')
+mock_test_results_table = _results_table('mock_test_results')
+
+# Bumped when a results table's rows are replaced or changed in place, so
+# readers that follow it by id (ScoreDistributions) start over.
+store_generations_table = Table(
+    'store_generations', metadata,
+    Column('name', String(64), primary_key=True),
+    Column('generation', Integer, nullable=False),
+)
+
+vocabulary_progress_table = Table(
+    'vocabulary_progress', metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=False),
+    Column('word_id', Integer, primary_key=True, autoincrement=False),
+    Column('position', Integer, nullable=False, default=0),
+)
+
+vocabulary_reviews_table = Table(
+    'vocabulary_reviews', metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=False),
+    Column('word_id', Integer, primary_key=True, autoincrement=False),
+    Column('ease', Float, nullable=False),
+    Column('interval', Integer, nullable=False),
+    Column('repetitions', Integer, nullable=False),
+    Column('due', String(32), nullable=False),
+    Column('reviewed_at', String(32)),
+    Index('ix_vocabulary_reviews_user_due', 'user_id', 'due'),
+)
+
+# Derived from the results tables (see progress_aggregates.py); not migrated,
+# rebuilt on demand.
+progress_aggregates_table = Table(
+    'progress_aggregates', metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=False),
+    Column('last_result_id', Integer, nullable=False),
+    Column('data', JSON, nullable=False),
+)
+
+chat_messages_table = Table(
+    'chat_messages', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, nullable=False),
+    Column('message', Text, nullable=False),
+    Column('timestamp', String(32)),
+    Column('is_admin_reply', Boolean, nullable=False, default=False),
+    Index('ix_chat_messages_user_id', 'user_id', 'id'),
+)
+
+jobs_table = Table(
+    'jobs', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('title', String(255)),
+    Column('company', String(255)),
+    Column('location', String(255)),
+    Column('job_type', String(50)),
+    Column('posted_date', String(32)),
+    Column('data', JSON, nullable=False),
+    Index('ix_jobs_location', 'location'),
+)
+
+# In-progress test attempts (see draft_store.py); transient, not migrated.
+test_drafts_table = Table(
+    'test_drafts', metadata,
+    Column('key', String(128), primary_key=True),
+    Column('updated_at', Float, nullable=False),
+    Column('data', JSON, nullable=False),
+    Index('ix_test_drafts_updated_at', 'updated_at'),
+)
+
+
+# ============ Row conversion (shared with migrate_json_to_sql.py) ============
+def user_row(record):
+    return {
+        'id': record.get('id'),
+        'username': record.get('username'),
+        'email': record.get('email'),
+        'password_hash': record.get('password_hash'),
+        'subscription_type': record.get('subscription_type'),
+        'subscription_expires': record.get('subscription_expires'),
+        'is_superuser': bool(record.get('is_superuser', False)),
+        'created_at': record.get('created_at'),
+    }
+
+
+def test_row(record):
+    return {
+        'id': record['id'],
+        'title': record.get('title'),
+        'section': record.get('section'),
+        'test_type': record.get('test_type'),
+        'is_mock_test': bool(record.get('is_mock_test', False)),
+        'is_premium': bool(record.get('is_premium', False)),
+        'duration_minutes': record.get('duration_minutes'),
+        'summary': {k: v for k, v in record.items() if k != 'content'},
+        'data': record,
+    }
+
+
+def result_row(record):
+    return {
+        'id': record.get('id'),
+        'user_id': record.get('user_id'),
+        'test_id': record.get('test_id'),
+        'score_percentage': record.get('score_percentage'),
+        'time_taken_minutes': record.get('time_taken_minutes'),
+        'answers': record.get('answers') or {},
+        'completed_at': record.get('completed_at'),
+    }
+
+
+def review_row(user_id, word_id, state):
+    return {
+        'user_id': int(user_id),
+        'word_id': int(word_id),
+        'ease': state['ease'],
+        'interval': state['interval'],
+        'repetitions': state['repetitions'],
+        'due': state['due'],
+        'reviewed_at': state.get('reviewed_at'),
+    }
+
+
+def chat_row(user_id, message):
+    return {
+        'user_id': int(user_id),
+        'message': message.get('message', ''),
+        'timestamp': message.get('timestamp'),
+        'is_admin_reply': bool(message.get('is_admin_reply', False)),
+    }
+
+
+def job_row(record):
+    return {
+        'id': record['id'],
+        'title': record.get('title'),
+        'company': record.get('company'),
+        'location': record.get('location'),
+        'job_type': record.get('job_type'),
+        'posted_date': record.get('posted_date'),
+        'data': record,
+    }
+
+
+def _record(row):
+    return freeze(dict(row._mapping))
+
+
+# ============ Repositories ============
+class SqlUserRepository:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def all(self):
+        with self.engine.connect() as conn:
+            return freeze([dict(r._mapping) for r in conn.execute(select(users_table).order_by(users_table.c.id))])
+
+    def get_by_id(self, user_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(users_table).where(users_table.c.id == user_id)).first()
+        return _record(row) if row else None
+
+    def get_by_email(self, email):
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(users_table)
+                .where(func.lower(users_table.c.email) == normalize_email(email))
+                .order_by(users_table.c.id)
+            ).first()
+        return _record(row) if row else None
+
+    def create(self, user_data):
+        row = user_row(user_data)
+        row.pop('id')
+        with self.engine.begin() as conn:
+            user_id = conn.execute(insert(users_table).values(**row)).inserted_primary_key[0]
+        return self.get_by_id(user_id)
+
+    def set_password_hash(self, user_id, password_hash):
+        with self.engine.begin() as conn:
+            conn.execute(update(users_table).where(users_table.c.id == user_id).values(password_hash=password_hash))
+
+    def replace_all(self, users):
+        with self.engine.begin() as conn:
+            conn.execute(delete(users_table))
+            rows = [user_row(u) for u in users]
+            if rows:
+                conn.execute(insert(users_table), rows)
+
+
+class SqlTestRepository:
+    """Listings read only the summary column; get() returns the full test."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _summaries(self, *where):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(tests_table.c.summary).where(*where).order_by(tests_table.c.id))
+            return freeze([r.summary for r in rows])
+
+    def all(self):
+        return self._summaries()
+
+    def practice_tests(self):
+        return self._summaries(tests_table.c.test_type == 'practice', tests_table.c.is_mock_test.is_(False))
+
+    def mock_tests(self):
+        return self._summaries(tests_table.c.is_mock_test.is_(True))
+
+    def get_summary(self, test_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(tests_table.c.summary).where(tests_table.c.id == test_id)).first()
+        return freeze(row.summary) if row else None
+
+    def get(self, test_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(tests_table.c.data).where(tests_table.c.id == test_id)).first()
+        return freeze(row.data) if row else None
+
+    def version(self):
+        # No cheap change marker for the tests table; callers treat None as "don't cache".
+        return None
+
+    def get_summaries(self, test_ids):
+        if not test_ids:
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(tests_table.c.id, tests_table.c.summary).where(tests_table.c.id.in_(list(test_ids))))
+            return {r.id: freeze(r.summary) for r in rows}
+
+
+class SqlResultRepository:
+    def __init__(self, engine, table):
+        self.engine = engine
+        self.table = table
+
+    def _select(self, *where):
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(self.table).where(*where).order_by(self.table.c.id))
+            return freeze([dict(r._mapping) for r in rows])
+
+    def all(self):
+        return self._select()
+
+    def get(self, result_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.id == result_id)).first()
+        return _record(row) if row else None
+
+    def for_user(self, user_id, limit=None, before=None):
+        t = self.table
+        query = select(t).where(t.c.user_id == user_id)
+        if before is not None:
+            cursor = self.get(before)
+            if cursor is None or cursor['user_id'] != user_id:
+                return []
+            completed_at = cursor['completed_at'] or ''
+            query = query.where(or_(
+                func.coalesce(t.c.completed_at, '') < completed_at,
+                and_(func.coalesce(t.c.completed_at, '') == completed_at, t.c.id < before),
+            ))
+        query = query.order_by(t.c.completed_at.desc(), t.c.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        with self.engine.connect() as conn:
+            return freeze([dict(r._mapping) for r in conn.execute(query)])
+
+    def count_for_user(self, user_id):
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self.table).where(self.table.c.user_id == user_id)).scalar()
+
+    def for_test(self, test_id):
+        return self._select(self.table.c.test_id == test_id)
+
+    def _generation(self, conn):
+        g = store_generations_table
+        return conn.execute(select(g.c.generation).where(g.c.name == self.table.name)).scalar() or 0
+
+    def _bump_generation(self, conn):
+        g = store_generations_table
+        if not conn.execute(update(g).where(g.c.name == self.table.name).values(generation=g.c.generation + 1)).rowcount:
+            conn.execute(insert(g).values(name=self.table.name, generation=1))
+
+    def since(self, cursor):
+        """(records with an id above cursor, new cursor); start with cursor None.
+
+        Records carry only id, user_id, test_id and score_percentage. Returns
+        (None, None) if the table was rewritten since the cursor was taken.
+        """
+        t = self.table
+        last_id, generation = cursor if cursor is not None else (0, None)
+        with self.engine.connect() as conn:
+            current = self._generation(conn)
+            if cursor is not None and generation != current:
+                return None, None
+            rows = conn.execute(select(t.c.id, t.c.user_id, t.c.test_id, t.c.score_percentage)
+                                .where(t.c.id > last_id).order_by(t.c.id))
+            records = freeze([dict(r._mapping) for r in rows])
+        return records, (records[-1]['id'] if records else last_id, current)
+
+    def iter_all(self, batch_size=10000):
+        """Stream every record in id order, one keyset-paged query per batch."""
+        t = self.table
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = [dict(r._mapping) for r in conn.execute(
+                    select(t).where(t.c.id > last_id).order_by(t.c.id).limit(batch_size))]
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]['id']
+
+    def append(self, record):
+        row = result_row(record)
+        row.pop('id')
+        with self.engine.begin() as conn:
+            result_id = conn.execute(insert(self.table).values(**row)).inserted_primary_key[0]
+        return freeze({'id': result_id, **row})
+
+    def update_many(self, changes):
+        """Apply {result id: {field: value}} with one executemany per set of fields."""
+        groups = {}
+        for result_id, change in changes.items():
+            groups.setdefault(tuple(sorted(change)), []).append(dict(change, _id=result_id))
+        t = self.table
+        updated = 0
+        with self.engine.begin() as conn:
+            for fields, rows in groups.items():
+                statement = update(t).where(t.c.id == bindparam('_id')).values({f: bindparam(f) for f in fields})
+                updated += conn.execute(statement, rows).rowcount
+            if updated:
+                self._bump_generation(conn)
+        return updated
+
+    def replace_all(self, records):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table))
+            rows = [result_row(r) for r in records]
+            if rows:
+                conn.execute(insert(self.table), rows)
+            self._bump_generation(conn)
+
+
+class SqlVocabularyProgressRepository:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get(self, user_id):
+        t = vocabulary_progress_table
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t.c.word_id).where(t.c.user_id == user_id).order_by(t.c.position, t.c.word_id))
+            return freeze({'learned_words': [r.word_id for r in rows]})
+
+    def add_learned_word(self, user_id, word_id):
+        t = vocabulary_progress_table
+        try:
+            with self.engine.begin() as conn:
+                position = conn.execute(select(func.count()).select_from(t).where(t.c.user_id == user_id)).scalar()
+                conn.execute(insert(t).values(user_id=user_id, word_id=word_id, position=position))
+        except IntegrityError:
+            return False
+        return True
+
+
+class SqlVocabularyReviewRepository:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def version(self, user_id):
+        # Rows are read per user with an indexed query, so there is nothing to cache against.
+        return None
+
+    def states(self, user_id):
+        t = vocabulary_reviews_table
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t).where(t.c.user_id == user_id))
+            return {r.word_id: freeze({k: v for k, v in r._mapping.items() if k not in ('user_id', 'word_id')}) for r in rows}
+
+    def save_many(self, updates):
+        t = vocabulary_reviews_table
+        rows = [review_row(user_id, word_id, state) for user_id, states in updates.items() for word_id, state in states.items()]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            for user_id, states in updates.items():
+                conn.execute(delete(t).where(t.c.user_id == user_id, t.c.word_id.in_(list(states))))
+            conn.execute(insert(t), rows)
+
+
+class SqlProgressRepository:
+    # Concurrent updates of one user's aggregate are rare (one user submitting
+    # twice at once), so writes check last_result_id and retry instead of locking.
+    RETRIES = 5
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get(self, user_id):
+        t = progress_aggregates_table
+        with self.engine.connect() as conn:
+            data = conn.execute(select(t.c.data).where(t.c.user_id == user_id)).scalar()
+        return freeze(data) if data is not None else None
+
+    def add_result(self, user_id, result, summary):
+        t = progress_aggregates_table
+        for _ in range(self.RETRIES):
+            with self.engine.begin() as conn:
+                row = conn.execute(select(t.c.last_result_id, t.c.data).where(t.c.user_id == user_id)).first()
+                if row is None:
+                    return False
+                aggregate = dict(row.data)
+                if not add_result(aggregate, result, summary):
+                    return False
+                updated = conn.execute(
+                    update(t).where(t.c.user_id == user_id, t.c.last_result_id == row.last_result_id)
+                    .values(last_result_id=aggregate['last_result_id'], data=aggregate)
+                ).rowcount
+            if updated:
+                return True
+        return False
+
+    def save_many(self, aggregates):
+        t = progress_aggregates_table
+        if not aggregates:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.user_id.in_(list(aggregates))))
+            conn.execute(insert(t), [{'user_id': user_id, 'last_result_id': a['last_result_id'], 'data': a}
+                                     for user_id, a in aggregates.items()])
+
+    def replace_all(self, aggregates):
+        t = progress_aggregates_table
+        with self.engine.begin() as conn:
+            conn.execute(delete(t))
+            if aggregates:
+                conn.execute(insert(t), [{'user_id': user_id, 'last_result_id': a['last_result_id'], 'data': a}
+                                         for user_id, a in aggregates.items()])
+
+    def discard(self, user_ids):
+        t = progress_aggregates_table
+        with self.engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.user_id.in_(list(user_ids))))
+
+
+class SqlChatRepository:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _select(self, user_id, *where, newest=None):
+        t = chat_messages_table
+        query = select(t.c.id, t.c.message, t.c.timestamp, t.c.is_admin_reply).where(t.c.user_id == user_id, *where)
+        if newest is not None:
+            query = query.order_by(t.c.id.desc()).limit(newest)
+        else:
+            query = query.order_by(t.c.id)
+        with self.engine.connect() as conn:
+            rows = [dict(r._mapping) for r in conn.execute(query)]
+        if newest is not None:
+            rows.reverse()
+        return freeze(rows)
+
+    def messages(self, user_id):
+        return self._select(user_id)
+
+    def page(self, user_id, limit=50, before=None):
+        where = [chat_messages_table.c.id < before] if before is not None else []
+        return self._select(user_id, *where, newest=limit)
+
+    def since(self, user_id, after_id):
+        return self._select(user_id, chat_messages_table.c.id > after_id)
+
+    def latest_id(self, user_id):
+        t = chat_messages_table
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.coalesce(func.max(t.c.id), 0)).where(t.c.user_id == user_id)).scalar()
+
+    def append(self, user_id, message):
+        with self.engine.begin() as conn:
+            message_id = conn.execute(insert(chat_messages_table).values(**chat_row(user_id, message))).inserted_primary_key[0]
+        return freeze(dict(message, id=message_id))
+
+    def replace(self, user_id, messages):
+        t = chat_messages_table
+        with self.engine.begin() as conn:
+            conn.execute(delete(t).where(t.c.user_id == user_id))
+            rows = [chat_row(user_id, m) for m in messages]
+            if rows:
+                conn.execute(insert(t), rows)
+
+
+class SqlJobRepository:
+    def __init__(self, engine):
+        self.engine = engine
+
+    def version(self):
+        # No change marker on the jobs table; the job board rebuilds on a timer instead.
+        return None
+
+    def all(self):
+        with self.engine.connect() as conn:
+            return freeze([r.data for r in conn.execute(select(jobs_table.c.data).order_by(jobs_table.c.id))])
+
+    def get(self, job_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(select(jobs_table.c.data).where(jobs_table.c.id == job_id)).first()
+        return freeze(row.data) if row else None
+
+
+class SqlDraftRepository:
+    def __init__(self, engine, max_age=DRAFT_MAX_AGE):
+        self.engine = engine
+        self.max_age = max_age
+
+    def get(self, key):
+        t = test_drafts_table
+        with self.engine.connect() as conn:
+            row = conn.execute(select(t.c.data).where(t.c.key == key)).first()
+        draft = freeze(row.data) if row else None
+        return draft if is_live(draft, max_age=self.max_age) else None
+
+    def save_many(self, updates):
+        """Apply a batch of updates (see merge_draft) in one transaction."""
+        t = test_drafts_table
+        if not updates:
+            return
+        keys = list({u['key'] for u in updates})
+        with self.engine.begin() as conn:
+            drafts = {r.key: r.data for r in conn.execute(select(t.c.key, t.c.data).where(t.c.key.in_(keys)))}
+            for update in updates:
+                drafts[update['key']] = merge_draft(drafts.get(update['key']), update)
+            conn.execute(delete(t).where(t.c.key.in_(keys)))
+            conn.execute(insert(t), [{'key': key, 'updated_at': d['updated_at'], 'data': d} for key, d in drafts.items()])
+            # Finished and abandoned attempts are only needed until they expire.
+            conn.execute(delete(t).where(t.c.updated_at < time.time() - self.max_age))
+
+
+def normalize_database_url(url):
+    # Heroku/Replit style URLs use the scheme SQLAlchemy dropped in 1.4.
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def create_sql_engine(database_url):
+    engine = create_engine(normalize_database_url(database_url), pool_pre_ping=True)
+    metadata.create_all(engine)
+    # The app is created (and this runs) before gunicorn --preload forks; close the connection
+    # create_all left in the pool so workers open their own instead of sharing its socket.
+    engine.dispose()
+    return engine
+
+
+def create_sql_repositories(database_url):
+    engine = create_sql_engine(database_url)
+    return Repositories(
+        users=SqlUserRepository(engine),
+        tests=SqlTestRepository(engine),
+        results=SqlResultRepository(engine, test_results_table),
+        mock_results=SqlResultRepository(engine, mock_test_results_table),
+        vocabulary_progress=SqlVocabularyProgressRepository(engine),
+        vocabulary_reviews=SqlVocabularyReviewRepository(engine),
+        progress=SqlProgressRepository(engine),
+        chat=SqlChatRepository(engine),
+        jobs=SqlJobRepository(engine),
+        drafts=SqlDraftRepository(engine),
+    )
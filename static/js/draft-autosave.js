@@ -0,0 +1,119 @@
+// Server-side autosave for test forms marked with data-draft-url (see /api/drafts in main.py).
+// Answers are sent a moment after they change and when the page is hidden, and restored
+// when the same attempt is opened again, on this device or another one.
+class DraftAutosave {
+    constructor(form) {
+        this.form = form;
+        this.url = form.dataset.draftUrl;
+        this.attempt = form.dataset.draftAttempt;
+        this.revision = 0;
+        this.delay = 1500;
+        this.timer = null;
+        this.dirty = false;
+        this.stopped = false;
+
+        form.addEventListener('change', () => this.schedule());
+        form.addEventListener('input', () => this.schedule());
+        form.addEventListener('submit', () => this.cancel());
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') this.save(true);
+        });
+        this.load();
+    }
+
+    answers() {
+        const answers = {};
+        new FormData(this.form).forEach((value, name) => {
+            // Recorded audio (task_<id>_audio) is base64 and too large to autosave.
+            const field = name.startsWith('question_') || (name.startsWith('task_') && !name.endsWith('_audio'));
+            if (field && typeof value === 'string') answers[name] = value;
+        });
+        return answers;
+    }
+
+    restore(answers) {
+        Object.entries(answers).forEach(([name, value]) => {
+            const field = this.form.elements[name];
+            if (!field) return;
+            if (field instanceof RadioNodeList || field.type === 'radio' || field.type === 'checkbox') {
+                const options = field instanceof RadioNodeList ? Array.from(field) : [field];
+                options.forEach(option => {
+                    if (option.value === value) {
+                        option.checked = true;
+                        const container = option.closest('.answer-option, .option');
+                        if (container) container.classList.add('selected');
+                    }
+                });
+            } else if (!field.value) {
+                field.value = value;
+            }
+        });
+    }
+
+    async load() {
+        try {
+            const response = await fetch(this.url, { credentials: 'same-origin' });
+            if (!response.ok) return;
+            const draft = await response.json();
+            if (draft.attempt !== this.attempt) return;
+            this.revision = Math.max(this.revision, draft.revision || 0);
+            this.restore(draft.answers || {});
+        } catch (error) {
+            console.warn('Could not load saved answers:', error);
+        }
+    }
+
+    schedule() {
+        this.dirty = true;
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.save(false), this.delay);
+    }
+
+    cancel() {
+        clearTimeout(this.timer);
+        this.dirty = false;
+    }
+
+    conflict(current) {
+        if (current.attempt === this.attempt) {
+            // Another tab or device saved a later revision of this attempt; save ours after it.
+            this.revision = Math.max(this.revision, current.revision || 0);
+            this.schedule();
+        } else {
+            // The attempt was submitted or replaced; stop saving over it.
+            this.stopped = true;
+            console.warn('This attempt is no longer the current one; answers are not being saved.');
+        }
+    }
+
+    save(leaving) {
+        if (!this.dirty || this.stopped) return;
+        clearTimeout(this.timer);
+        this.dirty = false;
+        this.revision += 1;
+        const body = JSON.stringify({ attempt: this.attempt, revision: this.revision, answers: this.answers() });
+        if (leaving && navigator.sendBeacon) {
+            navigator.sendBeacon(this.url, new Blob([body], { type: 'application/json' }));
+            return;
+        }
+        fetch(this.url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json' },
+            body: body,
+            keepalive: true
+        }).then(response => {
+            if (response.status === 409) return response.json().then(current => this.conflict(current));
+            if (!response.ok && response.status !== 400) this.dirty = true;
+        }).catch(() => {
+            this.dirty = true;  // offline: retried with the next change or when the page is hidden
+        });
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const form = document.querySelector('form[data-draft-url]');
+    if (form) {
+        window.draftAutosave = new DraftAutosave(form);
+    }
+});
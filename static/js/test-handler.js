@@ -74,6 +74,11 @@ class TestHandler {
             answers: this.answers,
             timestamp: Date.now()
         }));
+
+        // And on the server, when the page has a draft (draft-autosave.js)
+        if (window.draftAutosave) {
+            window.draftAutosave.schedule();
+        }
     }
 
     updateProgress() {
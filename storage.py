@@ -0,0 +1,397 @@
+"""JSON file storage for the data/ directory.
+
+Parsed files are kept in an in-process LRU cache keyed by absolute path and
+revalidated against the file's (mtime, size, inode) on every read, so repeated
+reads of an unchanged file cost one ``os.stat`` instead of a full parse.
+Cached documents are frozen: callers either read the shared snapshot directly
+(``read_json_file``) or receive a private mutable copy (``load_json_file``).
+
+Writes go to a temp file that is renamed over the original, so a reader in
+another worker never sees a half-written file. Read-modify-write sequences
+are serialised across gunicorn workers with ``file_lock``, and ``IdSequence``
+hands out ids without scanning the records.
+
+Reads, cache hits, parse and write times, bytes and lock waits are recorded
+in ``metrics``.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from metrics import (STORAGE_CACHE, STORAGE_LOCK_WAIT_SECONDS, STORAGE_PARSE_SECONDS, STORAGE_READ_BYTES,
+                     STORAGE_READS, STORAGE_WRITE_BYTES, STORAGE_WRITE_SECONDS, STORAGE_WRITES)
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: locks only cover threads of this process
+    fcntl = None
+
+JSON_CACHE_MAX_ENTRIES = int(os.environ.get('JSON_CACHE_MAX_ENTRIES', 64))
+JSON_CACHE_MAX_BYTES = int(os.environ.get('JSON_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+STORAGE_LOCK_TIMEOUT = float(os.environ.get('STORAGE_LOCK_TIMEOUT', 10.0))
+STORAGE_FSYNC = os.environ.get('STORAGE_FSYNC', '1') not in ('0', 'false', 'no')
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError(f'{type(self).__name__} is a shared read-only snapshot; copy it before modifying')
+
+
+class FrozenDict(dict):
+    """Read-only dict; ``dict(d)`` or ``d.copy()`` returns a mutable shallow copy."""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """Read-only list; ``list(l)`` or ``l.copy()`` returns a mutable shallow copy."""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(obj):
+    """Recursively convert parsed JSON into FrozenDict/FrozenList."""
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+def thaw(obj):
+    """Recursively copy JSON-like data into plain, mutable dicts and lists."""
+    if isinstance(obj, dict):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [thaw(v) for v in obj]
+    return obj
+
+
+class JsonFileCache:
+    """LRU cache of parsed JSON files validated by (mtime, size, inode)."""
+
+    def __init__(self, max_entries=JSON_CACHE_MAX_ENTRIES, max_bytes=JSON_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reparses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _signature(st):
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, filepath):
+        """Return the frozen document for filepath, parsing it only if it changed.
+
+        Raises FileNotFoundError and json.JSONDecodeError like a plain read.
+        """
+        key = os.path.abspath(filepath)
+        st = os.stat(key)
+        signature = self._signature(st)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                STORAGE_CACHE.inc('hit')
+                return entry[1]
+            if entry is None:
+                self.misses += 1
+                STORAGE_CACHE.inc('miss')
+            else:
+                self.reparses += 1
+                STORAGE_CACHE.inc('reparse')
+
+        started = time.perf_counter()
+        with open(key, 'r', encoding='utf-8') as f:
+            data = freeze(json.load(f))
+        STORAGE_PARSE_SECONDS.observe(time.perf_counter() - started)
+        STORAGE_READ_BYTES.inc(amount=st.st_size)
+
+        # Only cache if the file did not change while we were parsing it.
+        if self._signature(os.stat(key)) == signature:
+            self._store(key, signature, data, st.st_size)
+        return data
+
+    def _store(self, key, signature, data, size):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (signature, data, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def invalidate(self, filepath=None):
+        """Drop one cached file, or everything when filepath is None."""
+        with self._lock:
+            if filepath is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return
+            entry = self._entries.pop(os.path.abspath(filepath), None)
+            if entry is not None:
+                self._bytes -= entry[2]
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'reparses': self.reparses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+json_cache = JsonFileCache()
+
+
+def read_json_file(filepath, default=None):
+    """Return the shared, read-only parsed contents of a JSON file."""
+    STORAGE_READS.inc('read_json_file')
+    return _read(filepath, [] if default is None else default)
+
+
+def _read(filepath, default):
+    if not os.path.exists(filepath):
+        save_json_file(filepath, default)
+        return freeze(default)
+    try:
+        return json_cache.get(filepath)
+    except (json.JSONDecodeError, FileNotFoundError):
+        return freeze(default)
+
+
+def load_json_file(filepath, default=None):
+    """Return a private, mutable copy of a JSON file's contents."""
+    STORAGE_READS.inc('load_json_file')
+    return thaw(_read(filepath, [] if default is None else default))
+
+
+def save_json_file(filepath, data):
+    """Atomically replace filepath, so readers see either the old or the new file.
+
+    Read-modify-write callers must hold ``file_lock(filepath)`` around the
+    load and the save, otherwise concurrent updates can be lost.
+    """
+    atomic_write_json(filepath, data, fsync=STORAGE_FSYNC)
+
+
+def atomic_write_json(filepath, data, fsync=True):
+    """Write data to a temp file in the same directory and rename it into place."""
+    directory = os.path.dirname(filepath) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f'.{os.path.basename(filepath)}.{os.getpid()}.{threading.get_ident()}.tmp')
+    started = time.perf_counter()
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            size = os.fstat(f.fileno()).st_size
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    json_cache.invalidate(filepath)
+    STORAGE_WRITES.inc()
+    STORAGE_WRITE_BYTES.inc(amount=size)
+    STORAGE_WRITE_SECONDS.observe(time.perf_counter() - started)
+
+
+class _JsonStreamReader:
+    """Incremental tokenizer for the top level of a large JSON document."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        more = self.f.read(self.chunk_size)
+        if not more:
+            return False
+        self.buf = self.buf[self.pos:] + more
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError(f'Unexpected end of JSON in {self.f.name}')
+
+    def take(self, expected):
+        found = self.peek()
+        if found not in expected:
+            raise ValueError(f'Expected {expected!r} in {self.f.name}, found {found!r}')
+        self.pos += 1
+        return found
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number ending exactly at the buffer edge may continue in the next chunk.
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(filepath, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        reader = _JsonStreamReader(f, chunk_size)
+        reader.take('[')
+        if reader.peek() == ']':
+            return
+        while True:
+            yield reader.value()
+            if reader.take(',]') == ']':
+                return
+
+
+def iter_json_object(filepath, chunk_size=1 << 16):
+    """Yield (key, value) pairs of a top-level JSON object without loading the whole file."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        reader = _JsonStreamReader(f, chunk_size)
+        reader.take('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.take(':')
+            yield key, reader.value()
+            if reader.take(',}') == '}':
+                return
+
+
+# ============ Cross-process locking ============
+class StorageBusyError(TimeoutError):
+    """A data file lock could not be acquired within the allowed wait."""
+
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(filepath, timeout=STORAGE_LOCK_TIMEOUT):
+    """Hold an exclusive advisory lock on ``filepath + '.lock'``.
+
+    The lock is shared by threads and processes (flock). It waits at most
+    ``timeout`` seconds (0 tries once), then raises StorageBusyError. Not
+    re-entrant.
+    """
+    lock_path = filepath + '.lock'
+    if fcntl is None:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(os.path.abspath(lock_path), threading.Lock())
+        started = time.perf_counter()
+        acquired = lock.acquire(timeout=timeout) if timeout > 0 else lock.acquire(blocking=False)
+        STORAGE_LOCK_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not acquired:
+            raise StorageBusyError(f'Timed out waiting for {lock_path}')
+        try:
+            yield
+        finally:
+            lock.release()
+        return
+
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a') as f:
+        started = time.monotonic()
+        deadline = started + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    STORAGE_LOCK_WAIT_SECONDS.observe(time.monotonic() - started)
+                    raise StorageBusyError(f'Timed out waiting for {lock_path}') from None
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        STORAGE_LOCK_WAIT_SECONDS.observe(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class IdSequence:
+    """Monotonic id counter persisted next to a data file as ``<file>.seq``.
+
+    Callers must hold ``file_lock(filepath)`` while calling ``next``.
+    """
+
+    def __init__(self, filepath):
+        self.seq_path = filepath + '.seq'
+
+    def next(self, floor=0):
+        """Return the next id, never at or below floor (the highest id known to exist)."""
+        try:
+            with open(self.seq_path, 'r') as f:
+                last = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            last = 0
+        next_id = max(last, floor) + 1
+        with open(self.seq_path, 'w') as f:
+            f.write(str(next_id))
+        return next_id
+
+
+def get_json_cache_stats():
+    return json_cache.stats()
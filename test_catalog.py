@@ -0,0 +1,152 @@
+"""Compiled test catalog.
+
+oet_tests.json holds every test with its full ``content`` (passages, audio
+scripts, tasks). Listing pages only need the top-level fields, so the catalog
+compiles the file once per version into the shared snapshot
+``data/.catalog/oet_tests.snap`` (see snapshot.py). Records ``2i`` and
+``2i + 1`` are test i's summary (every field but ``content``) and its
+content (null when it has none).
+
+Each worker keeps only by-id, by-section and by-type indexes of record
+positions; summaries are decoded from the mapped snapshot when a page reads
+them. Content is decoded when a test is opened, and only the most recently
+opened tests are kept (``TEST_CONTENT_CACHE_SIZE``). The catalog switches to
+a new snapshot whenever oet_tests.json changes on disk.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+from storage import iter_json_array, FrozenDict, FrozenList
+from snapshot import SharedSnapshot
+
+logger = logging.getLogger(__name__)
+
+TEST_CONTENT_CACHE_SIZE = int(os.environ.get('TEST_CONTENT_CACHE_SIZE', 32))
+
+
+def test_kind(test):
+    """'mock' for full mock tests, 'practice' for practice tests, otherwise None."""
+    if test.get('is_mock_test', False):
+        return 'mock'
+    if test.get('test_type') == 'practice':
+        return 'practice'
+    return None
+
+
+def compile_tests(source_path):
+    """The snapshot records of a tests file: summary, content, summary, content, ..."""
+    for test in iter_json_array(source_path):
+        yield {k: v for k, v in test.items() if k != 'content'}
+        yield test.get('content')
+
+
+class TestCatalog:
+    def __init__(self, source_path, compiled_dir=None, content_cache_size=TEST_CONTENT_CACHE_SIZE):
+        self.source_path = source_path
+        self.compiled_dir = compiled_dir or os.path.join(os.path.dirname(source_path) or '.', '.catalog')
+        self.name = os.path.splitext(os.path.basename(source_path))[0]
+        self.snapshot = SharedSnapshot(source_path, os.path.join(self.compiled_dir, f'{self.name}.snap'),
+                                       compile_tests)
+        self.content_cache_size = content_cache_size
+
+        self._lock = threading.RLock()
+        self._current = None
+        self._summaries = FrozenList()
+        self._by_id = {}
+        self._by_section = {}
+        self._by_kind = {}
+        self._content_cache = OrderedDict()
+        self.content_loads = 0
+
+    @property
+    def compiles(self):
+        return self.snapshot.builds
+
+    def _refresh(self):
+        snapshot = self.snapshot.current()
+        if snapshot is self._current:
+            return
+        summaries = snapshot.view().take(range(0, len(snapshot), 2))
+        by_id, by_section, by_kind = {}, {}, {'practice': [], 'mock': []}
+        for i, t in enumerate(summaries):
+            by_id[t['id']] = i
+            by_section.setdefault(t.get('section'), []).append(i)
+            kind = test_kind(t)
+            if kind:
+                by_kind[kind].append(i)
+        self._summaries = summaries
+        self._by_id = by_id
+        self._by_section = {k: summaries.take(v) for k, v in by_section.items()}
+        self._by_kind = {k: summaries.take(v) for k, v in by_kind.items()}
+        self._content_cache.clear()
+        self._current = snapshot
+
+    # ---- summaries ----
+    def summaries(self):
+        with self._lock:
+            self._refresh()
+            return self._summaries
+
+    def by_kind(self, kind):
+        with self._lock:
+            self._refresh()
+            return self._by_kind.get(kind, FrozenList())
+
+    def by_section(self, section):
+        with self._lock:
+            self._refresh()
+            return self._by_section.get(section, FrozenList())
+
+    def get_summary(self, test_id):
+        with self._lock:
+            self._refresh()
+            i = self._by_id.get(test_id)
+            return self._summaries[i] if i is not None else None
+
+    def get_summaries(self, test_ids):
+        with self._lock:
+            self._refresh()
+            return {test_id: self._summaries[self._by_id[test_id]] for test_id in test_ids if test_id in self._by_id}
+
+    # ---- full tests ----
+    def _load_content(self, test_id):
+        if test_id in self._content_cache:
+            self._content_cache.move_to_end(test_id)
+            return self._content_cache[test_id]
+        content = self._current[2 * self._by_id[test_id] + 1]
+        self.content_loads += 1
+        self._content_cache[test_id] = content
+        while len(self._content_cache) > self.content_cache_size:
+            self._content_cache.popitem(last=False)
+        return content
+
+    def get(self, test_id):
+        """Return the full test (summary plus content), loading its content on demand."""
+        with self._lock:
+            self._refresh()
+            i = self._by_id.get(test_id)
+            if i is None:
+                return None
+            summary = self._summaries[i]
+            content = self._load_content(test_id)
+            if content is None:
+                return summary
+            return FrozenDict(summary, content=content)
+
+    def version(self):
+        """Identifies the compiled catalog; changes whenever oet_tests.json does."""
+        with self._lock:
+            self._refresh()
+            return '-'.join(f'{part:x}' for part in self._current.source or ())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tests': len(self._summaries),
+                'content_cached': len(self._content_cache),
+                'content_loads': self.content_loads,
+                'compiles': self.compiles,
+            }
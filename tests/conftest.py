@@ -0,0 +1,36 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+# The app's modules live at the repository root, not in a package.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def main_module(tmp_path_factory):
+    """The app module, working in a scratch copy of data/ for the whole session.
+
+    Its stores use paths relative to the working directory and keep state in
+    memory, so every app test shares this one copy rather than one per test.
+    """
+    work_dir = tmp_path_factory.mktemp('app')
+    shutil.copytree(os.path.join(ROOT, 'data'), work_dir / 'data')
+    previous = os.getcwd()
+    os.chdir(work_dir)
+    os.environ.setdefault('PASSWORD_WORKERS', '0')
+    # Absolute, as the metrics flush thread outlives the chdir.
+    os.environ['METRICS_DIR'] = str(work_dir / 'data' / 'metrics')
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(previous)
+
+
+@pytest.fixture
+def app(main_module):
+    return main_module.create_app({'TESTING': True, 'WARM_UP': False, 'WTF_CSRF_ENABLED': False})
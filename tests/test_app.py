@@ -0,0 +1,93 @@
+import os
+import json
+import threading
+
+
+def logged_in(app, name):
+    client = app.test_client()
+    email = f'{name}@example.com'
+    client.post('/register', data={'username': name, 'email': email, 'password': 'password', 'password2': 'password'})
+    response = client.post('/login', data={'email': email, 'password': 'password'})
+    assert response.status_code == 302
+    return client
+
+
+def test_create_app_returns_a_new_app_each_call(main_module):
+    first = main_module.create_app({'TESTING': True, 'WARM_UP': False})
+    second = main_module.create_app({'TESTING': False, 'WARM_UP': False})
+    assert first is not second
+    assert first.config['TESTING'] and not second.config['TESTING']
+    assert 'main.dashboard' in first.view_functions and 'main.dashboard' in second.view_functions
+
+
+def test_routes_and_error_pages(app):
+    client = app.test_client()
+    response = client.get('/dashboard')
+    assert response.status_code == 302
+    assert response.headers['Location'].startswith('/login')
+    assert client.get('/no-such-page').status_code == 404
+
+
+def test_register_and_log_in(app):
+    assert logged_in(app, 'factory').get('/dashboard').status_code == 200
+
+
+# ---- public page caching ----
+def test_public_page_revalidates_with_etag(app):
+    client = app.test_client()
+    first = client.get('/jobs')
+    assert first.status_code == 200
+    assert first.headers['ETag'] and 'public' in first.headers['Cache-Control']
+    again = client.get('/jobs', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+    st = os.stat('data/jobs.json')
+    os.utime('data/jobs.json', ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    changed = client.get('/jobs', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_signed_in_users_bypass_the_public_cache(app):
+    etag = app.test_client().get('/jobs').headers['ETag']
+    response = logged_in(app, 'cachebypass').get('/jobs', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+# ---- chat ----
+def send(client, text):
+    response = client.post('/send_message', data={'message': text}, headers={'Accept': 'application/json'})
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def test_chat_pages_back_through_older_messages(app):
+    client = logged_in(app, 'chatpager')
+    ids = [send(client, f'message {i}') for i in range(5)]
+    newest = client.get('/api/chat/messages?limit=2').get_json()
+    assert [m['id'] for m in newest['messages']] == ids[3:]
+    assert newest['before'] == ids[3]
+    older = client.get(f"/api/chat/messages?limit=2&before={newest['before']}").get_json()
+    assert [m['message'] for m in older['messages']] == ['message 1', 'message 2']
+    oldest = client.get(f"/api/chat/messages?limit=2&before={older['before']}").get_json()
+    assert [m['id'] for m in oldest['messages']] == ids[:1]
+    assert oldest['before'] is None
+
+
+def test_chat_stream_delivers_new_messages(app):
+    client = logged_in(app, 'chatstream')
+    # Another session, signed in before the stream's context is pushed on this thread
+    other = logged_in(app, 'chatstream')
+    first = send(client, 'before the stream')
+    response = client.get(f'/chat/stream?after={first}', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    threading.Timer(0.2, send, (other, 'while streaming')).start()
+    event = next(chunks).decode()
+    response.close()
+    lines = dict(line.split(': ', 1) for line in event.strip().splitlines())
+    assert int(lines['id']) > first
+    assert json.loads(lines['data'])['message'] == 'while streaming'
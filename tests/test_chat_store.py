@@ -0,0 +1,43 @@
+from chat_store import ChatStore
+
+
+def store(tmp_path, legacy=None):
+    return ChatStore(str(tmp_path / 'chat'), legacy)
+
+
+def send(chat, user_id, text, **fields):
+    return chat.append(user_id, dict({'message': text, 'is_admin_reply': False}, **fields))
+
+
+def ids(messages):
+    return [m['id'] for m in messages]
+
+
+def test_ids_are_not_reused_after_replace(tmp_path):
+    chat = store(tmp_path)
+    for i in range(4):
+        send(chat, 7, f'm{i}')
+    chat.replace(7, [m for m in chat.messages(7) if m['id'] in (1, 3)])
+    assert ids(chat.messages(7)) == [1, 3]
+    assert chat.latest_id(7) == 3
+    assert send(chat, 7, 'after')['id'] == 5
+    assert send(store(tmp_path), 7, 'other worker')['id'] == 6
+    assert ids(chat.since(7, 3)) == [5, 6]
+    assert ids(chat.page(7, 2, before=5)) == [1, 3]
+
+
+def test_legacy_conversation_keeps_ascending_ids(tmp_path):
+    legacy = tmp_path / 'chat_messages.json'
+    legacy.write_text('{"7": [{"message": "a"}, {"id": 4, "message": "b"}, {"id": 2, "message": "c"}]}')
+    chat = store(tmp_path, str(legacy))
+    assert ids(chat.messages(7)) == [1, 4, 5]
+    assert send(chat, 7, 'd')['id'] == 6
+
+
+def test_corrupt_line_is_skipped(tmp_path):
+    chat = store(tmp_path)
+    send(chat, 7, 'first')
+    with open(tmp_path / 'chat' / '7.jsonl', 'ab') as f:
+        f.write(b'{not json\n')
+    send(chat, 7, 'second')
+    assert [m['message'] for m in store(tmp_path).messages(7)] == ['first', 'second']
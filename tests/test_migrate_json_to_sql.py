@@ -0,0 +1,68 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+from sqlalchemy import create_engine, select  # noqa: E402
+
+from migrate_json_to_sql import migrate  # noqa: E402
+from sql_repositories import chat_messages_table, vocabulary_progress_table  # noqa: E402
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def write_lines(path, values, torn=b''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        for value in values:
+            f.write(json.dumps(value).encode('utf-8') + b'\n')
+        f.write(torn)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    # User 1 has a log (the old file is stale for them); user 2 only exists in the old file.
+    write_json(data / 'chat_messages.json', {
+        '1': [{'id': 1, 'message': 'old copy', 'timestamp': '2025-01-01T09:00:00'}],
+        '2': [{'id': 1, 'message': 'legacy only', 'timestamp': '2025-01-02T09:00:00'},
+              {'id': 2, 'message': 'reply', 'timestamp': '2025-01-02T09:05:00', 'is_admin_reply': True}],
+    })
+    write_lines(str(data / 'chat' / '1.jsonl'), [
+        {'id': 1, 'message': 'old copy', 'timestamp': '2025-01-01T09:00:00'},
+        {'id': 2, 'message': 'written after the move', 'timestamp': '2025-01-03T09:00:00'},
+    ], torn=b'{"id": 3, "mess')
+    write_json(data / 'vocabulary_progress.json', {'1': {'learned_words': [9]}, '3': {'learned_words': [4, 4, 5]}})
+    write_lines(str(data / 'vocabulary_progress' / '1.jsonl'), [9, 10])
+    return str(data)
+
+
+def rows(engine, table, *columns):
+    with engine.connect() as conn:
+        return [tuple(r) for r in conn.execute(select(*columns).order_by(table.c.user_id, *columns[1:]))]
+
+
+def test_migrate_reads_logs_and_falls_back_to_old_files(data_dir, tmp_path):
+    url = f'sqlite:///{tmp_path / "oet.db"}'
+    counts = migrate(data_dir, url)
+    engine = create_engine(url)
+
+    t = chat_messages_table
+    with engine.connect() as conn:
+        chat = [(r.user_id, r.message, r.is_admin_reply)
+                for r in conn.execute(select(t).order_by(t.c.user_id, t.c.id))]
+    assert chat == [
+        (1, 'old copy', False),
+        (1, 'written after the move', False),
+        (2, 'legacy only', False),
+        (2, 'reply', True),
+    ]
+    assert counts['chat_messages'] == 4
+
+    t = vocabulary_progress_table
+    assert rows(engine, t, t.c.user_id, t.c.position, t.c.word_id) == [(1, 0, 9), (1, 1, 10), (3, 0, 4), (3, 1, 5)]
@@ -0,0 +1,85 @@
+import pytest
+
+from repositories import JsonResultRepository, JsonProgressRepository
+from progress_aggregates import ProgressTracker, add_result, build_aggregates, new_aggregate, average
+
+SECTIONS = {1: 'Reading', 2: 'Listening', 3: 'Writing'}
+
+
+class Tests:
+    def get_summaries(self, test_ids):
+        return {test_id: {'title': f'Test {test_id}', 'section': SECTIONS[test_id]}
+                for test_id in test_ids if test_id in SECTIONS}
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    results = JsonResultRepository(str(tmp_path / 'test_results.json'))
+    return ProgressTracker(JsonProgressRepository(str(tmp_path / 'progress')), results, Tests())
+
+
+def submit(tracker, user_id, test_id, score, completed_at, minutes=20):
+    result = tracker.results.append({'user_id': user_id, 'test_id': test_id, 'score_percentage': score,
+                                     'time_taken_minutes': minutes, 'completed_at': completed_at})
+    tracker.record(result)
+    return result
+
+
+def test_incremental_aggregate_matches_rebuild(tracker):
+    tracker.get(1)  # a stored (empty) aggregate, which record() then extends
+    for i, (test_id, score) in enumerate([(1, 60.0), (2, 85.0), (1, 72.5), (3, 90.0), (2, 40.0)]):
+        submit(tracker, 1, test_id, score, f'2025-01-0{i // 2 + 1} 10:0{i}')
+    submit(tracker, 2, 1, 55.0, '2025-01-01 09:00')
+
+    incremental = tracker.repository.get(1)
+    assert incremental['attempts'] == 5
+    assert tracker.rebuilds == 1
+    assert tracker.get(1) == incremental  # up to date: no rebuild
+    assert tracker.rebuilds == 1
+
+    rebuilt = tracker.rebuild_user(1)
+    assert rebuilt == dict(incremental)
+    assert average(rebuilt) == 69.5
+    assert rebuilt['best_score'] == 90.0
+    assert rebuilt['excellent'] == 2
+    assert rebuilt['sections']['Reading']['attempts'] == 2
+    assert rebuilt['trend'] == [['2025-01-01', 2, 145.0], ['2025-01-02', 2, 162.5], ['2025-01-03', 1, 40.0]]
+    assert [r['score_percentage'] for r in rebuilt['recent']] == [40.0, 90.0, 72.5, 85.0, 60.0]
+
+
+def test_rebuild_all_streams_history(tracker):
+    for user_id in (1, 2, 3):
+        for day in range(1, user_id + 1):
+            submit(tracker, user_id, 1, 50.0 + day, f'2025-02-0{day} 10:00')
+    tracker.results.all = None  # the rebuild must stream, not load the whole history
+    assert tracker.rebuild_all() == 3
+    assert [tracker.repository.get(u)['attempts'] for u in (1, 2, 3)] == [1, 2, 3]
+
+
+def test_ids_out_of_completion_order_are_all_counted(tracker):
+    # Imported data: the newest result has the lowest id.
+    tracker.results.replace_all([
+        {'id': 3, 'user_id': 1, 'test_id': 1, 'score_percentage': 50.0, 'completed_at': '2025-01-01 10:00'},
+        {'id': 2, 'user_id': 1, 'test_id': 2, 'score_percentage': 60.0, 'completed_at': '2025-01-02 10:00'},
+        {'id': 1, 'user_id': 1, 'test_id': 3, 'score_percentage': 70.0, 'completed_at': '2025-01-03 10:00'},
+    ])
+    aggregate = tracker.get(1)
+    assert aggregate['attempts'] == 3
+    assert aggregate['last_result_id'] == 3
+    assert aggregate['last_score'] == 70.0
+    tracker.get(1)
+    assert tracker.rebuilds == 1  # stays in step with the store instead of rebuilding on every view
+
+    submit(tracker, 1, 1, 80.0, '2025-01-04 10:00')
+    assert tracker.get(1)['attempts'] == 4
+    assert tracker.rebuilds == 1
+
+
+def test_add_result_ignores_results_already_counted():
+    aggregate = new_aggregate()
+    result = {'id': 5, 'user_id': 1, 'test_id': 1, 'score_percentage': 75.0, 'completed_at': '2025-01-01'}
+    assert add_result(aggregate, result)
+    assert not add_result(aggregate, result)
+    assert not add_result(aggregate, dict(result, id=4))
+    assert aggregate['attempts'] == 1
+    assert build_aggregates([result, dict(result, id=4)], lambda test_id: None)[1]['attempts'] == 2
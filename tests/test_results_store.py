@@ -0,0 +1,120 @@
+import os
+import json
+
+import pytest
+
+from results_store import ResultJournal, iter_records
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'test_results.json')
+
+
+def journal(path):
+    # Compaction only when a test asks for it.
+    return ResultJournal(path, compact_threshold=10 ** 9, compact_interval=3600)
+
+
+def add(store, user_id, completed_at):
+    return store.append({'user_id': user_id, 'completed_at': completed_at, 'score': 50})
+
+
+def snapshot_ids(path):
+    with open(path, encoding='utf-8') as f:
+        return [record['id'] for record in json.load(f)]
+
+
+def test_append_assigns_increasing_ids(path):
+    store = journal(path)
+    assert [add(store, 1, f'2025-01-0{i}')['id'] for i in range(1, 4)] == [1, 2, 3]
+    assert [r['id'] for r in store.all()] == [1, 2, 3]
+    assert snapshot_ids(path) == []  # still only in the journal
+
+
+def test_compact_folds_journal_into_snapshot(path):
+    store = journal(path)
+    for i in range(5):
+        add(store, i % 2, f'2025-01-0{i + 1}')
+    assert store.compact()
+    assert snapshot_ids(path) == [1, 2, 3, 4, 5]
+    assert not os.path.exists(path + '.journal.compacting')
+    assert not os.path.exists(path + '.journal')
+    assert store.stats()['compactions'] == 1
+    # Nothing new to fold in.
+    assert not store.compact()
+
+
+def test_appends_after_compaction_continue_the_ids(path):
+    store = journal(path)
+    add(store, 1, '2025-01-01')
+    add(store, 1, '2025-01-02')
+    store.compact()
+    assert add(store, 1, '2025-01-03')['id'] == 3
+    assert [r['id'] for r in journal(path).all()] == [1, 2, 3]
+
+
+def test_ids_are_not_reused_after_replace_all(path):
+    store = journal(path)
+    for i in range(1, 4):
+        add(store, 1, f'2025-01-0{i}')
+    store.replace_all([record for record in store.all() if record['id'] == 1])
+    assert add(store, 1, '2025-01-04')['id'] == 4
+    assert add(journal(path), 1, '2025-01-05')['id'] == 5  # another worker shares the counter
+
+
+def test_other_instance_sees_compaction(path):
+    writer, reader = journal(path), journal(path)
+    add(writer, 1, '2025-01-01')
+    assert [r['id'] for r in reader.all()] == [1]
+    writer.compact()
+    add(writer, 2, '2025-01-02')
+    assert [r['id'] for r in reader.all()] == [1, 2]
+    assert [r['id'] for r in reader.for_user(2)] == [2]
+
+
+def test_interrupted_compaction_is_finished(path):
+    store = journal(path)
+    add(store, 1, '2025-01-01')
+    add(store, 1, '2025-01-02')
+    # A compactor that died after sealing the journal, before writing the snapshot.
+    os.replace(path + '.journal', path + '.journal.compacting')
+    store = journal(path)
+    assert [r['id'] for r in store.all()] == [1, 2]
+    assert add(store, 1, '2025-01-03')['id'] == 3
+    assert store.compact()
+    assert snapshot_ids(path) == [1, 2, 3]
+    assert not os.path.exists(path + '.journal.compacting')
+
+
+def test_torn_journal_line_is_skipped(path):
+    store = journal(path)
+    add(store, 1, '2025-01-01')
+    with open(path + '.journal', 'ab') as f:
+        f.write(b'{"id": 2, "user_id"')  # a writer crashed mid-line
+    store = journal(path)
+    assert add(store, 1, '2025-01-02')['id'] == 2
+    assert [r['id'] for r in journal(path).all()] == [1, 2]
+    assert [r['id'] for r in iter_records(path)] == [1, 2]
+
+
+def test_update_many_rewrites_snapshot(path):
+    store = journal(path)
+    add(store, 1, '2025-01-01')
+    add(store, 1, '2025-01-02')
+    assert store.update_many({2: {'score': 90}}) == 1
+    assert store.get(2)['score'] == 90
+    assert not os.path.exists(path + '.journal')
+    assert journal(path).get(2)['score'] == 90
+
+
+def test_records_after(path):
+    store = journal(path)
+    add(store, 1, '2025-01-01')
+    add(store, 1, '2025-01-02')
+    assert [r['id'] for r in store.records_after(0)] == [1, 2]
+    assert [r['id'] for r in store.records_after(1, last_id=1)] == [2]
+    assert store.records_after(2, last_id=2) == []
+    # The store was rewritten under the cursor.
+    assert store.records_after(1, last_id=7) is None
+    assert store.records_after(5, last_id=2) is None
@@ -0,0 +1,100 @@
+import pytest
+
+from repositories import JsonResultRepository
+from score_distributions import ScoreDistribution, ScoreDistributions
+
+
+def result(result_id, user_id, score, test_id=1):
+    return {'id': result_id, 'user_id': user_id, 'test_id': test_id, 'score_percentage': score}
+
+
+SCORES = [(1, 40.0), (2, 55.5), (3, 55.5), (1, 90.0), (4, 100.0), (2, 0.0), (5, 72.3)]
+
+
+def test_histogram_counts_scores_below():
+    distribution = ScoreDistribution()
+    for i, (user_id, score) in enumerate(SCORES, 1):
+        distribution.add(result(i, user_id, score))
+    assert distribution.count == 7
+    assert distribution.below(0.0) == 0
+    assert distribution.below(55.5) == 2
+    assert distribution.below(55.6) == 4
+    assert distribution.below(100.0) == 6
+    assert distribution.below(150.0) == 6  # clamped to the last bucket
+    assert distribution.percentile(72.3) == round(4 / 7 * 100, 1)
+    assert ScoreDistribution().percentile(50.0) is None
+
+
+def test_build_matches_incremental_adds():
+    results = [result(i, user_id, score) for i, (user_id, score) in enumerate(SCORES, 1)]
+    built = ScoreDistribution.build(results)
+    added = ScoreDistribution()
+    for r in results:
+        added.add(r)
+    assert [built.below(s / 10) for s in range(0, 1002, 7)] == [added.below(s / 10) for s in range(0, 1002, 7)]
+    assert built.top(10) == added.top(10)
+
+
+def test_leaderboard_ranks_personal_bests():
+    distribution = ScoreDistribution()
+    for i, (user_id, score) in enumerate(SCORES, 1):
+        distribution.add(result(i, user_id, score))
+    top = distribution.top(10)
+    assert [(e['user_id'], e['score_percentage']) for e in top] == [(4, 100.0), (1, 90.0), (5, 72.3), (2, 55.5),
+                                                                    (3, 55.5)]
+    # Ties keep the earlier result first.
+    assert [e['result_id'] for e in top[3:]] == [2, 3]
+    assert len(distribution.top(2)) == 2
+
+
+@pytest.fixture
+def results(tmp_path):
+    return JsonResultRepository(str(tmp_path / 'test_results.json'))
+
+
+def append(results, user_id, score, test_id=1):
+    return results.append({'user_id': user_id, 'test_id': test_id, 'score_percentage': score,
+                           'completed_at': '2025-01-01 10:00'})
+
+
+def test_distributions_follow_the_store_incrementally(results):
+    distributions = ScoreDistributions(results)
+    append(results, 1, 50.0)
+    assert distributions.percentile(1, 60.0) == (100.0, 1)
+    for user_id, score in [(2, 70.0), (3, 30.0)]:
+        append(results, user_id, score)
+        distributions.refresh()
+    append(results, 4, 80.0, test_id=2)
+    assert distributions.percentile(1, 60.0) == (66.7, 3)
+    assert distributions.attempts(2) == 1
+    assert [e['user_id'] for e in distributions.leaderboard(1)] == [2, 1, 3]
+    results.store.compact()
+    append(results, 5, 90.0)
+    assert distributions.attempts(1) == 4
+    assert distributions.rebuilds == 1
+
+
+def test_rescored_results_trigger_a_rebuild(results):
+    distributions = ScoreDistributions(results)
+    first = append(results, 1, 50.0)
+    append(results, 2, 70.0)
+    assert distributions.percentile(1, 60.0) == (50.0, 2)
+    results.update_many({first['id']: {'score_percentage': 95.0}})
+    assert distributions.percentile(1, 60.0) == (0.0, 2)
+    assert distributions.leaderboard(1)[0] == {'user_id': 1, 'result_id': first['id'], 'score_percentage': 95.0}
+    assert distributions.rebuilds == 2
+
+
+def test_sql_since_follows_ids_and_rewrites(tmp_path):
+    pytest.importorskip('sqlalchemy')
+    from sql_repositories import SqlResultRepository, create_sql_engine, test_results_table
+
+    repository = SqlResultRepository(create_sql_engine(f'sqlite:///{tmp_path / "oet.db"}'), test_results_table)
+    first = repository.append({'user_id': 1, 'test_id': 1, 'score_percentage': 50.0, 'answers': {'q': 'a'}})
+    records, cursor = repository.since(None)
+    assert [dict(r) for r in records] == [{'id': first['id'], 'user_id': 1, 'test_id': 1, 'score_percentage': 50.0}]
+    second = repository.append({'user_id': 2, 'test_id': 1, 'score_percentage': 60.0})
+    records, cursor = repository.since(cursor)
+    assert [r['id'] for r in records] == [second['id']]
+    repository.update_many({first['id']: {'score_percentage': 10.0}})
+    assert repository.since(cursor) == (None, None)
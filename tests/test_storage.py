@@ -0,0 +1,102 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+from storage import IdSequence, StorageBusyError, file_lock
+
+
+def hold_lock(path, locked, release):
+    with file_lock(path):
+        locked.set()
+        release.wait(30)
+
+
+# ---- IdSequence ----
+def test_id_sequence_counts_up_from_one(tmp_path):
+    sequence = IdSequence(str(tmp_path / 'users.json'))
+    assert [sequence.next() for _ in range(3)] == [1, 2, 3]
+
+
+def test_id_sequence_persists_across_instances(tmp_path):
+    path = str(tmp_path / 'users.json')
+    IdSequence(path).next()
+    IdSequence(path).next()
+    assert IdSequence(path).next() == 3
+    assert (tmp_path / 'users.json.seq').read_text() == '3'
+
+
+def test_id_sequence_skips_past_floor(tmp_path):
+    sequence = IdSequence(str(tmp_path / 'users.json'))
+    assert sequence.next(floor=10) == 11
+    # A lower floor never moves the counter back.
+    assert sequence.next(floor=5) == 12
+
+
+def test_id_sequence_recovers_from_unreadable_counter(tmp_path):
+    (tmp_path / 'users.json.seq').write_text('garbage')
+    assert IdSequence(str(tmp_path / 'users.json')).next(floor=4) == 5
+
+
+# ---- file_lock ----
+def test_file_lock_creates_lock_file(tmp_path):
+    path = str(tmp_path / 'sub' / 'data.json')
+    with file_lock(path):
+        assert os.path.exists(path + '.lock')
+
+
+def test_file_lock_excludes_threads(tmp_path):
+    path = str(tmp_path / 'data.json')
+    inside = []
+    overlaps = []
+
+    def work():
+        for _ in range(20):
+            with file_lock(path):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.0005)
+                inside.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlaps
+
+
+def test_file_lock_times_out_while_another_process_holds_it(tmp_path):
+    path = str(tmp_path / 'data.json')
+    ctx = multiprocessing.get_context('spawn')
+    locked, release = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=hold_lock, args=(path, locked, release))
+    holder.start()
+    try:
+        assert locked.wait(30)
+        with pytest.raises(StorageBusyError):
+            with file_lock(path, timeout=0):
+                pass
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            with file_lock(path, timeout=0.2):
+                pass
+        assert time.monotonic() - started >= 0.2
+    finally:
+        release.set()
+        holder.join(30)
+    # Released when the holder leaves the block.
+    with file_lock(path, timeout=5):
+        pass
+
+
+def test_file_lock_released_on_error(tmp_path):
+    path = str(tmp_path / 'data.json')
+    with pytest.raises(ValueError):
+        with file_lock(path):
+            raise ValueError('boom')
+    with file_lock(path, timeout=0):
+        pass
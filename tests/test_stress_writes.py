@@ -0,0 +1,14 @@
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_concurrent_writers_lose_nothing():
+    """benchmarks/stress_writes.py at a small scale: separate processes submitting and chatting at once."""
+    result = subprocess.run([sys.executable, os.path.join('benchmarks', 'stress_writes.py'),
+                             '--processes', '3', '--iterations', '8'],
+                            cwd=ROOT, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'OK: no lost or duplicated records' in result.stdout
@@ -0,0 +1,112 @@
+"""In-memory indexes over users.json.
+
+The directory keeps the user records together with an id index and a
+case-normalised email index. It is rebuilt only when users.json changes on
+disk (mtime, size or inode), and ``add`` updates it in place after a
+registration, so looking up the logged-in user on every request costs one
+``os.stat`` and a dict lookup however many users exist.
+"""
+
+import os
+import threading
+
+from storage import read_json_file, save_json_file, file_lock, freeze, FrozenList, IdSequence
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class UserDirectory:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._records = FrozenList()
+        self._by_id = {}
+        self._by_email = {}
+        self._max_id = 0
+        self._ids = IdSequence(path)
+        self.rebuilds = 0
+
+    def _index(self, record):
+        self._by_id[record['id']] = record
+        # Keep the first account registered under an address if duplicates exist.
+        self._by_email.setdefault(normalize_email(record.get('email')), record)
+        if record['id'] > self._max_id:
+            self._max_id = record['id']
+
+    def _refresh(self):
+        signature = _signature(self.path)
+        if signature is not None and signature == self._signature:
+            return
+        records = read_json_file(self.path, [])
+        self._by_id = {}
+        self._by_email = {}
+        self._max_id = 0
+        for record in records:
+            self._index(record)
+        self._records = records
+        self._signature = _signature(self.path)
+        self.rebuilds += 1
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return self._records
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(user_id)
+
+    def get_by_email(self, email):
+        with self._lock:
+            self._refresh()
+            return self._by_email.get(normalize_email(email))
+
+    def add(self, user_data):
+        """Assign the next id, persist the new user and index it without a rebuild."""
+        with self._lock, file_lock(self.path):
+            self._refresh()
+            record = {'id': self._ids.next(floor=self._max_id)}
+            record.update(user_data)
+            record = freeze(record)
+            records = FrozenList(list(self._records) + [record])
+            save_json_file(self.path, records)
+            self._records = records
+            self._index(record)
+            self._signature = _signature(self.path)
+            return record
+
+    def update(self, user_id, changes):
+        """Persist changes to one user's record; returns the new record, or None if there is no such user."""
+        with self._lock, file_lock(self.path):
+            self._signature = None  # re-read under the lock, in case another worker wrote
+            self._refresh()
+            current = self._by_id.get(user_id)
+            if current is None:
+                return None
+            record = freeze(dict(current, **changes))
+            records = FrozenList(record if r['id'] == user_id else r for r in self._records)
+            save_json_file(self.path, records)
+            self._records = records
+            self._by_id[user_id] = record
+            email = normalize_email(record.get('email'))
+            if self._by_email.get(email) is current:
+                self._by_email[email] = record
+            self._signature = _signature(self.path)
+            return record
+
+    def replace_all(self, users):
+        with self._lock, file_lock(self.path):
+            save_json_file(self.path, list(users))
+            self._signature = None
@@ -0,0 +1,250 @@
+"""In-memory lookup structures over vocabulary.json.
+
+The entries themselves live in the shared snapshot
+``data/.catalog/vocabulary.snap`` (see snapshot.py) and are decoded when a
+lookup returns them; the index holds their positions. It is built once per
+snapshot and swapped in whole, so readers never see a half-built index:
+
+- ``exact``: case-folded word -> entry position, for the vocabulary test,
+  and ``by_id`` for looking entries up by id;
+- a trie of case-folded words for prefix autocomplete; every node keeps its
+  first ``AUTOCOMPLETE_LIMIT`` completions in alphabetical order, so a lookup
+  is one walk down the prefix;
+- a trigram index for "did you mean" suggestions: the words sharing enough
+  trigrams with a misspelling are the only ones whose Levenshtein distance
+  is computed;
+- per-specialty views of the entries with the specialty facets (name,
+  count), so a page of the /vocabulary listing is a slice.
+"""
+
+import os
+import bisect
+import threading
+from array import array
+
+from storage import iter_json_array, FrozenList
+from snapshot import SharedSnapshot
+
+AUTOCOMPLETE_LIMIT = 10
+SUGGESTION_LIMIT = 5
+PAGE_SIZE = int(os.environ.get('VOCABULARY_PAGE_SIZE', 60))
+
+
+def fold(word):
+    return ' '.join((word or '').split()).casefold()
+
+
+def edit_distance(a, b):
+    """Levenshtein distance, using the bit-parallel algorithm of Myers/Hyyrö.
+
+    Each character of the longer string costs a handful of integer
+    operations on bit vectors as wide as the shorter string.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if not m:
+        return len(a)
+    peq = {}
+    for i, ch in enumerate(b):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for ch in a:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
+
+def max_edits(term):
+    """Typos tolerated for a term of this length."""
+    return 1 if len(term) <= 5 else 2
+
+
+def _trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrigramIndex:
+    """Candidate filter for bounded edit distance.
+
+    One edit changes at most three of a word's padded trigrams, so any word
+    within ``limit`` edits of a term shares at least
+    ``len(trigrams(term)) - 3 * limit`` trigrams with it. Only words that pass
+    this count (and the length difference) get the exact distance check.
+    """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.postings = {}
+        for i, key in enumerate(keys):
+            for gram in _trigrams(key):
+                self.postings.setdefault(gram, []).append(i)
+
+    def search(self, term, limit):
+        """(distance, key) pairs within limit edits of term."""
+        grams = _trigrams(term)
+        needed = max(1, len(grams) - 3 * limit)
+        counts = {}
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                counts[i] = counts.get(i, 0) + 1
+        found = []
+        for i, shared in counts.items():
+            if shared < needed:
+                continue
+            key = self.keys[i]
+            if abs(len(key) - len(term)) > limit:
+                continue
+            d = edit_distance(term, key)
+            if d <= limit:
+                found.append((d, key))
+        return found
+
+
+class _Index:
+    def __init__(self, words):
+        self.words = words
+        self.exact = {}
+        self.by_id = {}
+        self.trie = {}
+        by_specialty = {}
+        names = {}
+        for i, entry in enumerate(words):
+            if 'id' in entry:
+                self.by_id[entry['id']] = i
+            key = fold(entry.get('word'))
+            if key and key not in self.exact:
+                self.exact[key] = i
+            specialty = entry.get('specialty')
+            if specialty:
+                by_specialty.setdefault(specialty.lower(), array('L')).append(i)
+                names.setdefault(specialty.lower(), specialty)
+        keys = sorted(self.exact)
+        for key in keys:
+            self._insert(key)
+        self.fuzzy = _TrigramIndex(keys)
+
+        # Per-specialty entry positions in file order (ascending, so an id's
+        # place in a list is a bisect), views over them and the facets.
+        self.positions = {None: range(len(words))}
+        self.positions.update(by_specialty)
+        self.by_specialty = {k: words.take(v) for k, v in self.positions.items()}
+        self.facets = tuple(sorted((names[k], len(by_specialty[k])) for k in names))
+
+    def _insert(self, key):
+        # Keys arrive sorted, so each node's completions fill in alphabetical order.
+        node = self.trie
+        for ch in key:
+            node = node.setdefault(ch, {})
+            completions = node.setdefault('', [])
+            if len(completions) < AUTOCOMPLETE_LIMIT:
+                completions.append(key)
+
+    def entry(self, key):
+        return self.words[self.exact[key]]
+
+
+class VocabularyIndex:
+    def __init__(self, path, compiled_dir=None):
+        self.path = path
+        compiled_dir = compiled_dir or os.path.join(os.path.dirname(path) or '.', '.catalog')
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.snapshot = SharedSnapshot(path, os.path.join(compiled_dir, f'{name}.snap'), iter_json_array)
+        self._lock = threading.Lock()
+        self._built_from = None
+        self._index = None
+        self.rebuilds = 0
+
+    def _current(self):
+        snapshot = self.snapshot.current()
+        if snapshot is self._built_from:
+            return self._index
+        with self._lock:
+            snapshot = self.snapshot.current()
+            if snapshot is not self._built_from:
+                self._index = _Index(snapshot.view())
+                self._built_from = snapshot
+                self.rebuilds += 1
+            return self._index
+
+    def all(self):
+        return self._current().words
+
+    def words(self, specialty=None):
+        """Every entry, or the entries of one specialty (case-insensitive)."""
+        return self._current().by_specialty.get(specialty.lower() if specialty else None, FrozenList())
+
+    def get(self, word_id):
+        index = self._current()
+        i = index.by_id.get(word_id)
+        return index.words[i] if i is not None else None
+
+    def facets(self):
+        """(specialty, word count) pairs sorted by specialty."""
+        return self._current().facets
+
+    def count(self, specialty=None):
+        index = self._current()
+        return len(index.positions.get(specialty.lower() if specialty else None, ()))
+
+    def page(self, specialty=None, after=None, limit=PAGE_SIZE):
+        """One page of entries (all, or one specialty) in file order.
+
+        ``after`` is the id of the last entry already shown. Returns
+        (entries, id to pass as ``after`` for the next page or None).
+        """
+        index = self._current()
+        key = specialty.lower() if specialty else None
+        entries = index.by_specialty.get(key, FrozenList())
+        start = 0
+        if after is not None:
+            positions = index.positions.get(key, ())
+            i = index.by_id.get(after)
+            position = bisect.bisect_left(positions, i) if i is not None else len(positions)
+            if position == len(positions) or positions[position] != i:
+                return FrozenList(), None
+            start = position + 1
+        page = entries[start:start + limit]
+        next_after = page[-1].get('id') if start + limit < len(entries) else None
+        return page, next_after
+
+    def lookup(self, word):
+        """The entry whose word matches case-insensitively, or None."""
+        index = self._current()
+        key = fold(word)
+        return index.entry(key) if key in index.exact else None
+
+    def autocomplete(self, prefix, limit=AUTOCOMPLETE_LIMIT):
+        """Up to limit entries whose word starts with prefix, alphabetically."""
+        index = self._current()
+        node = index.trie
+        for ch in fold(prefix):
+            node = node.get(ch)
+            if node is None:
+                return []
+        if node is index.trie:
+            return []
+        return [index.entry(key) for key in node.get('', [])[:limit]]
+
+    def suggest(self, word, limit=SUGGESTION_LIMIT):
+        """Entries within a few edits of word, closest first."""
+        index = self._current()
+        term = fold(word)
+        if not term:
+            return []
+        matches = sorted(index.fuzzy.search(term, max_edits(term)))
+        return [index.entry(key) for _, key in matches[:limit]]